@@ -0,0 +1,94 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Geometry of the competition arena.
+#
+# Coordinates are in meters with corner 0 at the origin, x running along the
+# wall holding markers 0-6 and y along the wall holding markers 27-21. Headings
+# are in degrees and increase clockwise seen from above, the same way a
+# marker's rot_y and MovementSystem#right do: 0 points along +x, 90 along +y.
+# With y pointing "down" the usual atan2/cos/sin formulas apply unchanged.
+#
+# Corner k holds the wall markers listed in CORNER_MARKERS[k], the same
+# grouping PlayGame uses.
+
+import math
+
+SIZE = 8.0
+
+MARKERS_PER_WALL = 7
+
+WALL_MARKER_SIZE = 0.25
+
+# Side length of the square scoring zone in each corner
+ZONE_SIZE = 1.5
+
+CORNERS = [(0.0, 0.0), (SIZE, 0.0), (SIZE, SIZE), (0.0, SIZE)]
+
+CORNER_MARKERS = [
+    range(0, 4) + range(24, 28),
+    range(3, 11),
+    range(11, 18),
+    range(18, 25)
+]
+
+# Central barrier, as (x_min, y_min, x_max, y_max) rectangles
+BARRIERS = [(3.5, 3.5, 4.5, 4.5)]
+
+# Marker codes given to the robot in each zone and to each zone's flag
+ROBOT_CODES = [28, 29, 30, 31]
+FLAG_CODES = [32, 33, 34, 35]
+
+FLAG_SIZE = 0.25
+
+def _wall_markers():
+    markers = {}
+    for i in range(MARKERS_PER_WALL):
+        offset = float(i + 1)
+        markers[i] = (offset, 0.0, 90.0)
+        markers[7 + i] = (SIZE, offset, 180.0)
+        markers[14 + i] = (SIZE - offset, SIZE, 270.0)
+        markers[21 + i] = (0.0, SIZE - offset, 0.0)
+    return markers
+
+# code: (x, y, heading the marker faces)
+WALL_MARKERS = _wall_markers()
+
+def normalize(degree):
+    """Wraps an angle in degrees into the range (-180, 180]."""
+    degree = math.fmod(degree, 360.0)
+    if degree > 180:
+        degree -= 360
+    elif degree <= -180:
+        degree += 360
+    return degree
+
+def bearing(x1, y1, x2, y2):
+    """The heading in degrees of the line from (x1, y1) to (x2, y2)."""
+    return math.degrees(math.atan2(y2 - y1, x2 - x1))
+
+def zone_center(zone):
+    cx, cy = CORNERS[zone]
+    half = ZONE_SIZE / 2
+    return (cx + half if cx == 0 else cx - half,
+            cy + half if cy == 0 else cy - half)
+
+def in_zone(zone, x, y):
+    cx, cy = CORNERS[zone]
+    return abs(x - cx) <= ZONE_SIZE and abs(y - cy) <= ZONE_SIZE
+
+def start_pose(zone):
+    """The (x, y, heading) a robot starts a match at in the given zone,
+    in the corner of its zone and facing the middle of the arena."""
+    cx, cy = CORNERS[zone]
+    x = cx + 0.5 if cx == 0 else cx - 0.5
+    y = cy + 0.5 if cy == 0 else cy - 0.5
+    return x, y, bearing(x, y, SIZE / 2, SIZE / 2)
+
+def flag_start(zone):
+    """Where the flag of the given zone starts, ahead of its robot."""
+    x, y, heading = start_pose(zone)
+    return (x + 2.3 * math.cos(math.radians(heading)),
+            y + 2.3 * math.sin(math.radians(heading)))
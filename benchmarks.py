@@ -0,0 +1,350 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Micro-benchmarks of the code run on every frame or sensor poll, plus whole
+# scenarios played against the simulated arena on the virtual clock.
+#     python benchmarks.py [--output results.json] [--compare old.json]
+# Results are written as JSON so two commits can be compared with --compare.
+
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import timeit
+
+# The controllers import sr.robot, use the stand-in when the kit isn't here
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'sim'))
+
+import arena
+from controllers.motor import MotorController
+from controllers.ruggeduino import RuggeduinoController
+from controllers.vision import MarkerHelper
+from event_bus import EventBus
+from state_utils import StateMachine
+from systems.vision import MarkerCollection
+
+# Changes smaller than this fraction are reported as noise by --compare
+NOISE = 0.1
+
+class FakeInfo(object):
+    def __init__(self, code, marker_type, size):
+        self.code = code
+        self.marker_type = marker_type
+        self.size = size
+
+class FakeOrientation(object):
+    def __init__(self, rot_y):
+        self.rot_y = rot_y
+
+class FakeMarker(object):
+    def __init__(self, code, marker_type, dist, rot_y, orient_rot_y):
+        self.info = FakeInfo(code, marker_type, 0.25)
+        self.dist = dist
+        self.rot_y = rot_y
+        self.orientation = FakeOrientation(orient_rot_y)
+
+class FakeChannel(object):
+    power = 0
+
+class FakeMotorBoard(object):
+    def __init__(self):
+        self.m0 = FakeChannel()
+        self.m1 = FakeChannel()
+
+class FakeRuggeduino(object):
+    """Answers digital reads after a delay like a serial round trip."""
+
+    def __init__(self, latency=0.0005):
+        self.latency = latency
+
+    def _is_srduino(self):
+        return True
+
+    def pin_mode(self, pin, mode):
+        pass
+
+    def digital_read(self, pin):
+        time.sleep(self.latency)
+        return True
+
+class FakeRobot(object):
+    def __init__(self):
+        from controllers.motor import MOTOR_MAP
+        from controllers.ruggeduino import PIN_MAP
+        self.motors = dict((info['sr_serial'], FakeMotorBoard())
+                           for info in MOTOR_MAP.values())
+        self.ruggeduinos = dict((serial, FakeRuggeduino())
+                                for serial, ids in PIN_MAP.values())
+
+def make_markers(count, seed=0):
+    rand = random.Random(seed)
+    markers = []
+    for i in range(count):
+        marker_type = rand.choice(['arena', 'arena', 'flag', 'robot'])
+        code = rand.randint(0, 27) if marker_type == 'arena' else \
+               rand.randint(28, 60)
+        markers.append(FakeMarker(code, marker_type, rand.uniform(0.3, 6),
+                                  rand.uniform(-30, 30), rand.uniform(-60, 60)))
+    return markers
+
+def _time(func, number):
+    # Best of three runs, in microseconds per call
+    return min(timeit.repeat(func, repeat=3, number=number)) / number * 1e6
+
+def bench_marker_collection(sizes=(1, 10, 60), number=2000):
+    """Compares chained filter calls against the queries of
+    MarkerCollection for the queries the strategy code makes on every
+    frame. Each call gets a new collection, as each frame does, so nothing
+    cached by an earlier call is reused. frame is every query made of
+    one frame: the obstacle check, the flags and the walls of a corner."""
+    walls = range(0, 4) + range(24, 28)
+    results = []
+    for size in sizes:
+        markers = make_markers(size)
+        for name in ('filter', 'query'):
+            if name == 'query':
+                flags = lambda c: c.of_type('flag')
+                corner = lambda c: c.of_type('arena').with_codes(walls)
+                close = lambda c: c.within(0.4)
+            else:
+                flags = lambda c: c.filter(
+                    lambda m: m.info.marker_type == 'flag')
+                corner = lambda c: c.filter(
+                    lambda m: m.info.marker_type == 'arena').filter(
+                    lambda m: m.info.code in walls)
+                close = lambda c: c.filter(lambda m: m.dist < 0.4)
+            def frame():
+                coll = new()
+                close(coll).filter(
+                    lambda m: m.info.marker_type in ['robot', 'arena'])
+                flags(coll).get_closest()
+                corner(coll).get_closest()
+            new = lambda: MarkerCollection(markers)
+            results.append({
+                'impl': name,
+                'markers': size,
+                'build': _time(new, number),
+                'get_closest': _time(lambda: new().get_closest(), number),
+                'get_closest_rotation': _time(
+                    lambda: new().get_closest_rotation(180), number),
+                'filter_flags': _time(lambda: flags(new()), number),
+                'filter_corner_walls': _time(lambda: corner(new()), number),
+                'frame': _time(frame, number)
+            })
+    return results
+
+def bench_event_bus(handler_counts=(1, 10, 50), posts=20000):
+    """Measures EventBus.post throughput with the given number of handlers,
+    alone and while another thread keeps registering and unregistering."""
+    results = []
+    for count in handler_counts:
+        for churn in (False, True):
+            bus = EventBus()
+            for i in range(count):
+                bus.register('bench', lambda p: None)
+            stop = []
+            def churner():
+                extra = lambda p: None
+                while not stop:
+                    bus.register('bench', extra)
+                    bus.unregister('bench', extra)
+            thread = threading.Thread(target=churner)
+            if churn:
+                thread.start()
+            start = time.time()
+            for i in xrange(posts):
+                bus.post('bench', i)
+            elapsed = time.time() - start
+            stop.append(True)
+            if churn:
+                thread.join()
+            results.append({
+                'handlers': count,
+                'churn': churn,
+                'posts_per_sec': posts / elapsed
+            })
+    return results
+
+def bench_state_machine(state_counts=(2, 10), number=20000):
+    """Measures a State.action call plus the StateObserver transition
+    into the next state, with one listener per state. checked is the same
+    with every transition validated against a TransitionTable, it shows
+    what the check costs and isn't meant to be faster."""
+    results = []
+    for count in state_counts:
+        names = ['S%d' % i for i in range(count)]
+        sm = StateMachine(dict((name, lambda: None) for name in names))
+        sm.bus.register('change', lambda p: None)
+        sm.bus.register('finish', lambda p: None)
+        states = [sm.get_register().get_state(name) for name in names]
+        position = [0]
+        def transition():
+            i = position[0] = (position[0] + 1) % count
+            sm.set_state(names[i])
+            states[i].action(sm)
+        row = {
+            'states': count,
+            'transition': _time(transition, number)
+        }
+        sm.compile(dict((name, [names[(i + 1) % count]])
+                        for i, name in enumerate(names)), initial=names[0])
+        ids = [state.id for state in states]
+        def checked():
+            i = position[0] = (position[0] + 1) % count
+            sm.set_state(ids[i])
+            states[i].action(sm)
+        row['checked'] = _time(checked, number)
+        results.append(row)
+    return results
+
+def bench_controllers(number=20000):
+    """Times the arithmetic helpers used when planning each move and the
+    ruggeduino reads the sensor thread makes."""
+    robot = FakeRobot()
+    motor = MotorController(robot, 'WHEEL', 'LEFT')
+    helpers = [MarkerHelper(m) for m in make_markers(60)]
+    results = [{
+        'name': 'MotorController.calc_wait_time',
+        'time': _time(lambda: motor.calc_wait_time(1.5, 60), number)
+    }, {
+        'name': 'MarkerHelper.horizontal_dist',
+        'time': _time(lambda: [h.horizontal_dist for h in helpers],
+                      number / 60) / 60
+    }]
+    bump = RuggeduinoController(robot, 'BUMP', 'FL')
+    results.append({
+        'name': 'RuggeduinoController.read',
+        'time': _time(bump.read, number / 20)
+    })
+    return results
+
+def _carrying_other_flag(zone):
+    own = arena.FLAG_CODES[zone]
+    return lambda world: any(f.carried and f.code != own
+                             for f in world.flags)
+
+def bench_scenarios(zones=range(4), timeout=180):
+    """Plays each corner on the virtual clock until the robot is carrying the
+    flag of another zone, recording how much match time and real time that
+    took. Its own flag, picked up at the start, doesn't count."""
+    import simulate
+    results = []
+    # The robot logs every move and the MatchOver its threads end with
+    logging.disable(logging.CRITICAL)
+    try:
+        for zone in zones:
+            start = time.time()
+            summary = simulate.run_match(zone, timeout,
+                                         until=_carrying_other_flag(zone))
+            results.append({
+                'name': 'steal flag from corner %d' % zone,
+                'found': summary['match_time'] < timeout,
+                'match_time': summary['match_time'],
+                'wall_time': time.time() - start,
+                'odometer': summary['odometer'],
+                'max_push': summary['max_push']
+            })
+    finally:
+        logging.disable(logging.NOTSET)
+    return results
+
+def run_all(scenarios=True):
+    results = {
+        'marker_collection': bench_marker_collection(),
+        'event_bus': bench_event_bus(),
+        'state_machine': bench_state_machine(),
+        'controllers': bench_controllers()
+    }
+    if scenarios:
+        results['scenarios'] = bench_scenarios()
+    return results
+
+def _revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def write_results(results, path):
+    with open(path, 'w') as f:
+        json.dump({
+            'revision': _revision(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'results': results
+        }, f, indent=2, sort_keys=True)
+
+def _rows(results):
+    # Keys each row by its suite and non-numeric fields so the same row can
+    # be found in another run
+    for suite, rows in results.items():
+        for row in rows:
+            ident = tuple(sorted((k, v) for k, v in row.items()
+                                 if not isinstance(v, float)))
+            for key, value in row.items():
+                if isinstance(value, float):
+                    yield (suite, ident, key), value
+
+def compare(old, new):
+    """Prints every measurement that moved by more than NOISE between two
+    result sets. Timings are per call, rates per second, so what counts as
+    a regression depends on the measurement."""
+    old = dict(_rows(old))
+    for key, value in sorted(_rows(new)):
+        if key not in old or not old[key]:
+            continue
+        change = (value - old[key]) / old[key]
+        if abs(change) > NOISE:
+            suite, ident, name = key
+            print "%-18s %-50s %-22s %+6.0f%%" % (
+                suite, ", ".join("%s=%s" % kv for kv in ident), name,
+                change * 100)
+
+def print_results(results):
+    keys = [k for k in sorted(results[0].keys())
+            if k not in ('impl', 'markers')]
+    print "%-9s %7s " % ('impl', 'markers') + \
+          " ".join("%21s" % k for k in keys)
+    for row in results:
+        print "%-9s %7d " % (row['impl'], row['markers']) + \
+              " ".join("%19.2fus" % row[k] for k in keys)
+
+def _option(name):
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return None
+
+if __name__ == '__main__':
+    output, baseline = _option('--output'), _option('--compare')
+    results = run_all()
+    print_results(results['marker_collection'])
+    for row in results['event_bus']:
+        print "EventBus.post %2d handlers%s: %9.0f posts/s" % (
+            row['handlers'], " with churn" if row['churn'] else "",
+            row['posts_per_sec'])
+    for row in results['state_machine']:
+        print "State transition, %2d states: %6.2fus, checked %6.2fus" % (
+            row['states'], row['transition'], row['checked'])
+    for row in results['controllers']:
+        print "%-40s %8.2fus" % (row['name'], row['time'])
+    for row in results['scenarios']:
+        print "%-25s %s after %5.1fs of match (%.1fs real), %.1fm driven, " \
+              "pushed %.2fs at most" % (
+                  row['name'], "found" if row['found'] else "not found",
+                  row['match_time'], row['wall_time'], row['odometer'],
+                  row['max_push'])
+    if output:
+        write_results(results, output)
+    if baseline:
+        with open(baseline) as f:
+            compare(json.load(f)['results'], results)
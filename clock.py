@@ -0,0 +1,241 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+import ctypes
+import ctypes.util
+import os
+import threading
+import time
+
+# How long before a deadline to stop sleeping and start yielding, to absorb
+# the scheduler's wake-up jitter.
+SPIN_MARGIN = 0.002
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+def _load_monotonic():
+    CLOCK_MONOTONIC = 1
+    try:
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1',
+                            use_errno=True)
+        clock_gettime = librt.clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+    def monotonic():
+        t = _timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return t.tv_sec + t.tv_nsec * 1e-9
+    return monotonic
+
+monotonic = _load_monotonic()
+monotonic.__doc__ = """Seconds from an arbitrary point that never goes
+backwards, falls back to time.time where CLOCK_MONOTONIC isn't available."""
+
+class Clock(object):
+    """Where every subsystem gets the time from and how it waits.
+    Clock.GLOBAL is a RealClock on the robot, the simulator swaps in a
+    VirtualClock so matches run faster than real time. Anything that blocks
+    a thread must do it through the clock (sleep, wait or queue_get) so the
+    virtual clock knows the thread is waiting."""
+
+    GLOBAL = None
+
+    def time(self):
+        """Seconds since the epoch, like time.time."""
+        raise NotImplementedError()
+
+    def monotonic(self):
+        """Seconds from an arbitrary point that never goes backwards."""
+        raise NotImplementedError()
+
+    def sleep(self, seconds):
+        self.sleep_until(self.monotonic() + seconds)
+
+    def sleep_until(self, deadline):
+        """Sleeps until monotonic() reaches deadline, returns the time it
+        actually woke."""
+        raise NotImplementedError()
+
+    def wait(self, condition, predicate, timeout=None):
+        """Waits until predicate() is true or timeout seconds pass. Must be
+        called holding condition, which is notified by whoever makes the
+        predicate true. Returns the last value of predicate()."""
+        raise NotImplementedError()
+
+    def queue_get(self, queue):
+        """Blocks until an item can be taken from the Queue.Queue."""
+        raise NotImplementedError()
+
+    def register(self, thread):
+        """Tells the clock about a thread before it starts, so it counts as
+        running from the start."""
+        pass
+
+class RealClock(Clock):
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def sleep_until(self, deadline):
+        """Sleeps most of the way and yields for the last SPIN_MARGIN seconds
+        so the deadline isn't overshot by a late wake-up."""
+        while True:
+            now = monotonic()
+            remaining = deadline - now
+            if remaining <= 0:
+                return now
+            if remaining > SPIN_MARGIN:
+                time.sleep(remaining - SPIN_MARGIN)
+            else:
+                time.sleep(0)
+
+    def wait(self, condition, predicate, timeout=None):
+        result = predicate()
+        if timeout is None:
+            while not result:
+                condition.wait()
+                result = predicate()
+            return result
+        deadline = monotonic() + timeout
+        while not result:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            condition.wait(remaining)
+            result = predicate()
+        return result
+
+    def queue_get(self, queue):
+        return queue.get()
+
+class _Waiting(object):
+    def __init__(self, deadline, predicate):
+        self.deadline = deadline
+        self.predicate = predicate
+
+class VirtualClock(Clock):
+    """A discrete-event clock. Time stands still while any thread using the
+    clock is running. Once every one of them is sleeping or waiting, time
+    jumps straight to the earliest deadline, unless a waiting thread's
+    predicate has become true, in which case that thread runs first.
+    Threads join the clock the first time they use it, or when registered
+    before starting."""
+
+    _BUSY = None
+
+    def __init__(self, start=None):
+        self._now = time.time() if start is None else start
+        self._lock = threading.Lock()
+        # Notified when time moves or a waiting thread may run
+        self._wake = threading.Condition(self._lock)
+        # Notified when a thread stops running, so time may move
+        self._idle = threading.Condition(self._lock)
+        self._threads = {}
+        for target in (self._advance, self._tick):
+            thread = threading.Thread(target=target, name='VirtualClock')
+            thread.daemon = True
+            thread.start()
+
+    def time(self):
+        self._join()
+        return self._now
+
+    monotonic = time
+
+    def register(self, thread):
+        with self._lock:
+            self._threads[thread] = VirtualClock._BUSY
+
+    def _join(self):
+        thread = threading.current_thread()
+        if thread not in self._threads:
+            self.register(thread)
+
+    def sleep_until(self, deadline):
+        self._block(deadline, None)
+        return self._now
+
+    def wait(self, condition, predicate, timeout=None):
+        result = predicate()
+        if result:
+            return result
+        deadline = None if timeout is None else self.monotonic() + timeout
+        condition.release()
+        try:
+            self._block(deadline, predicate)
+        finally:
+            condition.acquire()
+        return predicate()
+
+    def queue_get(self, queue):
+        import Queue
+        while True:
+            self._block(None, lambda: not queue.empty())
+            try:
+                return queue.get_nowait()
+            except Queue.Empty:
+                pass
+
+    def _block(self, deadline, predicate):
+        self._join()
+        thread = threading.current_thread()
+        with self._lock:
+            if deadline is not None and deadline <= self._now:
+                return
+            self._threads[thread] = _Waiting(deadline, predicate)
+            self._idle.notify()
+            while self._threads[thread] is not VirtualClock._BUSY:
+                self._wake.wait()
+
+    def _can_advance(self):
+        for thread, state in self._threads.items():
+            if state is VirtualClock._BUSY:
+                if thread.ident is not None and not thread.is_alive():
+                    del self._threads[thread]
+                    continue
+                return False
+        return True
+
+    def _advance(self):
+        with self._lock:
+            while True:
+                while not self._can_advance():
+                    self._idle.wait()
+                waiting = [(t, s) for t, s in self._threads.items()
+                           if s is not VirtualClock._BUSY]
+                ready = [t for t, s in waiting
+                         if s.predicate is not None and s.predicate()]
+                if not ready:
+                    deadlines = [s.deadline for t, s in waiting
+                                 if s.deadline is not None]
+                    if not deadlines:
+                        # Everyone waits on something outside the clock
+                        self._idle.wait()
+                        continue
+                    self._now = max(self._now, min(deadlines))
+                    ready = [t for t, s in waiting if s.deadline is not None
+                             and s.deadline <= self._now]
+                for thread in ready:
+                    self._threads[thread] = VirtualClock._BUSY
+                self._wake.notify_all()
+
+    def _tick(self):
+        # Threads that end while running never say so, look again regularly
+        while True:
+            time.sleep(0.01)
+            with self._lock:
+                self._idle.notify()
+
+Clock.GLOBAL = RealClock()
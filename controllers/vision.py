@@ -9,46 +9,125 @@ from sr.robot.vision import (MARKER_ARENA,
                        MARKER_ROBOT,
                        MARKER_FLAG)
 
+from stats import StreamingStat
+
 DEFAULT_RESOLUTION = (960, 720)
 
+# Resolutions the camera captures at, smallest first
+RESOLUTIONS = [(320, 240), (640, 480), (800, 600), (960, 720)]
+
+# Horizontal field of view of the camera in degrees
+HORIZONTAL_FOV = 62.0
+
+# How many pixels wide a marker must be for libkoki to find it, and how many
+# times that to ask for so it is found reliably and measured well
+MIN_MARKER_PIXELS = 33.0
+PIXEL_MARGIN = 1.5
+
 # TODO
 CAMERA_HEIGHT = 0.5 # Height in meters for the elevation above the ground
 
+# The phases of a scan, as named in our stats and in the timings sr.robot
+# returns from see(..., stats=True)
+PHASES = [
+    ('cam_init', 'cam'),
+    ('capture', 'yuyv'),
+    ('img_scan', 'find_markers')
+]
+
+def marker_pixels(res, size, distance):
+    """About how many pixels wide a marker size meters wide, face on and
+    distance meters away, is in an image of the resolution."""
+    focal = res[0] / (2 * math.tan(math.radians(HORIZONTAL_FOV) / 2))
+    return focal * size / max(distance, 0.01)
+
 class VisionController(object):
     def __init__(self, robot):
         self.res = DEFAULT_RESOLUTION
         self._see = robot.see
-        self._stats = {
-            'cam_init': [],
-            'capture': [],
-            'img_scan': []
-        }
-
-    def find_markers(self):
-        markers, timings = self._see(self.res, True)
-        self._record_timings(timings)
+        # (phase, resolution): StreamingStat, with a resolution of None
+        # covering every resolution
+        self._stats = {}
+
+    def find_markers(self, res=None):
+        """Scans a frame at res, or at the camera's resolution if None."""
+        if res is None:
+            # The resolution can change from another thread mid-scan
+            res = self.res
+        markers, timings = self._see(res, True)
+        self._record_timings(timings, res)
         return markers
 
-    def _record_timings(self, times):
-        self._stats['cam_init'].append(times['cam'])
-        self._stats['capture'].append(times['yuyv'])
-        self._stats['img_scan'].append(times['find_markers'])
+    def _record_timings(self, times, scan_res):
+        for phase, key in PHASES:
+            for res in (None, scan_res):
+                if (phase, res) not in self._stats:
+                    self._stats[(phase, res)] = StreamingStat()
+                self._stats[(phase, res)].add(times[key])
+
+    def get_stat(self, phase, res=None):
+        """The StreamingStat of one phase, at the given resolution or at all
+        of them. None if no scan has been made yet."""
+        return self._stats.get((phase, res))
+
+    def get_resolutions(self):
+        return sorted(res for phase, res in self._stats.keys()
+                      if res is not None and phase == PHASES[0][0])
 
     def print_stat(self):
-        timesvars = [[]] * 3
-        timesvars[0] = self._stats['cam_init']
-        timesvars[1] = self._stats['capture']
-        timesvars[2] = self._stats['img_scan']
-        averages = []
-        for times in timesvars:
-            avg = 0
-            for time in times:
-                avg += time
-            avg /= float(len(times))
-            averages.append(avg)
-        print "It took %f seconds for camera to initialize" % averages[0]
-        print "It took %f seconds to capture the image" % averages[1]
-        print "It took %f seconds to scan for libkoki markers" % averages[2]
+        if not self._stats:
+            print "No scans have been made"
+            return
+        descriptions = {
+            'cam_init': "for camera to initialize",
+            'capture': "to capture the image",
+            'img_scan': "to scan for libkoki markers"
+        }
+        for phase, key in PHASES:
+            stat = self.get_stat(phase)
+            print "It took %f seconds (p95 %f) %s" % (
+                stat.mean, stat.percentile(95), descriptions[phase])
+            for res in self.get_resolutions():
+                print "    at %dx%d: %s" % (res + (self.get_stat(phase, res),))
+
+    def scan_time(self, res):
+        """Seconds a scan at the resolution takes: the mean of the scans made
+        at it, or for a phase not yet timed at it, a fit of the other
+        resolutions' timings as growing linearly with pixel count."""
+        total = 0.0
+        for phase, key in PHASES:
+            stat = self.get_stat(phase, res)
+            total += stat.mean if stat is not None else \
+                self._estimate(phase, res)
+        return total
+
+    def _estimate(self, phase, res):
+        pixels = float(res[0] * res[1])
+        points = [(r[0] * r[1], self.get_stat(phase, r).mean)
+                  for r in self.get_resolutions()]
+        if not points:
+            # Nothing timed yet, only the order matters
+            return pixels * 1e-6
+        if len(points) == 1:
+            return points[0][1] * pixels / points[0][0]
+        n = len(points)
+        sx = sum(p for p, t in points)
+        sy = sum(t for p, t in points)
+        sxx = sum(p * p for p, t in points)
+        sxy = sum(p * t for p, t in points)
+        slope = max((n * sxy - sx * sy) / (n * sxx - sx * sx), 0.0)
+        return max((sy - slope * sx) / n + slope * pixels, 0.0)
+
+    def resolution_for(self, distance, size):
+        """The resolution quickest to scan at which a marker size meters wide
+        and distance meters away is still found and measured well, or the
+        largest if there is none."""
+        need = MIN_MARKER_PIXELS * PIXEL_MARGIN
+        fits = [res for res in RESOLUTIONS
+                if marker_pixels(res, size, distance) >= need]
+        if not fits:
+            return RESOLUTIONS[-1]
+        return min(fits, key=self.scan_time)
 
     def change_resolution(self, new_res):
         if type(new_res) == tuple and len(new_res) == 2:
@@ -3,17 +3,76 @@
     MIT License. A copy of the MIT License can be found in LICENSE.txt
 """
 
+import collections
+import logging
+import threading
+
+from clock import Clock
+
 class EventBus(object):
+    """Posts payloads to the handlers registered on a channel.
+    Handlers can also subscribe to every channel beginning with a prefix by
+    registering on 'prefix*', or to all channels with '*'. Wildcards never
+    match internal channels such as '__bus_error__'.
+    Registrations are copy-on-write: post() runs against the snapshot of
+    handlers taken when it started, so handlers added or removed during a
+    post (even by a handler of that post) only affect later posts."""
 
     GLOBAL = None
 
     def __init__(self):
-        self.reg = {}
+        # (exact handlers, wildcard handlers, resolved handlers cache)
+        # swapped as one tuple so post() never sees a partial update.
+        self._state = ({}, (), {})
+        self._lock = threading.Lock()
+        self.workers = {}
+
+    def set_async(self, channel, queue_size=8, coalesce=False):
+        """Makes posts to the given channel return immediately, the handlers
+        are run by a worker thread dedicated to the channel instead.
+        At most queue_size payloads wait for the worker, when full the oldest
+        is dropped. With coalesce set only the latest payload is kept.
+        Handlers of async channels can't interrupt the posting thread, so
+        don't use this for channels whose handlers raise StateInterrupt."""
+        if channel in self.workers:
+            raise ValueError("Channel %r is already async" % channel)
+        worker = _ChannelWorker(self, channel,
+                                1 if coalesce else queue_size)
+        self.workers[channel] = worker
+        Clock.GLOBAL.register(worker)
+        worker.start()
+        return worker
+
+    def close(self):
+        """Stops the workers of async channels once they finish the payload
+        they are handling, payloads still waiting are dropped. Later posts to
+        those channels are dropped too. Doesn't wait for the workers, on the
+        virtual clock that would stop them from ever waking."""
+        for worker in self.workers.values():
+            worker.stop()
 
     def post(self, channel, payload=None):
-        if channel not in self.reg:
-            return
-        for handler in self.reg[channel]:
+        worker = self.workers.get(channel)
+        if worker is not None:
+            worker.put(payload)
+        else:
+            self._dispatch(channel, payload)
+
+    def get_handlers(self, channel):
+        """Gets the tuple of handlers a post to channel would run."""
+        exact, patterns, cache = self._state
+        handlers = cache.get(channel)
+        if handlers is None:
+            handlers = exact.get(channel, ())
+            if not channel.startswith('__'):
+                handlers += tuple(h for prefix, h in patterns
+                                  if channel.startswith(prefix))
+            # Only ever stored in the cache of this snapshot
+            cache[channel] = handlers
+        return handlers
+
+    def _dispatch(self, channel, payload):
+        for handler in self.get_handlers(channel):
             try:
                 if payload is None:
                     handler()
@@ -25,16 +84,107 @@ class EventBus(object):
                 else:
                     raise e
 
-    def register(self, channel, handler):
-        if not channel in self.reg:
-            self.reg[channel] = []
-        self.reg[channel].append(handler)
+    def register(self, channel, handler, once=False):
+        """Registers handler on channel. A channel ending with '*' matches
+        every channel starting with the text before it. If once is True the
+        handler is unregistered after the first post it handles."""
+        if once:
+            handler = _OnceHandler(self, channel, handler)
+        with self._lock:
+            exact, patterns, _ = self._state
+            if channel.endswith('*'):
+                patterns = patterns + ((channel[:-1], handler),)
+            else:
+                exact = dict(exact)
+                exact[channel] = exact.get(channel, ()) + (handler,)
+            self._state = (exact, patterns, {})
 
     def unregister(self, channel, handler):
-        if not channel in self.reg:
-            return
-        if not handler in self.reg[channel]:
-            return
-        self.reg[channel].remove(handler)
+        match = lambda h: h == handler or \
+            (isinstance(h, _OnceHandler) and h.handler == handler)
+        with self._lock:
+            exact, patterns, _ = self._state
+            if channel.endswith('*'):
+                prefix = channel[:-1]
+                for i, (p, h) in enumerate(patterns):
+                    if p == prefix and match(h):
+                        patterns = patterns[:i] + patterns[i + 1:]
+                        break
+                else:
+                    return
+            else:
+                handlers = exact.get(channel, ())
+                for i, h in enumerate(handlers):
+                    if match(h):
+                        exact = dict(exact)
+                        exact[channel] = handlers[:i] + handlers[i + 1:]
+                        break
+                else:
+                    return
+            self._state = (exact, patterns, {})
+
+class _OnceHandler(object):
+    def __init__(self, bus, channel, handler):
+        self.bus = bus
+        self.channel = channel
+        self.handler = handler
+        self._lock = threading.Lock()
+        self._fired = False
+
+    def __call__(self, *args):
+        with self._lock:
+            if self._fired:
+                return
+            self._fired = True
+        self.bus.unregister(self.channel, self)
+        return self.handler(*args)
+
+class _ChannelWorker(threading.Thread):
+    def __init__(self, bus, channel, size):
+        super(_ChannelWorker, self).__init__(name='Bus-%s' % channel)
+        self.daemon = True
+        self.log = logging.getLogger('Robot.EventBus')
+        self.bus = bus
+        self.channel = channel
+        self.pending = collections.deque()
+        self.size = size
+        self.cond = threading.Condition()
+        self.posted = 0
+        self.dropped = 0
+        self.stopped = False
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.dropped += len(self.pending)
+            self.pending.clear()
+            self.cond.notify()
+
+    def put(self, payload):
+        with self.cond:
+            self.posted += 1
+            if self.stopped:
+                self.dropped += 1
+                return
+            if len(self.pending) >= self.size:
+                self.pending.popleft()
+                self.dropped += 1
+            self.pending.append(payload)
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                Clock.GLOBAL.wait(self.cond,
+                                  lambda: self.pending or self.stopped)
+                if self.stopped:
+                    return
+                payload = self.pending.popleft()
+            try:
+                self.bus._dispatch(self.channel, payload)
+            except Exception as e:
+                self.log.error("Unhandled error on async channel '%s'",
+                               self.channel)
+                self.log.exception(e)
 
 EventBus.GLOBAL = EventBus()
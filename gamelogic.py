@@ -8,6 +8,7 @@ import logging
 from state_utils import StateMachine, StateInterrupt
 from event_bus import EventBus
 from strategy import StrategyRegistry
+from systems.navigation import NavigationCancelled
 
 class PlayGame:
     def __init__(self, robot, corner):
@@ -30,18 +31,26 @@ class PlayGame:
 
     def startup(self):
         strategy = StrategyRegistry.get('STRAT_1')
-        self.sm = StateMachine(strategy.get_states())
+        self.sm = StateMachine(strategy.get_states(), cooperative=True)
+        transitions = strategy.get_transitions()
+        if transitions is not None:
+            table = self.sm.compile(transitions)
+            self.log.debug("State graph %s", table.export())
         self.sm.bus.register('change', self.state_changed)
         self.sm.bus.register('error', self.state_error)
         self.sm.bus.register('finish', self.state_finished)
         self.sm.bus.register('interrupt', self.state_interrupted)
         EventBus.GLOBAL.register('markers', self.handle_markers)
         EventBus.GLOBAL.register('bump', self.handle_bump)
+        # Backing away takes over a second, don't hold up the sensor thread
+        EventBus.GLOBAL.set_async('bump', coalesce=True)
         EventBus.GLOBAL.register('__bus_error__', self.handle_bus_error)
         self.sm.bus.register('__bus_error__', self.handle_bus_error)
+        # Searches run inside a step give up once the state is preempted
+        self.robot.navigator.preempt_hook = self.sm.preempted
         self.reset()
         strategy.set_game_util(self)
-        for state in self.sm.next_state():
+        for state in self.sm.next_state(lambda: self.robot.running):
             self.sm.change_state(state)
 
     def set_state(self, state, *args):
@@ -53,6 +62,10 @@ class PlayGame:
 
     def state_error(self, payload):
         state, errors = payload
+        if all(isinstance(e['exception'], NavigationCancelled)
+               for e in errors):
+            self.log.info("%s ended, navigation was cancelled", state)
+            return
         self.log.error(str(state) + " encountered errors")
         for e in errors:
             self.log.exception(e['exception'])
@@ -62,7 +75,11 @@ class PlayGame:
 
     def state_interrupted(self, payload):
         state, ex = payload
-        self.log.info("%s was interrupted, %s", state, ex)
+        self.log.info("%s was interrupted, %s", state, ex.id)
+        if ex.id == 'obstacle':
+            self.log.info("Move away")
+            self.robot.wheels.backward(0.9, 50)
+            self.robot.wheels.right(10, 50)
 
     def reset(self):
         self.sm.set_state("MAIN")
@@ -77,23 +94,19 @@ class PlayGame:
 
     def handle_markers(self, markers):
         self.log.debug("Handling marker scan")
-        currstate = self.sm.get_active_state().name
-        obsticles = markers \
-            .filter(lambda m: m.info.marker_type in ['robot', 'arena']) \
-            .filter(lambda m: m.dist < 0.4)
+        obsticles = markers.within(0.4) \
+            .filter(lambda m: m.info.marker_type in ['robot', 'arena'])
         if obsticles.is_empty:
             return
         nearest_obsticle = obsticles.get_closest()
-        def on_interrupt(payload):
-            self.sm.bus.unregister('interrupt', on_interrupt)
-            self.log.info("Move away")
-            self.robot.wheels.backward(0.9, 50)
-            self.robot.wheels.right(10, 50)
-        self.sm.bus.register('interrupt', on_interrupt)
         self.log.info("Obsticle found, %s", nearest_obsticle)
-        raise StateInterrupt('stop', 'operation.stop')
+        # The state stops at its next yield, moves away and starts over
+        self.sm.interrupt('obstacle')
 
     def handle_bump(self, sensors):
         self.log.warn("Bumped on sensors %s", sensors)
-        self.robot.wheels.backward(0.7, 60)
-        self.robot.wheels.left(30, 60)
+        # Stop pushing into whatever we hit, the move in progress is dropped
+        self.robot.wheels.sequence().backward(0.7, 60).left(30, 60) \
+            .run(preempt=True)
+        # and the state starts over from where that leaves us
+        self.sm.interrupt('bump', priority=1)
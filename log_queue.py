@@ -0,0 +1,109 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+import collections
+import logging
+import threading
+
+from clock import Clock
+
+# How often the writer flushes even if nobody asked it to, in seconds
+FLUSH_INTERVAL = 0.5
+
+# Most records the writer takes off the buffer before flushing its targets
+BATCH_SIZE = 256
+
+class BufferedFileHandler(logging.FileHandler):
+    """A FileHandler that leaves flushing to whoever calls sync, so the
+    writer can flush once per batch instead of once per record."""
+
+    def flush(self):
+        pass
+
+    def sync(self):
+        logging.FileHandler.flush(self)
+
+class QueueHandler(logging.Handler):
+    """Takes log records off the calling thread. emit only appends the
+    unformatted record to a ring buffer of at most capacity records, a
+    writer thread formats them and hands them on to the target handlers.
+    When the buffer is full the oldest record is dropped and counted."""
+
+    def __init__(self, targets, capacity=10000):
+        logging.Handler.__init__(self)
+        self.targets = list(targets)
+        self.capacity = capacity
+        self.dropped = 0
+        self._reported = 0
+        self._closed = False
+        self._buffer = collections.deque()
+        self._cond = threading.Condition()
+        # Held while writing so flush() and the writer don't interleave
+        self._write_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._run, name='LogWriter')
+        self._writer.daemon = True
+        Clock.GLOBAL.register(self._writer)
+        self._writer.start()
+
+    def emit(self, record):
+        with self._cond:
+            if len(self._buffer) >= self.capacity:
+                self._buffer.popleft()
+                self.dropped += 1
+            self._buffer.append(record)
+            if len(self._buffer) >= BATCH_SIZE:
+                self._cond.notify()
+
+    def _drain(self):
+        # Takes and writes batches until the buffer is empty, holding the
+        # write lock throughout so records are written in order
+        with self._write_lock:
+            while True:
+                with self._cond:
+                    batch = []
+                    while self._buffer and len(batch) < BATCH_SIZE:
+                        batch.append(self._buffer.popleft())
+                    dropped = self.dropped
+                if dropped != self._reported:
+                    batch.insert(0, logging.LogRecord(
+                        'Robot.Log', logging.WARNING, __file__, 0,
+                        "Log buffer full, %d records dropped",
+                        (dropped - self._reported,), None))
+                    self._reported = dropped
+                if not batch:
+                    return
+                self._write(batch)
+
+    def _write(self, batch):
+        for record in batch:
+            for target in self.targets:
+                if record.levelno >= target.level:
+                    target.handle(record)
+        for target in self.targets:
+            if isinstance(target, BufferedFileHandler):
+                target.sync()
+            else:
+                target.flush()
+
+    def _run(self):
+        clock = Clock.GLOBAL
+        ready = lambda: self._closed or len(self._buffer) >= BATCH_SIZE
+        while not self._closed:
+            with self._cond:
+                clock.wait(self._cond, ready, FLUSH_INTERVAL)
+            self._drain()
+
+    def flush(self):
+        """Writes out everything buffered so far on the calling thread."""
+        self._drain()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.flush()
+        for target in self.targets:
+            target.close()
+        logging.Handler.close(self)
@@ -5,12 +5,22 @@
 
 import logging
 import math
+import threading
 
+import arena
 from controllers.ruggeduino import RuggeduinoController
+from event_bus import EventBus
 from systems.vision import VisionSystem
 from systems.movement import MovementSystem
 from systems.mech import MechSystem
+from systems.localization import Localizer
+from systems.navigation import NavigationEngine, Retry
+from systems.planner import PathPlanner
+from systems.pose import PoseEstimator
+from systems.tracking import MarkerTracker, TrackedMarker
+from recorder import Recorder
 from threads import RobotThreads
+from tracing import Tracer
 
 class Robot:
 
@@ -23,6 +33,12 @@ class Robot:
             self.camera = VisionSystem(srBot)
             self.wheels = MovementSystem(srBot)
             self.arm = MechSystem(srBot)
+            self.tracker = MarkerTracker(self.camera)
+            self.pose = PoseEstimator(
+                srBot.zone, lambda: self.threads.sensors.is_bumped())
+            self.localizer = Localizer(self.camera, self.pose)
+            self.planner = PathPlanner(self.camera, self.pose)
+            self.navigator = NavigationEngine(lambda: not self.running)
         except:
             self.log.critical("Critical error when setting-up systems")
             raise
@@ -33,6 +49,7 @@ class Robot:
         self.flag_sens = RuggeduinoController(srBot, type='flag_sensor',
                                               id='PLATE')
         self.threads = RobotThreads(self)
+        self._stop_lock = threading.Lock()
         self.running = True
         self.threads.run()
         self.log.info("Done")
@@ -64,25 +81,56 @@ class Robot:
         return False
 
     def stop(self):
+        """Stops the robot's threads and logs what it did. Only the first
+        call does anything, it is made at the end of the match."""
+        with self._stop_lock:
+            if not self.running:
+                return
+            self.running = False
         self.log.info("Stopping all communications")
-        self.running = False
+        self.navigator.cancel()
+        self.wheels.stop()
+        EventBus.GLOBAL.close()
+        for line in self.navigator.summary():
+            self.log.info("Navigation %s", line)
+        self.log.info("Estimated pose %s, %d fixes, last %s", self.pose,
+                      self.localizer.fixes, self.localizer.last_fix)
+        scan = self.camera.camera.get_stat('img_scan')
+        if scan is not None:
+            self.log.info("Marker scans: %s, %d saved by tracking", scan,
+                          self.tracker.scans_saved)
+            for res in self.camera.camera.get_resolutions():
+                self.log.info("    at %dx%d: %s", res[0], res[1],
+                              self.camera.camera.get_stat('img_scan', res))
+        Tracer.GLOBAL.flush()
+        if Recorder.GLOBAL is not None:
+            Recorder.GLOBAL.close()
+        # The kit may cut power any moment now, don't leave the stats queued
+        for handler in self.log.handlers:
+            handler.flush()
 
-    def goto_marker(self, marker, speed, assumed_close=0.6, filter_func=None):
+    def goto_marker(self, marker, speed, assumed_close=0.6, filter_func=None,
+                    attempts=8, seconds=30):
         """Attempts to go to the given marker.
         assumed_close is a number that defines the maximum distance a marker can
         be before assuming the robot is too close to see the marker.
         filter_func is a callable that is applied to the markers found,
         see MarkerCollection#filter. If None, it will match markers with the
         same code.
-        Note: Because this assumes the camera can't see a marker closer than
-        assumed_close, the method may never exit if assumed_close is too small.
+        Each attempt halves the distance to the marker, giving up after
+        attempts of them or seconds.
         Returns True on success, False if it could not go to the marker."""
-        self.log.debug("going to marker %s %.1f%% assuming %.1f is close",
-                       marker, speed, assumed_close)
         if filter_func is None:
             filter_func = lambda m: m.info.code == marker.info.code
         if not callable(filter_func):
             raise TypeError("Filter function must be callable")
+        return self.navigator.run('goto_marker', self._goto_step,
+                                  (marker, speed, assumed_close, filter_func),
+                                  attempts, seconds)
+
+    def _goto_step(self, marker, speed, assumed_close, filter_func):
+        self.log.debug("going to marker %s %.1f%% assuming %.1f is close",
+                       marker, speed, assumed_close)
         mhelper = VisionSystem.get_helper_for(marker)
         h_dist = mhelper.horizontal_dist
         travel_dist = h_dist / 2.0
@@ -91,7 +139,15 @@ class Robot:
         else:
             self.wheels.right(marker.rot_y, speed)
         self.wheels.forward(travel_dist, speed)
-        new_marker = self.camera.get_markers().filter(filter_func).get_closest()
+        new_marker = self.tracker.locate(marker.info.code, filter_func)
+        if isinstance(new_marker, TrackedMarker) and \
+                new_marker.horizontal_dist < assumed_close:
+            # Too close for the camera to confirm, trust the prediction
+            self.log.debug("Tracked the remaining distance, %.2f",
+                           new_marker.horizontal_dist)
+            self.face_marker(new_marker, speed)
+            self.wheels.forward(new_marker.horizontal_dist, speed)
+            return True
         if new_marker is None:
             if travel_dist < assumed_close:
                 # OK, we are close enough to the target marker.
@@ -103,7 +159,52 @@ class Robot:
             self.log.debug("Lost marker and it's not assumed to be close, %.2f",
                            travel_dist)
             return False
-        return self.goto_marker(new_marker, speed, assumed_close, filter_func)
+        return Retry(new_marker, speed, assumed_close, filter_func)
+
+    def drive_to(self, x, y, speed, reverse=False, stop_short=0.0,
+                 attempts=8, seconds=60):
+        """Drives a planned route to the arena position (x, y) a leg at a
+        time, see PathPlanner#next_leg. After each leg a scan gives the pose
+        a fresh fix and the rest of the way is planned again.
+        Returns True once there, False if the robot bumped into something
+        or the attempts (legs) or seconds ran out. Returns None if the pose
+        isn't reliable enough to plan from or there is no route, which
+        before the first leg means the robot hasn't moved."""
+        return self.navigator.run('drive_to', self._drive_step,
+                                  (x, y, speed, reverse, stop_short),
+                                  attempts, seconds)
+
+    def _drive_step(self, x, y, speed, reverse, stop_short):
+        if not self.pose.reliable:
+            self.log.debug("Not planning, pose is %s", self.pose)
+            return None
+        leg = self.planner.next_leg(self.wheels, x, y, speed, reverse,
+                                    stop_short)
+        if leg is None:
+            return None
+        sequence, legs = leg
+        if sequence is None:
+            return True
+        sequence.run()
+        # Backing away from a bump preempts the leg. The bump switches are
+        # all at the front, so they say nothing of what reversing hit
+        if sequence.cancelled() or \
+                (not reverse and self.threads.sensors.is_bumped()):
+            self.log.info("Bumped driving to (%.2f, %.2f), giving up", x, y)
+            return False
+        if legs == 0:
+            return True
+        self.camera.get_markers()
+        return Retry(x, y, speed, reverse, stop_short)
+
+    def wall_distance(self, codes):
+        """How far away by the pose the farthest of the wall markers with
+        the given codes could be, or None if the pose isn't reliable."""
+        if not self.pose.reliable:
+            return None
+        farthest = max(self.pose.distance_to(*arena.WALL_MARKERS[code][:2])
+                       for code in codes)
+        return farthest + 2 * self.pose.sigma
 
     def face_marker(self, marker, speed):
         """Faces the given marker."""
@@ -129,84 +230,99 @@ class Robot:
         self.wheels.forward(dist, speed)
         turn_2(deg2, speed)
 
-    def navigate_to_marker(self, marker, speed, comparator=None):
-        """TODO: Revise this method and write docstring"""
+    def navigate_to_marker(self, marker, speed, comparator=None, attempts=4,
+                           seconds=60):
+        """Faces the marker and goes to it, see Robot#goto_marker for
+        comparator, finding it again and starting over if that fails.
+        Returns True on success, False if it was lost or the attempts or
+        seconds ran out."""
+        return self.navigator.run('navigate_to_marker', self._navigate_step,
+                                  (marker, speed, comparator), attempts,
+                                  seconds)
+
+    def _navigate_step(self, marker, speed, comparator):
         self.log.debug("navigating to marker")
         self.face_marker(marker, speed) # face the marker
-        markers = self.camera.get_markers() # rescan for the marker
-        new_markers = markers.filter(lambda m: m.info.code == marker.info.code)
-        if new_markers.is_empty:
+        new_marker = self.tracker.locate(marker.info.code)
+        if new_marker is None:
             self.log.warning("Could not find marker after facing")
             return False
         self.log.debug("Found marker, continuing")
-        marker = new_markers.get_closest()
+        marker = new_marker
         if self.goto_marker(marker, speed, filter_func=comparator):
             return True
-        markers = self.camera.get_markers() # rescan for the marker
-        new_markers = markers.filter(lambda m: m.info.code == marker.info.code)
-        if new_markers.is_empty:
+        new_marker = self.tracker.locate(marker.info.code)
+        if new_marker is None:
             self.log.warning("Could not find marker after trying to go to it")
             return False
         self.log.debug("Found marker again, continuing")
-        marker = new_markers.get_closest()
-        return self.navigate_to_marker(marker, speed, comparator)
+        marker = new_marker
+        return Retry(marker, speed, comparator)
 
-    def find_flag(self, wall_boundary, speed):
+    def find_flag(self, wall_boundary, speed, attempts=20, seconds=60):
+        """Looks for a flag in front of the walls with the codes in
+        wall_boundary, any walls if None, turning and heading closer to them
+        until one is seen, then navigates to it. Each look is an attempt,
+        giving up after attempts of them or seconds.
+        Returns a dict whose 'result' is 'navigating' once it went for a
+        flag, along with 'nav_success', 'flag_code' and 'flag', or 'lost'
+        if it never saw one."""
         self.log.debug("Finding flag within the bounds %s", wall_boundary)
-        turned180 = False
-        result = {'result': None}
-        while True:
-            markers = self.camera.get_markers()
-            flags = markers.filter(lambda m: m.info.marker_type == 'flag')
-            walls = markers.filter(lambda m: m.info.marker_type == 'arena')
-            if wall_boundary is not None:
-                walls = walls.filter(lambda m: m.info.code in wall_boundary)
-            if walls.is_empty:
-                self.log.info("No walls found")
-                #if turned180:
-                #    result['result'] = 'lost'
-                #    break
+        return self.navigator.run('find_flag', self._find_step,
+                                  (wall_boundary, speed), attempts, seconds,
+                                  default={'result': 'lost'})
+
+    def _find_step(self, wall_boundary, speed):
+        distance = None
+        if wall_boundary is not None:
+            distance = self.wall_distance(wall_boundary)
+        markers = self.camera.get_markers(distance=distance,
+                                          size=arena.FLAG_SIZE)
+        flags = markers.of_type('flag')
+        walls = markers.of_type('arena')
+        if wall_boundary is not None:
+            walls = walls.with_codes(wall_boundary)
+        if walls.is_empty:
+            self.log.info("No walls found")
+            self.wheels.right(20, speed / 1.5)
+            if self.is_bumping():
+                self.log.info("Bumped, reverse")
+                self.wheels.backward(0.3, 60)
+                self.wheels.left(30, speed)
+            return Retry(wall_boundary, speed)
+        if flags.is_empty or flags.get_closest().dist > 4:
+            w_marker = walls.get_closest_rotation(180) # get_closest()
+            if w_marker is not None and w_marker.dist < 2:
+                self.log.info("Wall far")
                 self.wheels.right(20, speed / 1.5)
                 if self.is_bumping():
                     self.log.info("Bumped, reverse")
-                    self.wheels.backward(0.3, 60)
+                    self.wheels.backward(0.7, speed)
                     self.wheels.left(30, speed)
-                #self.wheels.right(180, speed)
-                #turned180 = True
-                continue
-            if flags.is_empty or flags.get_closest().dist > 4:
-                w_marker = walls.get_closest_rotation(180) # get_closest()
-                if w_marker is not None and w_marker.dist < 2:
-                    self.log.info("Wall far")
-                    self.wheels.right(20, speed / 1.5)
-                    if self.is_bumping():
-                        self.log.info("Bumped, reverse")
-                        self.wheels.backward(0.7, speed)
-                        self.wheels.left(30, speed)
-                    continue
-                if w_marker is not None:
-                    dist = w_marker.dist / 3
-                    self.log.info("No flags nearby, heading closer %.2f", w_marker.rot_y)
-                    self.face_marker(w_marker, speed)
-                    self.log.info("driving %.2fm", dist)
-                    self.wheels.forward(dist, speed)
-                    if self.is_bumping():
-                        self.wheels.backward(0.5, speed)
-                        self.wheels.left(20, speed)
-                else:
-                    self.log.info("Turn right 20")
-                    self.wheels.right(20, speed / 1.5)
-                    if self.is_bumping():
-                        self.log.info("Bumped, reverse")
-                        self.wheels.backward(0.7, speed)
-                        self.wheels.left(30, speed)
-                continue
-            flag = flags.get_closest()
-            self.log.info("Seen flag %s", flag)
-            nav_success = self.navigate_to_marker(flag, speed)
-            result['result'] = 'navigating'
-            result['nav_success'] = nav_success
-            result['flag_code'] = flag.info.code
-            result['flag'] = flag
-            break
-        return result
+                return Retry(wall_boundary, speed)
+            if w_marker is not None:
+                dist = w_marker.dist / 3
+                self.log.info("No flags nearby, heading closer %.2f", w_marker.rot_y)
+                self.face_marker(w_marker, speed)
+                self.log.info("driving %.2fm", dist)
+                self.wheels.forward(dist, speed)
+                if self.is_bumping():
+                    self.wheels.backward(0.5, speed)
+                    self.wheels.left(20, speed)
+            else:
+                self.log.info("Turn right 20")
+                self.wheels.right(20, speed / 1.5)
+                if self.is_bumping():
+                    self.log.info("Bumped, reverse")
+                    self.wheels.backward(0.7, speed)
+                    self.wheels.left(30, speed)
+            return Retry(wall_boundary, speed)
+        flag = flags.get_closest()
+        self.log.info("Seen flag %s", flag)
+        nav_success = self.navigate_to_marker(flag, speed)
+        return {
+            'result': 'navigating',
+            'nav_success': nav_success,
+            'flag_code': flag.info.code,
+            'flag': flag
+        }
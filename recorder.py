@@ -0,0 +1,215 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Records everything the robot reads from and writes to the kit: each see(),
+# each ruggeduino read and each motor and servo command, stamped with the
+# time since recording started. replay.py feeds a recording back into the
+# game code off the robot.
+#
+# The file is a header followed by records, each a kind byte and a double
+# timestamp followed by a payload laid out as in FORMATS. Board serial
+# numbers are written once in a NAME record and referred to by index.
+
+import struct
+import threading
+
+from clock import Clock
+
+MAGIC = 'BRKR'
+VERSION = 1
+
+HEADER = struct.Struct('<4sBB')
+RECORD = struct.Struct('<Bd')
+
+NAME, START, SEE, MARKER, PIN, MOTOR, SERVO = range(7)
+
+FORMATS = {
+    NAME: struct.Struct('<B32p'),      # index, serial
+    START: struct.Struct('<'),         # wait_start returned
+    SEE: struct.Struct('<HHHfff'),     # res, marker count, timings
+    MARKER: struct.Struct('<HH8pfffffff'), # code, offset, type, size, dist,
+                                       # rot_x, rot_y, orientation x, y, z
+    PIN: struct.Struct('<BBf'),        # board, pin, value
+    MOTOR: struct.Struct('<BBf'),      # board, channel, power
+    SERVO: struct.Struct('<BBf')       # board, slot, angle
+}
+
+# The order see() timings are written in
+TIMINGS = ('cam', 'yuyv', 'find_markers')
+
+# Longest the file is left unflushed, in seconds
+FLUSH_INTERVAL = 1.0
+
+class _RecordingChannel(object):
+    def __init__(self, channel, recorder, board, index):
+        self._channel = channel
+        self._recorder = recorder
+        self._board = board
+        self._index = index
+
+    @property
+    def power(self):
+        return self._channel.power
+
+    @power.setter
+    def power(self, value):
+        self._channel.power = value
+        self._recorder.write(MOTOR, self._board, self._index, value)
+
+class _RecordingMotorBoard(object):
+    def __init__(self, board, recorder, index):
+        self._board = board
+        self.m0 = _RecordingChannel(board.m0, recorder, index, 0)
+        self.m1 = _RecordingChannel(board.m1, recorder, index, 1)
+
+    def __getattr__(self, name):
+        return getattr(self._board, name)
+
+class _RecordingServoBoard(object):
+    def __init__(self, board, recorder, index):
+        self._board = board
+        self._recorder = recorder
+        self._index = index
+
+    def __getitem__(self, slot):
+        return self._board[slot]
+
+    def __setitem__(self, slot, angle):
+        self._board[slot] = angle
+        self._recorder.write(SERVO, self._index, slot, angle)
+
+    def __getattr__(self, name):
+        return getattr(self._board, name)
+
+class _RecordingRuggeduino(object):
+    def __init__(self, board, recorder, index):
+        self._board = board
+        self._recorder = recorder
+        self._index = index
+
+    def digital_read(self, pin):
+        value = self._board.digital_read(pin)
+        self._recorder.write(PIN, self._index, pin, value)
+        return value
+
+    def analogue_read(self, pin):
+        value = self._board.analogue_read(pin)
+        self._recorder.write(PIN, self._index, pin, value)
+        return value
+
+    def __getattr__(self, name):
+        return getattr(self._board, name)
+
+class Recorder(object):
+    """Writes a recording of one match. attach wraps an initialised
+    sr.robot Robot so everything it reads or is told to do is recorded."""
+
+    GLOBAL = None
+
+    def __init__(self, path, zone):
+        self._file = open(path, 'wb', 65536)
+        self._file.write(HEADER.pack(MAGIC, VERSION, zone))
+        self._lock = threading.Lock()
+        self._names = {}
+        self.origin = Clock.GLOBAL.monotonic()
+        self._flushed = self.origin
+
+    @staticmethod
+    def attach(srBot, path):
+        recorder = Recorder(path, srBot.zone)
+        see = srBot.see
+        def recording_see(res=(800, 600), stats=False):
+            markers, timings = see(res, True)
+            recorder.see(res, markers, timings)
+            return (markers, timings) if stats else markers
+        srBot.see = recording_see
+        wait_start = srBot.wait_start
+        def recording_wait_start():
+            wait_start()
+            recorder.write(START)
+        srBot.wait_start = recording_wait_start
+        srBot.motors = dict(
+            (serial, _RecordingMotorBoard(board, recorder,
+                                          recorder.name(serial)))
+            for serial, board in srBot.motors.items())
+        srBot.ruggeduinos = dict(
+            (serial, _RecordingRuggeduino(board, recorder,
+                                          recorder.name(serial)))
+            for serial, board in srBot.ruggeduinos.items())
+        srBot.servos = [_RecordingServoBoard(board, recorder, i)
+                        for i, board in enumerate(srBot.servos)]
+        Recorder.GLOBAL = recorder
+        return recorder
+
+    def name(self, serial):
+        """The index standing for the given board serial in records."""
+        with self._lock:
+            if serial not in self._names:
+                self._names[serial] = len(self._names)
+                self._write(NAME, self._names[serial], serial)
+            return self._names[serial]
+
+    def see(self, res, markers, timings):
+        with self._lock:
+            self._write(SEE, res[0], res[1], len(markers),
+                        *[timings.get(key, 0) for key in TIMINGS])
+            for m in markers:
+                self._write(MARKER, m.info.code, m.info.offset,
+                            m.info.marker_type, m.info.size, m.dist, m.rot_x,
+                            m.rot_y, m.orientation.rot_x,
+                            m.orientation.rot_y, m.orientation.rot_z)
+
+    def write(self, kind, *values):
+        with self._lock:
+            self._write(kind, *values)
+
+    def _write(self, kind, *values):
+        if self._file is None:
+            return
+        now = Clock.GLOBAL.monotonic()
+        self._file.write(RECORD.pack(kind, now - self.origin))
+        self._file.write(FORMATS[kind].pack(*values))
+        if now - self._flushed > FLUSH_INTERVAL:
+            self._file.flush()
+            self._flushed = now
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if Recorder.GLOBAL is self:
+            Recorder.GLOBAL = None
+
+def read_recording(path):
+    """Returns (zone, records) of a recording, where each record is a
+    (kind, time, values) tuple and a SEE record's values end with the list
+    of its MARKER values."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, zone = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("%s is not a version %d recording" % (path, VERSION))
+    offset = HEADER.size
+    records = []
+    pending = 0
+    while offset + RECORD.size <= len(data):
+        kind, stamp = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        fmt = FORMATS[kind]
+        if offset + fmt.size > len(data):
+            # Cut short when the robot lost power
+            break
+        values = fmt.unpack_from(data, offset)
+        offset += fmt.size
+        if kind == MARKER and pending:
+            records[-1][2][-1].append(values)
+            pending -= 1
+            continue
+        if kind == SEE:
+            pending = values[2]
+            values += ([],)
+        records.append((kind, stamp, values))
+    return zone, records
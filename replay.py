@@ -0,0 +1,224 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Plays a match recorded with robot.RECORD back through the game code,
+# without the kit and on the virtual clock unless --realtime is given:
+#     python replay.py recording.brk [--realtime] [--trace file.json]
+# Camera frames are served in the order they were recorded, once the clock
+# reaches the time they were taken, and each pin read returns what the pin
+# read at that time in the match. Motor and servo commands are collected
+# and compared against the recorded ones.
+
+import bisect
+import sys
+import tempfile
+
+import simulate
+
+from clock import Clock
+from recorder import (read_recording, NAME, START, SEE, PIN, MOTOR, SERVO,
+                      TIMINGS)
+from sr.robot.vision import (MarkerInfo, PolarCoord, Point, Orientation,
+                             Marker)
+from tracing import Tracer
+
+class ReplayOver(Exception):
+    pass
+
+class _Battery(object):
+    voltage = 12.0
+
+class _Power(object):
+    battery = _Battery()
+
+class _ReplayChannel(object):
+    def __init__(self, bot, board, index):
+        self._bot = bot
+        self._key = (board, index)
+        self._power = 0
+
+    @property
+    def power(self):
+        return self._power
+
+    @power.setter
+    def power(self, value):
+        self._bot.check()
+        self._power = value
+        self._bot.commands.append((MOTOR, self._key, value))
+
+class _ReplayMotorBoard(object):
+    def __init__(self, bot, index):
+        self.m0 = _ReplayChannel(bot, index, 0)
+        self.m1 = _ReplayChannel(bot, index, 1)
+
+class _ReplayServoBoard(object):
+    def __init__(self, bot, index):
+        self._bot = bot
+        self._index = index
+        self._angles = [0] * 8
+
+    def __getitem__(self, slot):
+        return self._angles[slot]
+
+    def __setitem__(self, slot, angle):
+        self._bot.check()
+        self._angles[slot] = angle
+        self._bot.commands.append((SERVO, (self._index, slot), angle))
+
+class _ReplayRuggeduino(object):
+    def __init__(self, bot, index):
+        self._bot = bot
+        self._index = index
+
+    def _is_srduino(self):
+        return True
+
+    def pin_mode(self, pin, mode):
+        pass
+
+    def digital_write(self, pin, level):
+        pass
+
+    def digital_read(self, pin):
+        return bool(self._bot.pin_value(self._index, pin))
+
+    def analogue_read(self, pin):
+        return self._bot.pin_value(self._index, pin)
+
+class ReplayRobot(object):
+    """Stands in for sr.robot's Robot, answering from a recording."""
+
+    def __init__(self, path):
+        self.zone, records = read_recording(path)
+        self.usbkey = tempfile.mkdtemp(prefix='srreplay')
+        self.power = _Power()
+        self.origin = Clock.GLOBAL.monotonic()
+        self.finished = False
+        self.start_time = 0
+        self.duration = records[-1][1] if records else 0
+        self.frames = []
+        self.pins = {}
+        self.recorded = []
+        self.commands = []
+        names = {}
+        for kind, stamp, values in records:
+            if kind == NAME:
+                names[values[0]] = values[1]
+            elif kind == START:
+                self.start_time = stamp
+            elif kind == SEE:
+                self.frames.append((stamp, values))
+            elif kind == PIN:
+                times, readings = self.pins.setdefault(values[:2], ([], []))
+                times.append(stamp)
+                readings.append(values[2])
+            elif kind in (MOTOR, SERVO):
+                self.recorded.append((kind, values[:2], values[2]))
+        self._next_frame = 0
+        self.motors = dict((serial, _ReplayMotorBoard(self, index))
+                           for index, serial in names.items())
+        self.ruggeduinos = dict((serial, _ReplayRuggeduino(self, index))
+                                for index, serial in names.items())
+        boards = [key[0] for kind, key, value in self.recorded
+                  if kind == SERVO]
+        self.servos = [_ReplayServoBoard(self, i)
+                       for i in range(max(boards + [0]) + 1)]
+
+    def now(self):
+        return Clock.GLOBAL.monotonic() - self.origin
+
+    def check(self):
+        if self.finished:
+            raise ReplayOver()
+
+    def init(self):
+        pass
+
+    def wait_start(self):
+        Clock.GLOBAL.sleep_until(self.origin + self.start_time)
+
+    def see(self, res=(800, 600), stats=False):
+        self.check()
+        if self._next_frame >= len(self.frames):
+            # Past the last recorded frame, nothing more was seen
+            Clock.GLOBAL.sleep(0.35)
+            markers, timings = [], dict((key, 0) for key in TIMINGS)
+        else:
+            stamp, values = self.frames[self._next_frame]
+            self._next_frame += 1
+            Clock.GLOBAL.sleep_until(self.origin + stamp)
+            timings = dict(zip(TIMINGS, values[3:6]))
+            markers = [self._marker(stamp, values[:2], m)
+                       for m in values[6]]
+        if stats:
+            return markers, timings
+        return markers
+
+    def _marker(self, stamp, res, values):
+        code, offset, marker_type, size, dist, rot_x, rot_y = values[:7]
+        return Marker(MarkerInfo(code, marker_type, offset, size), stamp,
+                      res, Point(PolarCoord(dist, rot_x, rot_y)),
+                      Orientation(*values[7:]))
+
+    def pin_value(self, board, pin):
+        self.check()
+        if (board, pin) not in self.pins:
+            return False
+        times, readings = self.pins[(board, pin)]
+        index = bisect.bisect_right(times, self.now()) - 1
+        return readings[max(index, 0)]
+
+    def stop(self):
+        self.finished = True
+
+    def summary(self):
+        """How far the replay got and where its commands first differ from
+        the recorded ones."""
+        diverged = None
+        for i, (replayed, recorded) in enumerate(zip(self.commands,
+                                                     self.recorded)):
+            # Recorded values went through a float, compare loosely
+            if replayed[:2] != recorded[:2] or \
+                    abs(replayed[2] - recorded[2]) > 1e-3:
+                diverged = i
+                break
+        return {
+            'duration': self.duration,
+            'frames': (self._next_frame, len(self.frames)),
+            'commands': (len(self.commands), len(self.recorded)),
+            'first_divergence': diverged
+        }
+
+def run_replay(path, realtime=False, trace=None):
+    """Plays the recording at path and returns ReplayRobot#summary."""
+    simulate.use_clock(realtime)
+    if trace is not None:
+        Tracer.GLOBAL.clear()
+        Tracer.GLOBAL.enable(trace)
+    import robot as robot_setup
+    from main import Robot
+    simulate.reset_globals()
+    srBot = ReplayRobot(path)
+    robot_setup.setup_logger(srBot.usbkey)
+    srBot.wait_start()
+    bot = Robot(srBot)
+    game = simulate.start_game(bot, srBot.zone)
+    Clock.GLOBAL.sleep_until(srBot.origin + srBot.duration)
+    bot.stop()
+    Tracer.GLOBAL.disable()
+    srBot.stop()
+    simulate.wind_down(game, bot)
+    return srBot.summary()
+
+if __name__ == '__main__':
+    trace = None
+    if '--trace' in sys.argv:
+        trace = sys.argv.pop(sys.argv.index('--trace') + 1)
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    summary = run_replay(args[0], realtime='--realtime' in sys.argv,
+                         trace=trace)
+    for key in sorted(summary):
+        print "%s: %s" % (key, summary[key])
@@ -6,23 +6,40 @@
 import sys
 import logging
 import os
+import signal
+import threading
 import time
 from subprocess import Popen
 
 from sr.robot import Robot as SRBot
 
+from log_queue import BufferedFileHandler, QueueHandler
+
 COMP_MODE = True
 
 TEST_MODE = False
 
+# Record a timeline of states, moves and scans to trace-*.json on the usbkey,
+# open it in chrome://tracing
+TRACE = False
+
+# Record every camera frame, pin read and motor/servo command to match-*.brk
+# on the usbkey, play it back off the robot with replay.py
+RECORD = False
+
+# Seconds from the start to the end of a match
+MATCH_LENGTH = 180
+
 def setup_logger(root):
+    """Logs INFO and up to stdout and everything to a file on the usbkey.
+    Both are written by a background thread, logging calls only queue the
+    record."""
     logger = logging.getLogger('Robot')
     logger.setLevel(logging.DEBUG)
 
     live_log = logging.StreamHandler(sys.stdout)
     live_log.setLevel(logging.INFO)
     live_log.setFormatter(logging.Formatter('%(asctime)s.%(msecs)d [%(levelname)s] [%(name)s] %(message)s', "%M:%S"))
-    logger.addHandler(live_log)
 
     path = os.path.join(root, "comp" if COMP_MODE else "", time.strftime("%Y-%m-%d",  time.localtime()))
     if not os.path.exists(path):
@@ -32,10 +49,10 @@ def setup_logger(root):
     while os.path.exists(filename):
         filename = os.path.join(path, time.strftime("%H.%M.%S", time.localtime()) + "_%d.log" % i)
         i += 1
-    file_log = logging.FileHandler(filename)
+    file_log = BufferedFileHandler(filename)
     file_log.setLevel(logging.DEBUG)
     file_log.setFormatter(logging.Formatter('%(asctime)s@%(threadName)s [%(levelname)s] [%(name)s,%(funcName)s:%(lineno)d] %(message)s'))
-    logger.addHandler(file_log)
+    logger.addHandler(QueueHandler([live_log, file_log]))
 
     return logger
 
@@ -51,15 +68,27 @@ def set_time(ziproot):
         print "[PreInit] Setting time failed %s " % e
         pass
 
-def setup():
+def setup(record=None):
+    """Sets up the kit and our Robot. record is where to write a recording
+    of the match, which defaults to the usbkey if RECORD is set."""
     # A bad way to detect whether running in simulator
     if sys.platform.startswith('win'):
         ### SIMULATOR ONLY ###
         SRBot.zone, SRBot.sim = getInfo() # I made this to make simlator work
     srBot = SRBot.setup()
     srBot.init()
+    if record is None and RECORD:
+        record = os.path.join(srBot.usbkey, time.strftime(
+            "match-%Y-%m-%d-%H.%M.%S.brk", time.localtime()))
+    if record is not None:
+        from recorder import Recorder
+        Recorder.attach(srBot, record)
     set_time(srBot.usbkey)
     logger = setup_logger(srBot.usbkey)
+    if TRACE:
+        from tracing import Tracer
+        Tracer.GLOBAL.enable(os.path.join(srBot.usbkey, time.strftime(
+            "trace-%Y-%m-%d-%H.%M.%S.json", time.localtime())))
     logger.info('Battery Voltage: %.2f' % (srBot.power.battery.voltage))
     srBot.wait_start()
     try:
@@ -70,11 +99,34 @@ def setup():
         raise
     return robot, srBot.zone
 
+def stop_at_end(robot):
+    """Stops the robot once the match is over, so its stats are logged and
+    the trace and recording are written out. That is MATCH_LENGTH seconds
+    after it started, or sooner if the kit terminates us. Whoever runs the
+    game stops the robot when it returns too: atexit is no use, python only
+    runs it once the robot's threads end and they run until it stops."""
+    from clock import Clock
+    def end_of_match():
+        Clock.GLOBAL.sleep(MATCH_LENGTH)
+        robot.stop()
+    timer = threading.Thread(target=end_of_match, name='EndOfMatch')
+    timer.daemon = True
+    Clock.GLOBAL.register(timer)
+    timer.start()
+    def terminated(signum, frame):
+        robot.stop()
+        sys.exit(0)
+    signal.signal(signal.SIGTERM, terminated)
+
 if __name__ == '__main__' or __name__ == '__builtin__':
     robot, corner = setup()
-    if TEST_MODE:
-        import tests
-        tests.testRunner(robot)
-    else:
-        import gamelogic
-        gamelogic.PlayGame(robot, corner)
+    stop_at_end(robot)
+    try:
+        if TEST_MODE:
+            import tests
+            tests.testRunner(robot)
+        else:
+            import gamelogic
+            gamelogic.PlayGame(robot, corner)
+    finally:
+        robot.stop()
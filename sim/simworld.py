@@ -0,0 +1,378 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# A 2D model of the arena and our robot that backs the sr.robot stand-in.
+# See arena.py for the coordinate system.
+
+import math
+import random
+import tempfile
+import threading
+
+import arena
+from clock import Clock
+from controllers.motor import MOTOR_MAP, MOTOR_RPM
+from sr.robot.ruggeduino import INPUT_PULLUP, Ruggeduino
+from sr.robot.vision import (MARKER_ARENA, MARKER_ROBOT, MARKER_FLAG,
+                             MarkerInfo, PolarCoord, Point, Orientation,
+                             Marker)
+
+ROBOT_RADIUS = 0.25
+FLAG_RADIUS = 0.12
+
+# Bump switch and flag plate positions in the robot frame, x forwards and
+# y to the right
+BUMP_POINTS = {
+    'FL': (0.27, -0.15),
+    'FR': (0.27, 0.15),
+    'FM': (0.27, 0.0)
+}
+PLATE_POINT = (0.35, 0.0)
+
+CAMERA_HEIGHT = 0.5
+CAMERA_FOV = 62.0
+# Furthest a wall marker can be read at 960 pixels wide, scales with width
+CAMERA_RANGE = 6.0
+# Markers closer than this are below the camera's view
+CAMERA_MIN_RANGE = 0.4
+# Markers turned further than this from the camera can't be read
+MAX_MARKER_ANGLE = 70.0
+
+# Seconds to take and scan a 960x720 frame, scaled by pixel count
+CAPTURE_TIME = {'cam': 0.02, 'yuyv': 0.05, 'find_markers': 0.35}
+
+# Seconds for the arm to travel fully at full power
+ARM_TRAVEL_TIME = 1.2
+
+STEP = 0.01
+
+# Slowest forwards speed, in m/s, that counts as pushing into an obstacle.
+# Stopped motors are held at 1% power, which doesn't count
+PUSH_SPEED = 0.05
+
+class MatchOver(Exception):
+    pass
+
+class Motor(object):
+    def __init__(self, world):
+        self._world = world
+        self._power = 0
+
+    @property
+    def power(self):
+        return self._power
+
+    @power.setter
+    def power(self, value):
+        self._world.update()
+        self._power = max(-100, min(100, value))
+
+class MotorBoard(object):
+    def __init__(self, world):
+        self.m0 = Motor(world)
+        self.m1 = Motor(world)
+
+class ServoBoard(object):
+    def __init__(self, world):
+        self._world = world
+        self._angles = [0] * 8
+
+    def __getitem__(self, slot):
+        return self._angles[slot]
+
+    def __setitem__(self, slot, angle):
+        self._world.update()
+        self._angles[slot] = angle
+
+class Flag(object):
+    def __init__(self, code, x, y):
+        self.code = code
+        self.x = x
+        self.y = y
+        self.carried = False
+
+class World(object):
+    """The state of one match: our robot's pose, arm and camera, the flags
+    and the other robots, advanced in STEP sized increments whenever
+    something reads or changes it."""
+
+    CURRENT = None
+
+    def __init__(self, zone=0, seed=0, other_robots=True, usbkey=None):
+        self.zone = zone
+        self.usbkey = usbkey or tempfile.mkdtemp(prefix='srsim')
+        self.time = Clock.GLOBAL.monotonic
+        self.lock = threading.RLock()
+        self.rand = random.Random(seed)
+        self.x, self.y, self.heading = arena.start_pose(zone)
+        self.arm = 0.0
+        self.flags = [Flag(arena.FLAG_CODES[z], *arena.flag_start(z))
+                      for z in range(4)]
+        self.robots = []
+        if other_robots:
+            self.robots = [(arena.ROBOT_CODES[z],) + arena.start_pose(z)[:2]
+                           for z in range(4) if z != zone]
+        self.stalled_time = 0.0
+        # How long each contact of a bump switch with a wall, barrier or
+        # robot lasted while the wheels kept driving forwards
+        self.pushes = []
+        self._pushing = 0.0
+        self.odometer = 0.0
+        self.running = False
+        self.finished = False
+        self.started = None
+        self.last = None
+        self._build_hardware()
+
+    def _build_hardware(self):
+        wheel, arm = MOTOR_MAP['WHEEL'], MOTOR_MAP['ARM']
+        self.motor_boards = {
+            wheel['sr_serial']: MotorBoard(self),
+            arm['sr_serial']: MotorBoard(self)
+        }
+        def channel(info, id):
+            return getattr(self.motor_boards[info['sr_serial']],
+                           'm%d' % info['type_ids'][id]['channel'])
+        def speed(info, id):
+            rpm = MOTOR_RPM[info['motor_model']] + \
+                  info['type_ids'][id]['rpmoffset']
+            return rpm / 60.0 * math.pi * info['diameter']
+        self.l_motor = channel(wheel, 'LEFT')
+        self.r_motor = channel(wheel, 'RIGHT')
+        self.arm_motor = channel(arm, 'MAIN')
+        self.l_speed = speed(wheel, 'LEFT')
+        self.r_speed = speed(wheel, 'RIGHT')
+        self.servo_boards = [ServoBoard(self)]
+        self.ruggeduinos = {}
+        self.pins = {}
+        from controllers.ruggeduino import PIN_MAP
+        for type, (serial, ids) in PIN_MAP.items():
+            if serial not in self.ruggeduinos:
+                self.ruggeduinos[serial] = Ruggeduino(self, serial)
+            for id, pin in ids.items():
+                self.pins[(serial, pin)] = (type, id)
+
+    def start(self):
+        from main import Robot
+        with self.lock:
+            self.wheel_span = Robot.WHEEL_SPAN
+            self.running = True
+            self.started = self.last = self.time()
+
+    def stop(self):
+        """Ends the match, the world is frozen and any further use of the
+        hardware raises MatchOver."""
+        with self.lock:
+            self.update()
+            self.finished = True
+
+    def update(self):
+        with self.lock:
+            if self.finished:
+                raise MatchOver()
+            if not self.running:
+                return
+            now = self.time()
+            while now - self.last > 1e-9:
+                dt = min(STEP, now - self.last)
+                self._step(dt)
+                self.last += dt
+
+    def _step(self, dt):
+        v_l = self.l_motor.power / 100.0 * self.l_speed
+        v_r = self.r_motor.power / 100.0 * self.r_speed
+        v = (v_l + v_r) / 2
+        self.heading = arena.normalize(
+            self.heading + math.degrees((v_l - v_r) / self.wheel_span * dt))
+        rad = math.radians(self.heading)
+        nx = self.x + v * math.cos(rad) * dt
+        ny = self.y + v * math.sin(rad) * dt
+        if self._move_to(nx, ny):
+            self.odometer += abs(v * dt)
+        else:
+            self.stalled_time += dt
+        if v > PUSH_SPEED and self._bump_blocked():
+            self._pushing += dt
+        elif self._pushing:
+            self.pushes.append(self._pushing)
+            self._pushing = 0.0
+        self.arm = max(0.0, min(1.0, self.arm + self.arm_motor.power / 100.0
+                                * dt / ARM_TRAVEL_TIME))
+        self._update_flags()
+
+    def _blocked(self, x, y, radius):
+        if x < radius or y < radius or x > arena.SIZE - radius or \
+           y > arena.SIZE - radius:
+            return True
+        for x1, y1, x2, y2 in arena.BARRIERS:
+            dx = max(x1 - x, 0, x - x2)
+            dy = max(y1 - y, 0, y - y2)
+            if dx * dx + dy * dy <= radius * radius:
+                return True
+        for code, rx, ry in self.robots:
+            if math.hypot(x - rx, y - ry) < radius + ROBOT_RADIUS:
+                return True
+        return False
+
+    def _move_to(self, x, y):
+        if self._blocked(x, y, ROBOT_RADIUS):
+            return False
+        pushed = []
+        for flag in self.flags:
+            if flag.carried:
+                continue
+            gap = math.hypot(flag.x - x, flag.y - y)
+            overlap = ROBOT_RADIUS + FLAG_RADIUS - gap
+            if overlap <= 0:
+                continue
+            ux, uy = (flag.x - x) / gap, (flag.y - y) / gap
+            fx, fy = flag.x + ux * overlap, flag.y + uy * overlap
+            if self._blocked(fx, fy, FLAG_RADIUS):
+                return False
+            pushed.append((flag, fx, fy))
+        for flag, fx, fy in pushed:
+            flag.x, flag.y = fx, fy
+        self.x, self.y = x, y
+        return True
+
+    def _bump_blocked(self):
+        return any(self._blocked(*self._to_world(p) + (0,))
+                   for p in BUMP_POINTS.values())
+
+    def _to_world(self, point):
+        rad = math.radians(self.heading)
+        px, py = point
+        return (self.x + px * math.cos(rad) - py * math.sin(rad),
+                self.y + px * math.sin(rad) + py * math.cos(rad))
+
+    def _flag_at_plate(self):
+        px, py = self._to_world(PLATE_POINT)
+        for flag in self.flags:
+            if math.hypot(flag.x - px, flag.y - py) < FLAG_RADIUS:
+                return flag
+        return None
+
+    def _update_flags(self):
+        if self.arm < 0.5:
+            for flag in self.flags:
+                flag.carried = False
+        elif self.arm > 0.9:
+            flag = self._flag_at_plate()
+            if flag is not None:
+                flag.carried = True
+        for flag in self.flags:
+            if flag.carried:
+                flag.x, flag.y = self._to_world(PLATE_POINT)
+
+    def is_pressed(self, type, id):
+        """Whether the switch of the given PIN_MAP type and id is pressed."""
+        with self.lock:
+            self.update()
+            if type == 'ARM_SWITCH':
+                return self.arm > 0.97
+            if type == 'FLAG_SENSOR':
+                return self._flag_at_plate() is not None
+            if type == 'BUMP':
+                x, y = self._to_world(BUMP_POINTS[id])
+                if self._blocked(x, y, 0):
+                    return True
+                return any(math.hypot(f.x - x, f.y - y) < FLAG_RADIUS
+                           for f in self.flags)
+            return False
+
+    def read_pin(self, serial, pin):
+        type, id = self.pins[(serial, pin)]
+        pressed = self.is_pressed(type, id)
+        board = self.ruggeduinos[serial]
+        if board.modes.get(pin) == INPUT_PULLUP:
+            # Switches pull the pin low when pressed
+            return not pressed
+        return pressed
+
+    def camera_heading(self):
+        # The pivot points forwards at its max angle and backwards at its min
+        return self.heading if self.servo_boards[0][0] > 0 else \
+            arena.normalize(self.heading + 180)
+
+    def see(self, res):
+        """Returns (markers, timings) for a frame taken now, after waiting as
+        long as the real camera would take."""
+        with self.lock:
+            self.update()
+            stamp = self.time()
+            markers = self._visible_markers(res, stamp)
+        scale = (res[0] * res[1]) / (960.0 * 720.0)
+        timings = dict((k, v * scale if k != 'cam' else v)
+                       for k, v in CAPTURE_TIME.items())
+        Clock.GLOBAL.sleep(sum(timings.values()))
+        return markers, timings
+
+    def _visible_markers(self, res, stamp):
+        cam = self.camera_heading()
+        max_range = CAMERA_RANGE * res[0] / 960.0
+        targets = []
+        for code, (x, y, facing) in arena.WALL_MARKERS.items():
+            targets.append((code, MARKER_ARENA, arena.WALL_MARKER_SIZE, x, y,
+                            facing, 0.05))
+        for flag in self.flags:
+            # Flags have a marker on every side, use the one most face on
+            facing = arena.bearing(flag.x, flag.y, self.x, self.y)
+            facing = round(facing / 90.0) * 90.0
+            targets.append((flag.code, MARKER_FLAG, arena.FLAG_SIZE, flag.x,
+                            flag.y, facing, 0.01))
+        for code, x, y in self.robots:
+            facing = arena.bearing(x, y, self.x, self.y)
+            targets.append((code, MARKER_ROBOT, 0.1, x, y, facing, 0.25))
+        markers = []
+        for code, marker_type, size, x, y, facing, lift in targets:
+            flat = math.hypot(x - self.x, y - self.y)
+            if flat < CAMERA_MIN_RANGE or flat > max_range * size / 0.25:
+                continue
+            ray = arena.bearing(self.x, self.y, x, y)
+            rot_y = arena.normalize(ray - cam)
+            if abs(rot_y) > CAMERA_FOV / 2:
+                continue
+            orient = arena.normalize(facing + 180 - ray)
+            if abs(orient) > MAX_MARKER_ANGLE:
+                continue
+            if self._occluded(x, y):
+                continue
+            height = CAMERA_HEIGHT - (lift + size / 2)
+            dist = math.hypot(flat, height) * (1 + self.rand.gauss(0, 0.01))
+            rot_y += self.rand.gauss(0, 0.5)
+            rot_x = math.degrees(math.atan2(-height, flat))
+            markers.append(Marker(MarkerInfo(code, marker_type, code, size),
+                                  stamp, res,
+                                  Point(PolarCoord(dist, rot_x, rot_y)),
+                                  Orientation(0, orient, 0)))
+        return markers
+
+    def _occluded(self, x, y):
+        # Sample along the line of sight against the barrier
+        steps = int(math.hypot(x - self.x, y - self.y) / 0.1)
+        for i in range(1, steps):
+            t = float(i) / steps
+            px, py = self.x + (x - self.x) * t, self.y + (y - self.y) * t
+            for x1, y1, x2, y2 in arena.BARRIERS:
+                if x1 <= px <= x2 and y1 <= py <= y2:
+                    return True
+        return False
+
+    def summary(self):
+        """Where everything ended up, and which flags are in which zone."""
+        with self.lock:
+            zones = dict((z, [f.code for f in self.flags
+                              if arena.in_zone(z, f.x, f.y)])
+                         for z in range(4))
+            return {
+                'match_time': self.last - self.started if self.started else 0,
+                'pose': (self.x, self.y, self.heading),
+                'flags': dict((f.code, (f.x, f.y)) for f in self.flags),
+                'zone_flags': zones,
+                'score': len(zones[self.zone]),
+                'stalled_time': self.stalled_time,
+                'max_push': max(self.pushes + [self._pushing]),
+                'odometer': self.odometer
+            }
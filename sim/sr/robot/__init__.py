@@ -0,0 +1,47 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# A stand-in for the Student Robotics sr.robot package, backed by the arena
+# model in simworld. Put the sim directory first on sys.path to use it.
+
+class _Battery(object):
+    voltage = 12.0
+
+class _Power(object):
+    battery = _Battery()
+
+class Robot(object):
+    zone = 0
+    mode = 'dev'
+
+    def __init__(self, world):
+        self._world = world
+        self.zone = world.zone
+        self.usbkey = world.usbkey
+        self.power = _Power()
+        self.motors = {}
+        self.ruggeduinos = {}
+        self.servos = []
+
+    @classmethod
+    def setup(cls):
+        from simworld import World
+        if World.CURRENT is None:
+            World.CURRENT = World(cls.zone)
+        return cls(World.CURRENT)
+
+    def init(self):
+        self.motors = self._world.motor_boards
+        self.ruggeduinos = self._world.ruggeduinos
+        self.servos = self._world.servo_boards
+
+    def wait_start(self):
+        self._world.start()
+
+    def see(self, res=(800, 600), stats=False):
+        markers, timings = self._world.see(res)
+        if stats:
+            return markers, timings
+        return markers
@@ -0,0 +1,33 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+INPUT = 'INPUT'
+OUTPUT = 'OUTPUT'
+INPUT_PULLUP = 'INPUT_PULLUP'
+
+class Ruggeduino(object):
+    """A ruggeduino running the SR firmware whose pins are wired to the
+    simulated robot."""
+
+    def __init__(self, world, serial):
+        self._world = world
+        self.serialnum = serial
+        self.modes = {}
+        self.levels = {}
+
+    def _is_srduino(self):
+        return True
+
+    def pin_mode(self, pin, mode):
+        self.modes[pin] = mode
+
+    def digital_read(self, pin):
+        return self._world.read_pin(self.serialnum, pin)
+
+    def digital_write(self, pin, level):
+        self.levels[pin] = level
+
+    def analogue_read(self, pin):
+        return 0.0
@@ -0,0 +1,58 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+MARKER_ARENA = 'arena'
+MARKER_ROBOT = 'robot'
+MARKER_FLAG = 'flag'
+
+class MarkerInfo(object):
+    def __init__(self, code, marker_type, offset, size):
+        self.code = code
+        self.marker_type = marker_type
+        self.offset = offset
+        self.size = size
+
+class PolarCoord(object):
+    def __init__(self, length, rot_x, rot_y):
+        self.length = length
+        self.rot_x = rot_x
+        self.rot_y = rot_y
+
+class Point(object):
+    def __init__(self, polar):
+        self.polar = polar
+
+class Orientation(object):
+    def __init__(self, rot_x, rot_y, rot_z):
+        self.rot_x = rot_x
+        self.rot_y = rot_y
+        self.rot_z = rot_z
+
+class Marker(object):
+    """A marker as returned by Robot#see, with the attributes of the real
+    kit's markers that this code base uses."""
+
+    def __init__(self, info, timestamp, res, centre, orientation):
+        self.info = info
+        self.timestamp = timestamp
+        self.res = res
+        self.centre = centre
+        self.orientation = orientation
+
+    @property
+    def dist(self):
+        return self.centre.polar.length
+
+    @property
+    def rot_x(self):
+        return self.centre.polar.rot_x
+
+    @property
+    def rot_y(self):
+        return self.centre.polar.rot_y
+
+    def __repr__(self):
+        return "Marker(code=%d, type=%s, dist=%.2f, rot_y=%.1f)" % (
+            self.info.code, self.info.marker_type, self.dist, self.rot_y)
@@ -0,0 +1,125 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Runs a whole match against the simulated arena in sim/, no kit needed:
+#     python simulate.py [zone] [seconds] [--realtime] [--trace file.json]
+#                        [--record file.brk]
+# Unless --realtime is given the match runs on a VirtualClock, as fast as
+# the code allows. --trace writes a Chrome trace of the match, see tracing.py,
+# and --record a recording that replay.py can play back. Exits with 1 if the
+# robot kept driving into an obstacle for longer than MAX_PUSH.
+
+import logging
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'sim'))
+
+from clock import Clock, RealClock, VirtualClock
+from simworld import World
+from tracing import Tracer
+
+MATCH_LENGTH = 180
+
+# How often run_match checks its until condition, in match seconds
+POLL_INTERVAL = 0.1
+
+# How long the game thread is given to wind down once the match is over
+STOP_WAIT = 2.0
+
+# Longest the robot may keep driving into an obstacle its bump switches are
+# touching: debouncing, the bus and cancelling the move all take a little
+MAX_PUSH = 0.25
+
+def reset_globals():
+    """Forgets state a previous match left in module level registries."""
+    from event_bus import EventBus
+    EventBus.GLOBAL.close()
+    EventBus.GLOBAL = EventBus()
+    logger = logging.getLogger('Robot')
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+def use_clock(realtime):
+    """Installs the clock matches run on. The virtual clock is kept for the
+    rest of the process, threads left over from earlier matches wait on it."""
+    if realtime:
+        Clock.GLOBAL = RealClock()
+    elif not isinstance(Clock.GLOBAL, VirtualClock):
+        Clock.GLOBAL = VirtualClock()
+
+def start_game(bot, corner):
+    """Runs PlayGame on its own thread, as robot.py would on the robot."""
+    import gamelogic
+    game = threading.Thread(target=gamelogic.PlayGame, args=(bot, corner),
+                            name='Game')
+    game.daemon = True
+    Clock.GLOBAL.register(game)
+    game.start()
+    return game
+
+def wind_down(game, bot):
+    """Gives the game thread time to trip over the stopped hardware and
+    finish its logging, and the stopped robot's threads time to end so none
+    of them is left running on the clock into the next match."""
+    threads = [game, bot.wheels.scheduler] + bot.threads.threads
+    for i in range(int(STOP_WAIT / POLL_INTERVAL)):
+        if not any(thread.is_alive() for thread in threads):
+            break
+        Clock.GLOBAL.sleep(POLL_INTERVAL)
+
+def run_match(zone=0, duration=MATCH_LENGTH, seed=0, realtime=False,
+              until=None, trace=None, record=None):
+    """Plays one match as the robot in the given zone and returns the
+    summary of the world at the end of it. The match ends early once
+    until(world), if given, returns true. If trace or record are paths the
+    match's timeline or a recording are written there."""
+    use_clock(realtime)
+    if trace is not None:
+        Tracer.GLOBAL.clear()
+        Tracer.GLOBAL.enable(trace)
+    import robot as robot_setup
+    reset_globals()
+    world = World(zone, seed=seed)
+    World.CURRENT = world
+    bot, corner = robot_setup.setup(record)
+    game = start_game(bot, corner)
+    end = Clock.GLOBAL.monotonic() + duration
+    if until is None:
+        Clock.GLOBAL.sleep_until(end)
+    else:
+        while Clock.GLOBAL.monotonic() < end:
+            with world.lock:
+                if until(world):
+                    break
+            Clock.GLOBAL.sleep(POLL_INTERVAL)
+    bot.stop()
+    Tracer.GLOBAL.disable()
+    world.stop()
+    wind_down(game, bot)
+    World.CURRENT = None
+    summary = world.summary()
+    summary['estimated_pose'] = bot.pose.pose
+    return summary
+
+if __name__ == '__main__':
+    options = {}
+    for name in ('--trace', '--record'):
+        if name in sys.argv:
+            options[name[2:]] = sys.argv.pop(sys.argv.index(name) + 1)
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    zone = int(args[0]) if len(args) > 0 else 0
+    duration = float(args[1]) if len(args) > 1 else MATCH_LENGTH
+    summary = run_match(zone, duration, realtime='--realtime' in sys.argv,
+                        **options)
+    for key in sorted(summary):
+        print "%s: %s" % (key, summary[key])
+    if summary['max_push'] > MAX_PUSH:
+        print "Kept pushing into an obstacle for %.2fs, more than %.2fs" % (
+            summary['max_push'], MAX_PUSH)
+        sys.exit(1)
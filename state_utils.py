@@ -3,11 +3,20 @@
     MIT License. A copy of the MIT License can be found in LICENSE.txt
 """
 
+import logging
+import sys
+import threading
+import types
+
+from clock import Clock
 from event_bus import EventBus
+from threads import Future
+from tracing import Tracer
 
 class State(object):
     def __init__(self, name):
         self.name = name
+        self.id = None
         self.listeners = []
         self.count = [0, 0, 0]
         self.was_interrupted = False
@@ -17,19 +26,31 @@ class State(object):
             return self
         raise TypeError("Callback is not callable")
     def action(self, host, *args):
+        with Tracer.GLOBAL.span(self.name, 'state'):
+            self._run_listeners(host, args)
+    def _run_listeners(self, host, args):
         self.was_interrupted = False
         errors = []
+        tracer = Tracer.GLOBAL
         for listener in self.listeners:
             try:
-                listener(*args)
-                self.count[0] += 1
+                with tracer.span(getattr(listener, '__name__', 'listener'),
+                                 'listener'):
+                    si = host.run_listener(listener, args)
             except StateInterrupt as si:
-                self.was_interrupted = True
-                host.bus.post('interrupt', (self, si))
-                self.count[2] += 1
+                pass
             except Exception as e:
                 errors.append({'listener':listener, 'exception':e})
                 self.count[1] += 1
+                continue
+            if si is None:
+                self.count[0] += 1
+            else:
+                self.was_interrupted = True
+                tracer.instant('interrupt', 'state', state=self.name,
+                               reason=str(si.id))
+                host.bus.post('interrupt', (self, si))
+                self.count[2] += 1
         if len(errors) > 0:
             host.bus.post('error', (self, errors))
             host.active_state = None
@@ -47,21 +68,112 @@ class StateRegister:
         self.states = [[], {}]
     def register_state(self, state):
         if isinstance(state, State):
+            state.id = len(self.states[0])
             self.states[0].append(state)
             self.states[1][state.name] = state
     def get_state(self, name):
+        """The state with the given name, or id if an int."""
+        if isinstance(name, (int, long)):
+            return self.states[0][name]
         return self.states[1][name]
     def get_state_id(self, name):
-        return self.states[0].index(self.states[1][name])
+        return self.states[1][name].id
     def bind_states(self, state_dict):
         for name, func in state_dict.iteritems():
             self.get_state(name).bind(func)
 
+class StateGraphError(Exception):
+    pass
+
+class TransitionTable(object):
+    """A declared state graph checked against a StateRegister, for catching
+    a wrong transition at startup and logging one made mid-match rather
+    than for speed: for every state id, the set of ids it may go to.
+    transitions maps each state name to the names it sets next.
+    Raises StateGraphError if a name isn't a registered state or a
+    registered state isn't declared. States that can't be reached from
+    initial are kept in unreachable."""
+
+    def __init__(self, register, transitions, initial='MAIN'):
+        states = register.states[0]
+        self.names = [state.name for state in states]
+        undefined = set([initial]) | set(transitions)
+        for targets in transitions.values():
+            undefined.update(targets)
+        undefined.difference_update(self.names)
+        if undefined:
+            raise StateGraphError("Undefined states %s" %
+                                  ", ".join(sorted(undefined)))
+        undeclared = set(self.names) - set(transitions)
+        if undeclared:
+            raise StateGraphError("States %s have no declared transitions" %
+                                  ", ".join(sorted(undeclared)))
+        self.initial = register.get_state_id(initial)
+        self.edges = [frozenset(register.get_state_id(name)
+                                for name in transitions[state.name])
+                      for state in states]
+        self.counts = [[0] * len(states) for state in states]
+        reached = set([self.initial])
+        frontier = [self.initial]
+        while frontier:
+            for target in self.edges[frontier.pop()]:
+                if target not in reached:
+                    reached.add(target)
+                    frontier.append(target)
+        self.unreachable = [self.names[i] for i in range(len(states))
+                            if i not in reached]
+
+    def allowed(self, source, target):
+        """Whether the state with id source may go to target. Any state may
+        be set while none is active."""
+        if source is None:
+            return True
+        return target in self.edges[source]
+
+    def taken(self, source, target):
+        if source is not None:
+            self.counts[source][target] += 1
+
+    def export(self):
+        """The graph by name, with how often each transition was taken."""
+        return {
+            'initial': self.names[self.initial],
+            'unreachable': list(self.unreachable),
+            'transitions': dict(
+                (self.names[i], dict((self.names[j], self.counts[i][j])
+                                     for j in sorted(edges)))
+                for i, edges in enumerate(self.edges))
+        }
+
+    def to_dot(self):
+        """The graph in Graphviz dot, edges labelled with their counts."""
+        lines = ['digraph states {',
+                 '    "%s" [shape=doublecircle];' % self.names[self.initial]]
+        for name in self.unreachable:
+            lines.append('    "%s" [style=dashed];' % name)
+        for i, edges in enumerate(self.edges):
+            for j in sorted(edges):
+                lines.append('    "%s" -> "%s" [label=%d];' % (
+                    self.names[i], self.names[j], self.counts[i][j]))
+        lines.append('}')
+        return "\n".join(lines)
+
 class StateObserver:
     def __init__(self, stateregister):
         self.bus = EventBus()
         self.register = stateregister
         self.active_state = None
+        self.table = None
+
+    def compile(self, transitions, initial='MAIN'):
+        """Builds the TransitionTable of the declared transitions. From then
+        on set_state also checks each transition, and logs any that wasn't
+        declared."""
+        self.table = TransitionTable(self.register, transitions, initial)
+        if self.table.unreachable:
+            logging.getLogger('Robot.States').warning(
+                "Unreachable states %s", ", ".join(self.table.unreachable))
+        return self.table
 
     def bind(self, event, callback):
         self.bus.register(event, callback)
@@ -72,8 +184,24 @@ class StateObserver:
     def change_state(self, state):
         state.action(self, *self.active_state_args)
 
+    def run_listener(self, listener, args):
+        """Runs one of the active state's listeners. Returns None, or the
+        StateInterrupt that stopped it without being raised."""
+        listener(*args)
+        return None
+
     def set_state(self, name, args=[]):
+        """Sets the state with the given name, or id if an int."""
         state = self.register.get_state(name)
+        if self.table is not None:
+            source = self.active_state.id \
+                if self.active_state is not None else None
+            if not self.table.allowed(source, state.id):
+                logging.getLogger('Robot.States').error(
+                    "Undeclared transition from %s to %s", self.active_state,
+                    state)
+            self.table.taken(source, state.id)
+        Tracer.GLOBAL.instant('set_state', 'state', state=state.name)
         self.bus.post('change', (self.active_state, state))
         if self.active_state is not None:
             self.bus.post('finish', self.active_state)
@@ -89,8 +217,10 @@ class StateObserver:
     def get_active_state(self):
         return self.active_state
 
-    def next_state(self):
-        while self.active_state != None:
+    def next_state(self, can_run=lambda: True):
+        """Yields the active state until there is none or can_run returns
+        False."""
+        while self.active_state != None and can_run():
             yield self.active_state
 
     def get_states(self):
@@ -101,8 +231,242 @@ class StateInterrupt(Exception):
         self.id = id
         self.args = args
 
-def StateMachine(states_dict):
+class Wait(object):
+    """Yielded by a cooperative state to wait for seconds."""
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+class Call(object):
+    """Yielded by a cooperative state to have fn(*args, **kwargs) called, for
+    work that blocks such as a scan. The result is sent back."""
+    def __init__(self, fn, *args, **kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+class Return(object):
+    """Yielded by a generator yielded from a cooperative state, to end it and
+    have value sent back to the generator that yielded it."""
+    def __init__(self, value=None):
+        self.value = value
+
+class CooperativeObserver(StateObserver):
+    """Runs listeners that are generators a yield at a time, other listeners
+    run as they do in StateObserver. A generator yields what it waits on:
+    a Future (such as a move made with async=True), a Wait, a Call, None
+    to only let others in, or a list of those to have them all overlap.
+    The result, or list of results, is sent back in. A Future cancelled by
+    someone else, such as a move preempted by another, sends back None.
+    It can also yield another generator, which is run in its place until it
+    yields a Return or ends, and whose Return value is sent back.
+    At every yield the state can be preempted, the generators are closed and
+    any Future waited on is cancelled. Preempting is interrupt(), a state
+    requested by request_state() with a higher priority than the active
+    one, or the timeout given to set_state() running out. A timed out state
+    posts 'timeout' and ends unless a handler sets another. Work that blocks
+    for long inside a Call can check preempted() to give up early, what it
+    raises then is dropped for the preemption."""
+
+    def __init__(self, stateregister):
+        StateObserver.__init__(self, stateregister)
+        self._cond = threading.Condition()
+        self._interrupt = None
+        self._pending = None
+        self._timeout = None
+        self._deadline = None
+        self.active_priority = 0
+
+    def set_state(self, name, args=[], timeout=None, priority=0):
+        """Sets the state like StateObserver, preempted at a yield once
+        timeout seconds have passed, by interrupts and requests of a higher
+        priority only. A pending request for the same state is dropped, as
+        is an interrupt, it was meant for the state being replaced."""
+        state = self.register.get_state(name)
+        with self._cond:
+            self._timeout = timeout
+            self.active_priority = priority
+            self._interrupt = None
+            if self._pending is not None and \
+                    self.register.get_state(self._pending[0]) is state:
+                self._pending = None
+        StateObserver.set_state(self, name, args)
+
+    def request_state(self, name, args=[], priority=1, timeout=None):
+        """Asks for a state from any thread. It preempts the active state if
+        its priority is higher, otherwise it follows once no state is
+        active. Only the highest priority request is kept."""
+        with self._cond:
+            if self._pending is None or priority > self._pending[2]:
+                self._pending = (name, args, priority, timeout)
+            self._cond.notify_all()
+
+    def interrupt(self, reason='interrupt', priority=None):
+        """Preempts the active state at its next yield, if it was set with a
+        lower priority or priority is None."""
+        with self._cond:
+            self._interrupt = (StateInterrupt(reason), priority)
+            self._cond.notify_all()
+
+    def preempted(self):
+        """Whether the active state is to be preempted at its next yield."""
+        with self._cond:
+            return self._preemption(Clock.GLOBAL.monotonic()) is not None
+
+    def change_state(self, state):
+        with self._cond:
+            self._deadline = None
+            if self._timeout is not None:
+                self._deadline = Clock.GLOBAL.monotonic() + self._timeout
+        StateObserver.change_state(self, state)
+        with self._cond:
+            # Whatever came in while no generator was yielding is stale
+            self._interrupt = None
+            pending = self._pending
+            if pending is not None and (self.active_state is None or
+                                        pending[2] > self.active_priority):
+                self._pending = None
+            else:
+                pending = None
+        if pending is not None:
+            self.set_state(pending[0], pending[1], pending[3], pending[2])
+
+    def run_listener(self, listener, args):
+        result = listener(*args)
+        if not isinstance(result, types.GeneratorType):
+            return None
+        return self._drive(result)
+
+    def _preemption(self, now=None):
+        # Must hold _cond. The timeout is only looked at given the time, as
+        # predicates waited on mustn't read the clock
+        if self._interrupt is not None:
+            si, priority = self._interrupt
+            if priority is None or priority > self.active_priority:
+                return si
+        if self._pending is not None and \
+                self._pending[2] > self.active_priority:
+            return StateInterrupt('preempt', self._pending[0])
+        if now is not None and self._deadline is not None and \
+                now >= self._deadline:
+            return StateInterrupt('timeout', self._deadline)
+        return None
+
+    def _drive(self, gen):
+        # The generators yielded from each other, innermost last
+        stack = [gen]
+        send, error = None, None
+        while True:
+            gen = stack[-1]
+            try:
+                if error is not None:
+                    request = gen.throw(*error)
+                else:
+                    request = gen.send(send)
+            except StopIteration:
+                request = Return()
+            except Exception:
+                stack.pop()
+                if not stack:
+                    raise
+                send, error = None, sys.exc_info()
+                continue
+            send, error = None, None
+            if isinstance(request, Return):
+                gen.close()
+                stack.pop()
+                if not stack:
+                    return None
+                send = request.value
+                continue
+            if isinstance(request, types.GeneratorType):
+                stack.append(request)
+                continue
+            try:
+                send = self._serve(request)
+            except StateInterrupt:
+                self._abandon(stack, request)
+                raise
+            except Exception:
+                error = sys.exc_info()
+            with self._cond:
+                si = self._preemption(Clock.GLOBAL.monotonic())
+                self._interrupt = None
+            if si is not None:
+                self._abandon(stack, request)
+                if si.id == 'timeout':
+                    self._timed_out()
+                return si
+
+    def _abandon(self, stack, request):
+        for gen in reversed(stack):
+            gen.close()
+        for item in self._items(request):
+            if isinstance(item, Future):
+                item.cancel()
+
+    def _timed_out(self):
+        state = self.active_state
+        self.bus.post('timeout', state)
+        if self.active_state is state:
+            self.active_state = None
+
+    def _items(self, request):
+        if isinstance(request, (list, tuple)):
+            return list(request)
+        return [request]
+
+    def _serve(self, request):
+        items = self._items(request)
+        now = Clock.GLOBAL.monotonic()
+        until = now
+        futures = []
+        for item in items:
+            if isinstance(item, Future):
+                futures.append(item)
+                item.add_done_callback(self._notify)
+            elif isinstance(item, Wait):
+                until = max(until, now + item.seconds)
+        # Calls run while the futures carry on in the background
+        results = [item.fn(*item.args, **item.kwargs)
+                   if isinstance(item, Call) else None for item in items]
+        if not self._wait(futures, until):
+            return None
+        for i, item in enumerate(items):
+            if isinstance(item, Future) and not item.cancelled():
+                results[i] = item.result()
+        if isinstance(request, (list, tuple)):
+            return results
+        return results[0]
+
+    def _notify(self, future):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _wait(self, futures, until):
+        # Returns False if preempted before everything was done
+        clock = Clock.GLOBAL
+        with self._cond:
+            while True:
+                now = clock.monotonic()
+                if self._preemption(now) is not None:
+                    return False
+                waiting = [f for f in futures if not f.done()]
+                if not waiting and now >= until:
+                    return True
+                ends = [t for t in [self._deadline,
+                                    None if waiting else until]
+                        if t is not None]
+                timeout = max(min(ends) - now, 0) if ends else None
+                clock.wait(self._cond, lambda: (
+                    self._preemption() is not None or
+                    (waiting and all(f.done() for f in waiting))), timeout)
+
+def StateMachine(states_dict, cooperative=False):
+    """A state machine of the named actions. With cooperative, actions can
+    be generators, see CooperativeObserver."""
     register = StateRegister()
     for name, fn in states_dict.iteritems():
         register.register_state(State(name).bind(fn))
+    if cooperative:
+        return CooperativeObserver(register)
     return StateObserver(register)
@@ -0,0 +1,87 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+import math
+import threading
+
+class StreamingStat(object):
+    """Summarises a stream of positive values, durations in seconds usually,
+    in constant memory. Mean and variance are kept with Welford's method and
+    percentiles are estimated from a histogram of logarithmic buckets, each
+    1/buckets_per_decade of a decade wide, between low and high. Values
+    outside that range land in the first or last bucket. Safe to read from
+    another thread while values are being added."""
+
+    def __init__(self, low=1e-4, high=100.0, buckets_per_decade=20):
+        self.low = low
+        self._log_low = math.log10(low)
+        self._per_decade = buckets_per_decade
+        size = int(math.ceil((math.log10(high) - self._log_low) *
+                             buckets_per_decade))
+        self._buckets = [0] * size
+        self._lock = threading.Lock()
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+
+    def add(self, value):
+        with self._lock:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (value - self.mean)
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+            self.last = value
+            self._buckets[self._bucket(value)] += 1
+
+    def _bucket(self, value):
+        if value <= self.low:
+            return 0
+        index = int((math.log10(value) - self._log_low) * self._per_decade)
+        return min(index, len(self._buckets) - 1)
+
+    def _bucket_bounds(self, index):
+        return (10 ** (self._log_low + float(index) / self._per_decade),
+                10 ** (self._log_low + float(index + 1) / self._per_decade))
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    def percentile(self, p):
+        """Estimates the value below which p percent of the values fall, or
+        None if there are none yet."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = p / 100.0 * self.count
+            seen = 0
+            for index, n in enumerate(self._buckets):
+                if n and seen + n >= rank:
+                    lower, upper = self._bucket_bounds(index)
+                    # Spread the bucket's values evenly on the log scale
+                    fraction = (rank - seen) / float(n)
+                    value = lower * (upper / lower) ** fraction
+                    return min(max(value, self.min), self.max)
+                seen += n
+            return self.max
+
+    def __str__(self):
+        if not self.count:
+            return "n=0"
+        return "n=%d mean=%.1fms sd=%.1fms min=%.1fms p95=%.1fms " \
+               "max=%.1fms" % (self.count, self.mean * 1000,
+                               self.stddev * 1000, self.min * 1000,
+                               self.percentile(95) * 1000, self.max * 1000)
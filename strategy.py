@@ -5,7 +5,23 @@
 
 import logging
 
+import arena
 from event_bus import EventBus
+from state_utils import Call
+from systems.navigation import Retry
+
+# How far from a flag to stop when driving to where it should be, so it is
+# in good view of the camera
+FLAG_VIEW_DIST = 1.2
+
+# Times to drive the route towards a flag before looking for it from
+# wherever a bump left the robot
+APPROACHES = 2
+
+# Seconds to try stealing a flag, and to try getting it home, before giving
+# up on it
+STEAL_TIME = 90
+HOME_TIME = 90
 
 class StrategyRegistry:
 
@@ -24,8 +40,16 @@ class Strategy:
     def get_states(self):
         return {'MAIN': lambda:None}
 
+    def get_transitions(self):
+        """The names of the states each state may set next, see
+        TransitionTable. None leaves the transitions unchecked."""
+        return {'MAIN': []}
+
     def set_game_util(self, game):
         self.sm = game.sm
+        # Ids of the states for set_state, looked up once
+        for name in self.get_states():
+            setattr(self, name, game.sm.get_register().get_state_id(name))
         self.bot = game.robot
         self.log = logging.getLogger('Robot.Strategy')
         self.corner = game.corner
@@ -44,51 +68,99 @@ class Strategy1(Strategy):
             'GO_BACK': self.back_to_zone
         }
 
+    def get_transitions(self):
+        return {
+            'MAIN': ['DROP_OWN_FLAG'],
+            'DROP_OWN_FLAG': ['STEAL'],
+            'STEAL': ['GO_BACK'],
+            'GO_BACK': ['STEAL']
+        }
+
+    def set_game_util(self, game):
+        Strategy.set_game_util(self, game)
+        self.sm.bus.register('timeout', self.state_timed_out)
+
     def flag_touch(self):
-        pass
+        # Pushed the flag we came for onto the plate, head home rather than
+        # finish the step
+        state = self.sm.get_active_state()
+        if state is not None and state.id == self.STEAL and self.approached:
+            self.sm.request_state(self.GO_BACK, timeout=HOME_TIME)
+
+    def state_timed_out(self, state):
+        if state.id == self.STEAL:
+            self.log.warn("Ran out of time stealing")
+            self.go_back()
+        elif state.id == self.GO_BACK:
+            self.log.warn("Ran out of time finding home")
+            self.steal(self.right_corner)
+
+    def steal(self, corner):
+        # Per steal, not per start: a bump or an obstacle starts it over
+        self.approached = False
+        self.approaches = 0
+        self.sm.set_state(self.STEAL, [self.corners[corner]],
+                          timeout=STEAL_TIME)
+
+    def go_back(self):
+        self.sm.set_state(self.GO_BACK, timeout=HOME_TIME)
 
     def start(self):
         EventBus.GLOBAL.unregister('bump', self._game.handle_bump)
         EventBus.GLOBAL.register('flag_plate_touch', self.flag_touch)
         self.left_corner = (self.corner + 1) % 4
         self.right_corner = (self.corner - 1) % 4
-        own_marker = self.bot.camera.get_markers(sleep=False).filter(
-            lambda m: m.info.marker_type == 'flag').get_closest()
+        markers = yield Call(self.bot.camera.get_markers, sleep=False)
+        own_marker = markers.of_type('flag').get_closest()
         self.own_marker_code = own_marker.info.code \
             if own_marker is not None else -1
-        self.bot.wheels.forward(2, 60)
-        self.bot.arm.down()
-        self.bot.wheels.left(60, 60)
-        self.bot.wheels.forward(1.5, 60)
-        self.sm.set_state('DROP_OWN_FLAG')
+        wheels = self.bot.wheels
+        yield wheels.forward(2, 60, async=True)
+        yield self.bot.arm.down(async=True)
+        yield wheels.left(60, 60, async=True)
+        yield wheels.forward(1.5, 60, async=True)
+        # Bumping into the barrier is the point, don't start over on it
+        self.sm.set_state(self.DROP_OWN_FLAG, priority=1)
 
     def drop_against_barrier(self):
-        self.bot.arm.up()
-        self.bot.wheels.backward(0.5, 60)
+        yield self.bot.arm.up(async=True)
+        yield self.bot.wheels.backward(0.5, 60, async=True)
         EventBus.GLOBAL.register('bump', self._game.handle_bump)
-        self.bot.wheels.left(90, 60)
-        close_wall = self.bot.camera.get_markers().filter(
-            lambda m: m.info.marker_type == 'arena').get_closest()
-        if close_wall is not None:
-            self.bot.wheels.forward(close_wall.dist - 0.4, 60)
-        else:
-            self.bot.wheels.forward(1.2, 60)
-        self.bot.wheels.right(60, 60)
-        self.bot.wheels.forward(1.3, 60)
+        yield self.bot.wheels.left(90, 60, async=True)
+        markers = yield Call(self.bot.camera.get_markers)
+        close_wall = markers.of_type('arena').get_closest()
+        dist = close_wall.dist - 0.4 if close_wall is not None else 1.2
+        yield self.bot.wheels.sequence().forward(dist, 60).right(60, 60) \
+            .forward(1.3, 60).run(async=True)
         self.back_out_if_bumping()
-        self.sm.set_state('STEAL', [self.corners[self.left_corner]])
+        self.steal(self.left_corner)
 
     def steal_flag(self, arena_markers):
+        taken = yield self.bot.navigator.steps('steal_flag', self._steal_step,
+                                               (arena_markers,), attempts=6)
+        if not taken:
+            # Regroup at home and try the other side
+            self.log.warn("Gave up stealing from %s", arena_markers)
+            self.go_back()
+
+    def _steal_step(self, arena_markers):
+        if arena_markers in self.corners and not self.approached and \
+                self.approaches < APPROACHES:
+            # Until an approach gets there, a bump may have cut it short
+            self.approaches += 1
+            self.approached = self.approach_flag(
+                self.corners.index(arena_markers))
         result = self.bot.find_flag(arena_markers, 60)
         if result['result'] == 'navigating':
             if result['nav_success']:
                 if self.bot.flag_sens.read():
-                    self.sm.set_state('GO_BACK')
+                    self.go_back()
+                    return True
                 else:
                     self.log.info("Navigated to marker, not touching")
                     self.bot.wheels.forward(0.5, 60)
                     if self.bot.flag_sens.read():
-                        self.sm.set_state('GO_BACK')
+                        self.go_back()
                     else:
                         self.log.warn("Flag not touching, turn a bit")
                         if 'flag' in result:
@@ -99,33 +171,46 @@ class Strategy1(Strategy):
                             self.bot.wheels.left(deg * 1.5, 50, pivot='wheel')
                         else:
                             self.bot.wheels.right(deg * 1.5, 50, pivot='wheel')
-                        self.sm.set_state('GO_BACK')
+                        self.go_back()
+                return True
             else:
                 self.log.info("Navigation failed")
                 self.bot.wheels.right(15, 60)
-                self.steal_flag(arena_markers)
+                return Retry(arena_markers)
         else:
             self.log.info("Not navigating")
             self.bot.wheels.right(10, 30)
             self.bot.wheels.forward(0.3, 60)
             self.back_out_if_bumping()
-            self.steal_flag(None)
+            return Retry(None)
 
     def back_to_zone(self):
+        home = yield self.bot.navigator.steps('back_to_zone', self._back_step,
+                                              attempts=12)
+        if not home:
+            # Lost, better to keep playing than to keep looking for home
+            self.log.warn("Gave up finding home")
+            self.steal(self.right_corner)
+
+    def _back_step(self):
         arm_wait = self.bot.arm.down(async=True)
         c_pivot_wait = self.bot.camera.look_behind(async=True)
-        arm_wait()
-        c_pivot_wait()
+        arm_wait.result()
+        # The camera can finish turning while we reverse
         self.bot.wheels.backward(1, 80)
+        c_pivot_wait.result()
         walls = self.corners[self.corner]
-        markers = self.bot.camera.get_markers().filter(
-            lambda m: m.info.code in walls)
+        markers = self.bot.camera.get_markers(
+            distance=self.bot.wall_distance(walls)).with_codes(walls)
         if markers.is_empty:
             self.log.info("No home walls found")
-            self.bot.wheels.left(20, 60)
-            self.bot.wheels.backward(1, 60)
+            if self.bot.pose.reliable:
+                self.reverse_towards_zone()
+            else:
+                self.bot.wheels.left(20, 60)
+                self.bot.wheels.backward(1, 60)
             self.back_out_if_bumping()
-            self.back_to_zone()
+            return Retry()
         else:
             target_wall = markers.get_closest()
             if target_wall.rot_y < 0:
@@ -134,26 +219,53 @@ class Strategy1(Strategy):
                 self.bot.wheels.left(target_wall.rot_y, 60)
             #self.bot.face_marker(target_wall, 60)
             self.bot.wheels.backward(target_wall.dist - 0.5, 60)
-            new_m_wall = self.bot.camera.get_markers().filter(
-                lambda m: m.info.code == target_wall.info.code).get_closest()
+            # No farther than before reversing towards it
+            new_m_wall = self.bot.camera.get_markers(
+                distance=target_wall.dist).get_by_code(target_wall.info.code)
             if new_m_wall is None:
                 self.bot.wheels.left(20, 50)
                 self.bot.wheels.backward(0.3, 60)
-                self.back_to_zone()
-                return
+                return Retry()
             self.bot.arm.up()
             c_pivot_wait = self.bot.camera.look_forward(async=True)
             self.bot.wheels.right(60, 60)
             c_pivot_wait()
             self.bot.wheels.forward(2, 60)
             self.back_out_if_bumping()
-            self.sm.set_state('STEAL', [self.corners[self.right_corner]])
+            self.steal(self.right_corner)
+            return True
+
+    def approach_flag(self, zone):
+        """Drives the planned route towards where the zone's flag started,
+        stopping short enough for the camera to pick it up. Returns True if
+        the robot got there or was already close enough."""
+        x, y = arena.flag_start(zone)
+        if self.bot.pose.distance_to(x, y) <= 2 * FLAG_VIEW_DIST:
+            return True
+        self.log.info("Heading for the flag of zone %d", zone)
+        return bool(self.bot.drive_to(x, y, 60, stop_short=FLAG_VIEW_DIST))
+
+    def reverse_towards_zone(self):
+        """Reverses home along the planned route, the camera facing the way.
+        Without a route, turns the back of the robot towards home by the
+        pose and reverses part of the way there."""
+        x, y = arena.zone_center(self.corner)
+        if self.bot.drive_to(x, y, 60, reverse=True) is not None:
+            return
+        turn = self.bot.pose.turn_to(x, y, reverse=True)
+        dist = min(self.bot.pose.distance_to(x, y), 1.5)
+        self.log.info("Reversing %.2fm towards home from %s", dist,
+                      self.bot.pose)
+        if turn < 0:
+            self.bot.wheels.left(turn, 60)
+        else:
+            self.bot.wheels.right(turn, 60)
+        self.bot.wheels.backward(dist, 60)
 
     def back_out_if_bumping(self):
         if self.bot.is_bumping():
             self.log.info("Bumped, go back")
-            self.bot.wheels.backward(0.4, 60)
-            self.bot.wheels.right(30, 60)
+            self.bot.wheels.sequence().backward(0.4, 60).right(30, 60).run()
 
 class TestMode(Strategy):
     def get_states(self):
@@ -0,0 +1,163 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+import logging
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import arena
+from event_bus import EventBus
+from systems.vision import VisionSystem
+
+# Standard deviation of a wall marker's position as seen, at 0m and growing
+# per meter away
+SEEN_SIGMA = 0.05
+SEEN_SIGMA_PER_M = 0.03
+
+# Standard deviation in degrees of a marker's orientation.rot_y
+ORIENTATION_SIGMA = 10.0
+
+# How far forwards of the middle of the axle the camera pivot sits
+CAMERA_OFFSET = 0.0
+
+# Fits whose weighted RMS residual is above this many meters are rejected,
+# after dropping the worst marker once
+MAX_RESIDUAL = 0.25
+
+class Fix(object):
+    """The robot's pose solved from one frame, with the weighted RMS distance
+    in meters between where the fit puts each marker and where it really is.
+    The residual is 0 when a single marker was all there was to fit."""
+
+    def __init__(self, x, y, heading, residual, count, reach):
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.residual = residual
+        self.count = count
+        self.reach = reach
+
+    @property
+    def sigma(self):
+        """A rough standard deviation of the position. A single marker
+        leaves the heading, and so the position, to its orientation."""
+        if self.count == 1:
+            return SEEN_SIGMA + math.radians(ORIENTATION_SIGMA) * self.reach
+        return (SEEN_SIGMA + self.residual) / math.sqrt(self.count)
+
+    def __str__(self):
+        return "Fix(%.2f, %.2f, %.1fdeg, residual=%.3fm, %d markers)" % (
+            self.x, self.y, self.heading, self.residual, self.count)
+
+def _observations(markers):
+    # (seen x, seen y, world x, world y, weight, heading from orientation)
+    # for every wall marker, seen positions are relative to the camera and
+    # rotated by the camera's heading
+    rows = []
+    for marker in markers:
+        if marker.info.code not in arena.WALL_MARKERS:
+            continue
+        mx, my, facing = arena.WALL_MARKERS[marker.info.code]
+        dist = VisionSystem.get_helper_for(marker).horizontal_dist
+        bearing = math.radians(marker.rot_y)
+        sigma = SEEN_SIGMA + SEEN_SIGMA_PER_M * dist
+        # The marker is seen turned by orientation.rot_y from face on, which
+        # fixes the direction of the line of sight in the arena
+        ray = facing + 180 - marker.orientation.rot_y
+        rows.append((dist * math.cos(bearing), dist * math.sin(bearing),
+                     mx, my, 1 / sigma ** 2,
+                     math.radians(ray - marker.rot_y)))
+    return rows
+
+def _solve(rows):
+    """Weighted least squares for the camera's (x, y, heading) such that
+    rotating each seen position by heading and adding (x, y) lands on the
+    marker. Minimising the squared distances plus a (1 - cos) penalty on
+    the heading each marker's orientation implies has a closed form, the
+    heading is the angle of a weighted sum of cross and dot products."""
+    k = 2 / math.radians(ORIENTATION_SIGMA) ** 2
+    if numpy is not None:
+        px, py, qx, qy, w, angle = numpy.array(rows, dtype=float).T
+        total = w.sum()
+        pcx, pcy = (w * px).sum() / total, (w * py).sum() / total
+        qcx, qcy = (w * qx).sum() / total, (w * qy).sum() / total
+        dpx, dpy, dqx, dqy = px - pcx, py - pcy, qx - qcx, qy - qcy
+        c = (w * (dpx * dqx + dpy * dqy)).sum() + k * numpy.cos(angle).sum()
+        s = (w * (dpx * dqy - dpy * dqx)).sum() + k * numpy.sin(angle).sum()
+        theta = math.atan2(s, c)
+        cos, sin = math.cos(theta), math.sin(theta)
+        x, y = qcx - (cos * pcx - sin * pcy), qcy - (sin * pcx + cos * pcy)
+        ex = cos * px - sin * py + x - qx
+        ey = sin * px + cos * py + y - qy
+        errors = w * (ex ** 2 + ey ** 2)
+        residual = math.sqrt(errors.sum() / total)
+        return x, y, theta, residual, errors.tolist()
+    total = sum(r[4] for r in rows)
+    pcx = sum(r[4] * r[0] for r in rows) / total
+    pcy = sum(r[4] * r[1] for r in rows) / total
+    qcx = sum(r[4] * r[2] for r in rows) / total
+    qcy = sum(r[4] * r[3] for r in rows) / total
+    c = s = 0.0
+    for px, py, qx, qy, w, angle in rows:
+        dpx, dpy, dqx, dqy = px - pcx, py - pcy, qx - qcx, qy - qcy
+        c += w * (dpx * dqx + dpy * dqy) + k * math.cos(angle)
+        s += w * (dpx * dqy - dpy * dqx) + k * math.sin(angle)
+    theta = math.atan2(s, c)
+    cos, sin = math.cos(theta), math.sin(theta)
+    x, y = qcx - (cos * pcx - sin * pcy), qcy - (sin * pcx + cos * pcy)
+    errors = [w * ((cos * px - sin * py + x - qx) ** 2 +
+                   (sin * px + cos * py + y - qy) ** 2)
+              for px, py, qx, qy, w, angle in rows]
+    residual = math.sqrt(sum(errors) / total)
+    return x, y, theta, residual, errors
+
+def localize(markers, camera_forward=True):
+    """Solves the robot's pose from the wall markers in one frame. Returns a
+    Fix, or None if there were no wall markers or the fit was poor."""
+    rows = _observations(markers)
+    if not rows:
+        return None
+    x, y, theta, residual, errors = _solve(rows)
+    if residual > MAX_RESIDUAL and len(rows) > 2:
+        del rows[errors.index(max(errors))]
+        x, y, theta, residual, errors = _solve(rows)
+    if residual > MAX_RESIDUAL:
+        return None
+    heading = math.degrees(theta)
+    if not camera_forward:
+        heading += 180
+    heading = arena.normalize(heading)
+    x -= CAMERA_OFFSET * math.cos(math.radians(heading))
+    y -= CAMERA_OFFSET * math.sin(math.radians(heading))
+    reach = sum(math.hypot(r[0], r[1]) for r in rows) / len(rows)
+    return Fix(x, y, heading, residual, len(rows), reach)
+
+class Localizer(object):
+    """Localizes from every frame posted on 'markers' and hands good fixes
+    to the PoseEstimator."""
+
+    def __init__(self, vision, pose):
+        self.log = logging.getLogger('Robot.Localization')
+        self.vision = vision
+        self.pose = pose
+        self.last_fix = None
+        self.fixes = 0
+        EventBus.GLOBAL.register('markers', self.on_markers)
+
+    def on_markers(self, markers):
+        fix = localize(markers, self.vision.is_forward())
+        if fix is None:
+            return
+        self.last_fix = fix
+        self.fixes += 1
+        self.log.debug("%s", fix)
+        heading_sigma = ORIENTATION_SIGMA / math.sqrt(fix.count)
+        if fix.sigma < self.pose.sigma:
+            self.pose.set_pose(fix.x, fix.y, fix.heading, fix.sigma,
+                               heading_sigma)
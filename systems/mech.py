@@ -4,11 +4,12 @@
 """
 
 import logging
-import threading
-import time
 
+from clock import Clock
 from controllers.motor import MotorController
 from controllers.ruggeduino import RuggeduinoController
+from threads import ActuatorExecutor, Future
+from tracing import traced
 
 class MechSystem:
     def __init__(self, srBot):
@@ -26,11 +27,12 @@ class MechSystem:
         """Moves the arm to the up position.
         See MovementSystem#forward for info on the async parameter."""
         self.log.debug("Move arm up")
+        @traced('mech', 'arm up')
         def run():
             self.motor.backward(80)
             while self.switch.read():
-                time.sleep(0.1)
-            time.sleep(2.2)
+                Clock.GLOBAL.sleep(0.1)
+            Clock.GLOBAL.sleep(2.2)
             self.motor.stop()
         return self._do(run, async)
 
@@ -38,19 +40,17 @@ class MechSystem:
         """Moves the arm to the down position.
         See MovementSystem#forward for info on the async parameter."""
         self.log.debug("Move arm down")
+        @traced('mech', 'arm down')
         def run():
             self.motor.forward(90)
-            stop_time = time.time() + 2
-            while not self.switch.read() and time.time() < stop_time:
-                time.sleep(0.1)
+            stop_time = Clock.GLOBAL.time() + 2
+            while not self.switch.read() and Clock.GLOBAL.time() < stop_time:
+                Clock.GLOBAL.sleep(0.1)
             self.motor.stop()
         return self._do(run, async)
 
     def _do(self, run, async):
         if not async:
             run()
-            return lambda: None
-        thread = threading.Thread(target=run)
-        thread.daemon = True
-        thread.start()
-        return thread.join
+            return Future.completed()
+        return ActuatorExecutor.GLOBAL.submit(run)
@@ -5,10 +5,287 @@
 
 import logging
 import math
+import Queue
+import sys
 import threading
-import time
 
+from clock import Clock
 from controllers.motor import MotorController
+from event_bus import EventBus
+from threads import Future, CancelledError
+from tracing import Tracer
+
+# How often a running move checks whether it has been cancelled
+ABORT_POLL = 0.05
+
+class Motion(object):
+    """Posted on the 'motion' bus channel each time a move ends, finished
+    or cut short: how far each wheel was driven, in meters, negative when
+    backwards."""
+
+    def __init__(self, l_dist, r_dist):
+        self.l_dist = l_dist
+        self.r_dist = r_dist
+
+    @property
+    def distance(self):
+        """How far the middle of the axle moved forwards."""
+        return (self.l_dist + self.r_dist) / 2.0
+
+    @property
+    def turn(self):
+        """How far the robot turned in degrees, clockwise (right) positive."""
+        from main import Robot
+        return math.degrees((self.l_dist - self.r_dist) / Robot.WHEEL_SPAN)
+
+    def __str__(self):
+        return "Motion(%.3fm, %.1fdeg)" % (self.distance, self.turn)
+
+class MotionCommand(Future):
+    """A timed set-point for both wheels: run l_action and r_action at speed,
+    stop each wheel after its own duration. Once done, started and stopped
+    hold the actual monotonic times and overshoot how late the last stop
+    was compared to the plan.
+    l_dist and r_dist are how far each wheel should go, negative backwards.
+    It is also the future of the move, cancelling it while it drives stops
+    the wheels."""
+
+    abortable = True
+
+    def __init__(self, name, l_action, r_action, speed, l_time, r_time,
+                 l_dist=0, r_dist=0):
+        Future.__init__(self)
+        self.name = name
+        self.l_action = l_action
+        self.r_action = r_action
+        self.speed = speed
+        self.l_dist = l_dist
+        self.r_dist = r_dist
+        self.l_time = l_time
+        self.r_time = r_time
+        self.started = None
+        self.stopped = None
+        self.overshoot = None
+
+    @property
+    def duration(self):
+        return max(self.l_time, self.r_time)
+
+class MotionScheduler(threading.Thread):
+    """Runs motion commands one at a time against the monotonic clock, so
+    every move is timed by one thread instead of sleeping in the caller.
+    A command submitted with preempt jumps the queue: the command being
+    driven is cancelled, as is every command submitted before it. Once
+    stopped every command is cancelled and the thread ends."""
+
+    def __init__(self, movement):
+        super(MotionScheduler, self).__init__(name='Motion')
+        self.daemon = True
+        self.log = logging.getLogger('Robot.Movement.Scheduler')
+        self.movement = movement
+        self.queue = Queue.Queue()
+        self.max_overshoot = 0.0
+        self.current = None
+        self._preempting = None
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def submit(self, command, preempt=False):
+        with self._lock:
+            if self._stopped:
+                command.cancel()
+                return command
+            if preempt:
+                self._preempting = command
+                if self.current is not None:
+                    self.current.cancel()
+            self.queue.put(command)
+        return command
+
+    def stop(self):
+        """Cancels the command being driven and every one waiting, then ends
+        the thread."""
+        with self._lock:
+            self._stopped = True
+            if self.current is not None:
+                self.current.cancel()
+            self.queue.put(None)
+
+    def run(self):
+        while True:
+            command = Clock.GLOBAL.queue_get(self.queue)
+            if command is None:
+                break
+            with self._lock:
+                if self._stopped:
+                    command.cancel()
+                elif self._preempting is command:
+                    self._preempting = None
+                elif self._preempting is not None:
+                    # Submitted before the preempting command
+                    command.cancel()
+                self.current = command
+            if not command.set_running_or_notify_cancel():
+                continue
+            try:
+                with Tracer.GLOBAL.span(command.name, 'movement'):
+                    if isinstance(command, MotionSequence):
+                        self.execute_sequence(command)
+                    else:
+                        self.execute(command)
+                command.set_result(command)
+            except CancelledError:
+                self.log.debug("Cancelled %s", command)
+                try:
+                    self._stop_wheels()
+                finally:
+                    command.set_cancelled()
+            except Exception as e:
+                self.log.exception(e)
+                exc_info = sys.exc_info()
+                try:
+                    self._stop_wheels()
+                finally:
+                    command.set_exception(exc_info)
+
+    def _stop_wheels(self):
+        self.movement.l_wheel.stop()
+        self.movement.r_wheel.stop()
+
+    def execute(self, command):
+        self._segment(command, command)
+        self.log.debug("%s ran %.4fs, overshoot %.2fms", command.name,
+                       command.stopped - command.started,
+                       command.overshoot * 1000)
+
+    def execute_sequence(self, sequence):
+        """Runs every command of the sequence back-to-back, each timed from
+        when its wheels were set. A command is blended into the next one if
+        both drive both wheels the same way round: at its end the wheels
+        switch straight to the next set-point instead of both stopping.
+        Reversing a wheel always stops it first. What a blended command
+        overshot its end by is taken off the next one, as the wheels were
+        already driving that way."""
+        commands = sequence.commands
+        start = Clock.GLOBAL.monotonic()
+        carry = 0.0
+        for i, command in enumerate(commands):
+            blend = sequence.blend and i + 1 < len(commands) and \
+                self._blends(command, commands[i + 1])
+            self._segment(sequence, command, carry, stop=not blend)
+            carry = max(command.overshoot, 0.0) if blend else 0.0
+        sequence.started = start
+        sequence.stopped = Clock.GLOBAL.monotonic()
+        self.log.debug("Sequence of %d ran %.4fs, planned %.4fs",
+                       len(commands), sequence.elapsed, sequence.duration)
+
+    def _blends(self, command, following):
+        sign = lambda dist: (dist > 0) - (dist < 0)
+        for time, dist, next_dist in ((command.l_time, command.l_dist,
+                                       following.l_dist),
+                                      (command.r_time, command.r_dist,
+                                       following.r_dist)):
+            if time <= 0 or sign(dist) != sign(next_dist):
+                return False
+        return True
+
+    def _wait_until(self, future, deadline):
+        clock = Clock.GLOBAL
+        while True:
+            if future.abort_requested:
+                raise CancelledError()
+            now = clock.monotonic()
+            if deadline - now <= ABORT_POLL:
+                return clock.sleep_until(deadline)
+            clock.sleep_until(now + ABORT_POLL)
+
+    def _segment(self, future, command, carry=0.0, stop=True):
+        # Timed from when the wheels were set, less carry seconds the
+        # previous command already drove this way
+        l_wheel, r_wheel = self.movement.l_wheel, self.movement.r_wheel
+        command.l_action(command.speed)
+        command.r_action(command.speed)
+        command.started = Clock.GLOBAL.monotonic()
+        start = command.started - min(carry, command.duration)
+        try:
+            if command.l_time > command.r_time:
+                self._wait_until(future, start + command.r_time)
+                r_wheel.stop()
+            elif command.l_time < command.r_time:
+                self._wait_until(future, start + command.l_time)
+                l_wheel.stop()
+            self._wait_until(future, start + command.duration)
+        except CancelledError:
+            self._moved(command, Clock.GLOBAL.monotonic() - start)
+            raise
+        self._moved(command, command.duration)
+        if stop:
+            l_wheel.stop()
+            r_wheel.stop()
+        command.stopped = Clock.GLOBAL.monotonic()
+        command.overshoot = command.stopped - start - command.duration
+        self.max_overshoot = max(self.max_overshoot, command.overshoot)
+
+    def _moved(self, command, elapsed):
+        def driven(dist, duration):
+            if duration <= 0:
+                return 0.0
+            return dist * min(max(elapsed / duration, 0.0), 1.0)
+        EventBus.GLOBAL.post('motion', Motion(
+            driven(command.l_dist, command.l_time),
+            driven(command.r_dist, command.r_time)))
+
+class MotionSequence(Future):
+    """A chain of moves that is handed to the scheduler in one go and driven
+    back-to-back. Build it with the same methods as MovementSystem, which
+    return the sequence so calls can be chained, then call run:
+        wheels.sequence().forward(1, 60).right(90, 60).forward(1, 60).run()
+    See MotionScheduler#execute_sequence for when moves are blended."""
+
+    abortable = True
+    name = 'sequence'
+
+    def __init__(self, movement, blend=True):
+        Future.__init__(self)
+        self.movement = movement
+        self.blend = blend
+        self.commands = []
+        self.started = None
+        self.stopped = None
+
+    def forward(self, distance, speed):
+        self.commands.append(self.movement._forward(distance, speed))
+        return self
+
+    def backward(self, distance, speed):
+        self.commands.append(self.movement._backward(distance, speed))
+        return self
+
+    def right(self, degree, speed, pivot='center'):
+        self.commands.append(self.movement._right(degree, speed, pivot))
+        return self
+
+    def left(self, degree, speed, pivot='center'):
+        self.commands.append(self.movement._left(degree, speed, pivot))
+        return self
+
+    @property
+    def duration(self):
+        """The planned time in seconds to drive the whole sequence."""
+        return sum(command.duration for command in self.commands)
+
+    @property
+    def elapsed(self):
+        """The time in seconds the sequence actually took, once run."""
+        if self.stopped is None:
+            return None
+        return self.stopped - self.started
+
+    def run(self, async=False, preempt=False):
+        """Drives the sequence.
+        See MovementSystem#forward for info on the async and preempt
+        parameters."""
+        return self.movement._run(self, async, preempt)
 
 class MovementSystem:
     def __init__(self, srBot):
@@ -20,65 +297,96 @@ class MovementSystem:
         except Exception as e:
             self.log.exception(e)
             raise e
+        self.scheduler = MotionScheduler(self)
+        Clock.GLOBAL.register(self.scheduler)
+        self.scheduler.start()
+
+    def stop(self):
+        """Stops the motion scheduler, the wheels are stopped if it was
+        driving."""
+        self.scheduler.stop()
 
-    def forward(self, distance, speed, async=False):
+    def forward(self, distance, speed, async=False, preempt=False):
         """Drives straight forwards for the given distance (meters) and speed.
-        Setting async to True will return immediately and drive in a separate
-        thread, otherwise will block until the calculated delay has elapsed.
-        Returns a function that blocks until the operation has completed, this
-        does nothing if async=False."""
-        self.log.debug("Forwards %.2fm %d%%", distance, speed)
-        return self._drive(self.l_wheel.forward, self.r_wheel.forward,
-                           distance, distance, speed, async)
+        Setting async to True will return immediately and drive in the
+        background, otherwise will block until the calculated delay has
+        elapsed. Returns the Future of the move, calling it blocks until the
+        move has completed and cancelling it stops the wheels.
+        Setting preempt to True stops the move being driven and drops the
+        ones waiting, so this one starts straight away. A blocking move that
+        is preempted returns early and isn't done: the Future it returns is
+        cancelled, check cancelled() before relying on where it got to."""
+        return self._run(self._forward(distance, speed), async, preempt)
 
-    def backward(self, distance, speed, async=False):
+    def backward(self, distance, speed, async=False, preempt=False):
         """Drives straight backwards for the given distance and speed.
-        See MovementSystem#forward for info on the async parameter."""
-        self.log.debug("Backwards %.2fm %d%%", distance, speed)
-        return self._drive(self.l_wheel.backward, self.r_wheel.backward,
-                           distance, distance, speed, async)
+        See MovementSystem#forward for info on the async and preempt
+        parameters."""
+        return self._run(self._backward(distance, speed), async, preempt)
 
-    def right(self, degree, speed, pivot='center', async=False):
+    def right(self, degree, speed, pivot='center', async=False,
+              preempt=False):
         """Rotates the robot right given the degree and speed.
         If pivot is set to 'center', the robot will rotate on a spot,
         if set to 'wheel', the robot will rotate about the wheel.
-        See MovementSystem#forward for info on the async parameter."""
+        See MovementSystem#forward for info on the async and preempt
+        parameters."""
+        return self._run(self._right(degree, speed, pivot), async, preempt)
+
+    def left(self, degree, speed, pivot='center', async=False,
+             preempt=False):
+        """Rotates the robot left given the degree and speed.
+        See MovementSystem#right for info on the pivot parameter and
+        see MovementSystem#forward for info on the async and preempt
+        parameters."""
+        return self._run(self._left(degree, speed, pivot), async, preempt)
+
+    def sequence(self, blend=True):
+        """Starts a MotionSequence, a chain of moves driven back-to-back.
+        If blend is False the wheels stop between every move."""
+        return MotionSequence(self, blend)
+
+    def _forward(self, distance, speed):
+        self.log.debug("Forwards %.2fm %d%%", distance, speed)
+        return self._command('forward', self.l_wheel.forward,
+                             self.r_wheel.forward, abs(distance),
+                             abs(distance), speed)
+
+    def _backward(self, distance, speed):
+        self.log.debug("Backwards %.2fm %d%%", distance, speed)
+        return self._command('backward', self.l_wheel.backward,
+                             self.r_wheel.backward, -abs(distance),
+                             -abs(distance), speed)
+
+    def _right(self, degree, speed, pivot):
         self.log.debug("Right %.2fdeg %d%% about %s", degree, speed, pivot)
         l_dist, r_dist = self._calc_driving_dist(degree, pivot)
-        return self._drive(self.l_wheel.forward, self.r_wheel.backward,
-                           l_dist, r_dist, speed, async)
+        return self._command('right', self.l_wheel.forward,
+                             self.r_wheel.backward, l_dist, -r_dist, speed)
 
-    def left(self, degree, speed, pivot='center', async=False):
-        """Rotates the robot left given the degree and speed.
-        See MovementSystem#left for info on the pivot parameter and
-        see MovementSystem#forward for info on the async parameter."""
+    def _left(self, degree, speed, pivot):
         self.log.debug("Left %.2fdeg %d%% about %s", degree, speed, pivot)
         r_dist, l_dist = self._calc_driving_dist(degree, pivot)
-        return self._drive(self.l_wheel.backward, self.r_wheel.forward,
-                           l_dist, r_dist, speed, async)
+        return self._command('left', self.l_wheel.backward,
+                             self.r_wheel.forward, -l_dist, r_dist, speed)
 
-    def _drive(self, l_action, r_action, l_dist, r_dist, speed, async):
+    def _command(self, name, l_action, r_action, l_dist, r_dist, speed):
         time1 = self.l_wheel.calc_wait_time(l_dist, speed)
         time2 = self.r_wheel.calc_wait_time(r_dist, speed)
-        def run():
-            self.log.debug("Waiting %.4f on left, %.4f on right", time1, time2)
-            l_action(speed)
-            r_action(speed)
-            time.sleep(min(time1, time2))
-            if time1 > time2:
-                self.r_wheel.stop()
-            elif time1 < time2:
-                self.l_wheel.stop()
-            time.sleep(abs(time1 - time2))
-            self.l_wheel.stop()
-            self.r_wheel.stop()
+        self.log.debug("Waiting %.4f on left, %.4f on right", time1, time2)
+        return MotionCommand(name, l_action, r_action, speed, time1, time2,
+                             l_dist, r_dist)
+
+    def _run(self, command, async, preempt=False):
+        self.scheduler.submit(command, preempt)
         if not async:
-            run()
-            return lambda: None
-        thread = threading.Thread(target=run)
-        thread.daemon = True
-        thread.start()
-        return thread.join
+            with Tracer.GLOBAL.span(command.name, 'movement'):
+                try:
+                    command.result()
+                except CancelledError:
+                    # Not raised, the caller checks the command it gets back
+                    self.log.info("%s was preempted, not done", command.name)
+        return command
 
     def _calc_driving_dist(self, degree, pivot):
         from main import Robot
@@ -0,0 +1,233 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+import collections
+import logging
+import sys
+import threading
+
+from clock import Clock
+from event_bus import EventBus
+from state_utils import Call, Return
+from tracing import Tracer
+
+# Attempts a behaviour gets when the caller doesn't say
+MAX_ATTEMPTS = 10
+
+# Finished runs kept for looking back over
+HISTORY = 100
+
+class Retry(object):
+    """Returned by a step to have it called again, with these arguments."""
+
+    def __init__(self, *args):
+        self.args = args
+
+class NavigationCancelled(Exception):
+    """Raised out of NavigationEngine#run when the run was cancelled or
+    preempted. Not being a StateInterrupt, it ends the state it happened in
+    instead of leaving it to be run again, unless the state is preempted."""
+
+    def __init__(self, name):
+        super(NavigationCancelled, self).__init__(
+            "Navigation %s cancelled" % name)
+        self.name = name
+
+class Attempt(object):
+    """What one call of a step cost. Scans and distance include those of
+    any run nested in it."""
+
+    def __init__(self):
+        self.scans = 0
+        self.distance = 0.0
+        self.started = Clock.GLOBAL.monotonic()
+        self.time = 0.0
+
+    def finish(self):
+        self.time = Clock.GLOBAL.monotonic() - self.started
+
+    def __str__(self):
+        return "%d scans, %.2fm, %.1fs" % (self.scans, self.distance,
+                                           self.time)
+
+class NavigationRun(object):
+    """One run of a behaviour. reason is why it ended: 'done', 'attempts'
+    or 'time' when a budget ran out, 'cancelled', 'preempted' or 'error'."""
+
+    def __init__(self, name):
+        self.name = name
+        self.attempts = []
+        self.result = None
+        self.reason = 'error'
+        self.cancelled = False
+
+    @property
+    def scans(self):
+        return sum(a.scans for a in self.attempts)
+
+    @property
+    def distance(self):
+        return sum(a.distance for a in self.attempts)
+
+    @property
+    def time(self):
+        return sum(a.time for a in self.attempts)
+
+    def __str__(self):
+        return "%s %s after %d attempts: %s" % (
+            self.name, self.reason, len(self.attempts),
+            ", ".join("[%s]" % a for a in self.attempts))
+
+class NavigationEngine(object):
+    """Runs a navigation behaviour as a loop of steps instead of a function
+    that calls itself to try again. Every run has a budget of attempts and
+    of seconds, and stops early once cancel() is called or cancel_hook
+    returns True. A cooperative state yields steps() instead of calling
+    run(), to be preempted between steps. Runs made with run() inside a step
+    stop early too once preempt_hook returns True, raising
+    NavigationCancelled. Scans posted on 'markers' and the distance posted on
+    'motion' are counted against the attempt in progress."""
+
+    def __init__(self, cancel_hook=None):
+        self.log = logging.getLogger('Robot.Navigation')
+        self.cancel_hook = cancel_hook
+        # Set to the state machine's CooperativeObserver#preempted
+        self.preempt_hook = None
+        self.history = collections.deque(maxlen=HISTORY)
+        self.totals = {}
+        self.ends = {}
+        self._active = []
+        self._lock = threading.Lock()
+        EventBus.GLOBAL.register('markers', self.on_markers)
+        EventBus.GLOBAL.register('motion', self.on_motion)
+
+    def on_markers(self, markers):
+        with self._lock:
+            for run in self._active:
+                run.attempts[-1].scans += 1
+
+    def on_motion(self, motion):
+        with self._lock:
+            for run in self._active:
+                run.attempts[-1].distance += abs(motion.distance)
+
+    def cancel(self):
+        """Cancels every run in progress, at the end of its current step."""
+        with self._lock:
+            for run in self._active:
+                run.cancelled = True
+
+    def _cancelled(self, run):
+        return run.cancelled or (self.cancel_hook is not None and
+                                 self.cancel_hook())
+
+    def run(self, name, step, args=(), attempts=MAX_ATTEMPTS, seconds=None,
+            default=False):
+        """Calls step(*args) until it returns something other than a Retry,
+        and returns that. Each Retry gives the arguments of the next call.
+        Returns default once attempts calls have been made or seconds have
+        passed, either may be None for no limit. Raises NavigationCancelled
+        if cancelled or preempted."""
+        steps = self._steps(name, step, args, attempts, seconds, default,
+                            True)
+        request = next(steps)
+        while isinstance(request, Call):
+            try:
+                result = request.fn(*request.args)
+            except BaseException:
+                request = steps.throw(*sys.exc_info())
+            else:
+                request = steps.send(result)
+        steps.close()
+        return request.value
+
+    def steps(self, name, step, args=(), attempts=MAX_ATTEMPTS, seconds=None,
+              default=False):
+        """run() for a cooperative state to yield: a generator yielding a Call
+        of each step, so the state can be preempted between steps, ending
+        with a Return of the result. A run preempted ends as 'preempted'."""
+        return self._steps(name, step, args, attempts, seconds, default,
+                           False)
+
+    def _steps(self, name, step, args, attempts, seconds, default, blocking):
+        # Only a blocking run looks at preempt_hook, steps() is preempted by
+        # the state machine at its yields
+        run = NavigationRun(name)
+        deadline = None
+        if seconds is not None:
+            deadline = Clock.GLOBAL.monotonic() + seconds
+        try:
+            with Tracer.GLOBAL.span(name, 'navigation'):
+                while True:
+                    if self._cancelled(run):
+                        run.reason = 'cancelled'
+                        raise NavigationCancelled(name)
+                    if blocking and self.preempt_hook is not None and \
+                            self.preempt_hook():
+                        run.reason = 'preempted'
+                        raise NavigationCancelled(name)
+                    if attempts is not None and len(run.attempts) >= attempts:
+                        run.reason = 'attempts'
+                        run.result = default
+                        break
+                    if deadline is not None and \
+                            Clock.GLOBAL.monotonic() >= deadline:
+                        run.reason = 'time'
+                        run.result = default
+                        break
+                    attempt = Attempt()
+                    with self._lock:
+                        run.attempts.append(attempt)
+                        if len(run.attempts) == 1:
+                            self._active.append(run)
+                    try:
+                        result = yield Call(step, *args)
+                    except NavigationCancelled:
+                        # Cancelled in a run nested in the step
+                        run.reason = 'cancelled'
+                        raise
+                    except GeneratorExit:
+                        run.reason = 'preempted'
+                        raise
+                    finally:
+                        attempt.finish()
+                    if isinstance(result, Retry):
+                        args = result.args
+                        continue
+                    run.reason = 'done'
+                    run.result = result
+                    break
+        finally:
+            self._finish(run)
+        yield Return(run.result)
+
+    def _finish(self, run):
+        with self._lock:
+            if run in self._active:
+                self._active.remove(run)
+            self.history.append(run)
+            totals = self.totals.setdefault(run.name, collections.Counter())
+            ends = self.ends.setdefault(run.name, collections.Counter())
+        ends[run.reason] += 1
+        totals['runs'] += 1
+        totals['attempts'] += len(run.attempts)
+        totals['scans'] += run.scans
+        totals['distance'] += run.distance
+        totals['time'] += run.time
+        level = logging.DEBUG if run.reason == 'done' else logging.INFO
+        self.log.log(level, "%s", run)
+
+    def summary(self):
+        """A line per behaviour of its totals over every run."""
+        lines = []
+        for name in sorted(self.totals):
+            totals = self.totals[name]
+            ends = ", ".join("%d %s" % (count, reason) for reason, count in
+                             sorted(self.ends[name].items()))
+            lines.append("%s: %d runs (%s), %d attempts, %d scans, %.1fm, "
+                         "%.1fs" % (name, totals['runs'], ends,
+                                    totals['attempts'], totals['scans'],
+                                    totals['distance'], totals['time']))
+        return lines
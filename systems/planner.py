@@ -0,0 +1,262 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+import heapq
+import logging
+import math
+import threading
+
+import arena
+from clock import Clock
+from event_bus import EventBus
+from systems.vision import VisionSystem
+
+# Side of a grid cell in meters
+RESOLUTION = 0.1
+
+# Obstacles are grown by this much so the middle of the robot can be
+# planned as a point
+CLEARANCE = 0.35
+
+# Room taken by another robot, on top of CLEARANCE, and how long one is
+# remembered after it was last seen, in seconds
+ROBOT_RADIUS = 0.3
+ROBOT_MEMORY = 10.0
+
+class OccupancyGrid(object):
+    """The arena as square cells that are free or blocked: the walls and the
+    central barrier always, other robots for ROBOT_MEMORY seconds after they
+    were last seen. Obstacles are grown by CLEARANCE."""
+
+    def __init__(self, resolution=RESOLUTION):
+        self.resolution = resolution
+        self.size = int(round(arena.SIZE / resolution))
+        self._static = self._build_static()
+        self._robots = {}
+        self._lock = threading.Lock()
+
+    def _build_static(self):
+        blocked = set()
+        margin = int(math.ceil(CLEARANCE / self.resolution))
+        for i in range(self.size):
+            for j in range(self.size):
+                if min(i, j, self.size - 1 - i, self.size - 1 - j) < margin:
+                    blocked.add((i, j))
+        for x1, y1, x2, y2 in arena.BARRIERS:
+            for cell in self._cells_within(x1 - CLEARANCE, y1 - CLEARANCE,
+                                           x2 + CLEARANCE, y2 + CLEARANCE):
+                blocked.add(cell)
+        return frozenset(blocked)
+
+    def _cells_within(self, x1, y1, x2, y2):
+        i1, j1 = self.cell(x1, y1)
+        i2, j2 = self.cell(x2, y2)
+        return [(i, j) for i in range(i1, i2 + 1) for j in range(j1, j2 + 1)]
+
+    def cell(self, x, y):
+        clamp = lambda v: min(max(int(v / self.resolution), 0), self.size - 1)
+        return clamp(x), clamp(y)
+
+    def center(self, cell):
+        return ((cell[0] + 0.5) * self.resolution,
+                (cell[1] + 0.5) * self.resolution)
+
+    def add_robot(self, code, x, y):
+        with self._lock:
+            self._robots[code] = (x, y, Clock.GLOBAL.time())
+
+    def blocked(self):
+        """The set of blocked cells as of now."""
+        now = Clock.GLOBAL.time()
+        with self._lock:
+            robots = [(x, y) for code, (x, y, seen) in self._robots.items()
+                      if now - seen < ROBOT_MEMORY]
+        if not robots:
+            return self._static
+        blocked = set(self._static)
+        reach = CLEARANCE + ROBOT_RADIUS
+        for x, y in robots:
+            for cell in self._cells_within(x - reach, y - reach,
+                                           x + reach, y + reach):
+                cx, cy = self.center(cell)
+                if math.hypot(cx - x, cy - y) <= reach:
+                    blocked.add(cell)
+        return blocked
+
+    def line_free(self, blocked, a, b):
+        """Whether the straight line between two points crosses no blocked
+        cell."""
+        steps = int(math.hypot(b[0] - a[0], b[1] - a[1]) /
+                    (self.resolution / 2)) + 1
+        for k in range(steps + 1):
+            t = float(k) / steps
+            if self.cell(a[0] + (b[0] - a[0]) * t,
+                         a[1] + (b[1] - a[1]) * t) in blocked:
+                return False
+        return True
+
+_NEIGHBOURS = [(di, dj, math.hypot(di, dj)) for di in (-1, 0, 1)
+               for dj in (-1, 0, 1) if di or dj]
+
+def _nearest_free(blocked, size, cell):
+    # Breadth first out from the cell, for starts and goals inside an
+    # obstacle's clearance
+    if cell not in blocked:
+        return cell
+    seen = set([cell])
+    frontier = [cell]
+    while frontier:
+        next_frontier = []
+        for i, j in frontier:
+            for di, dj, cost in _NEIGHBOURS:
+                n = (i + di, j + dj)
+                if n in seen or not (0 <= n[0] < size and 0 <= n[1] < size):
+                    continue
+                if n not in blocked:
+                    return n
+                seen.add(n)
+                next_frontier.append(n)
+        frontier = next_frontier
+    return None
+
+def astar(blocked, size, start, goal):
+    """Shortest 8-connected path of cells from start to goal avoiding
+    blocked ones, or None."""
+    def h(cell):
+        # Octile distance, exact on an empty 8-connected grid
+        di, dj = abs(cell[0] - goal[0]), abs(cell[1] - goal[1])
+        return max(di, dj) + (math.sqrt(2) - 1) * min(di, dj)
+    came_from = {start: None}
+    cost = {start: 0.0}
+    heap = [(h(start), start)]
+    while heap:
+        f, cell = heapq.heappop(heap)
+        if cell == goal:
+            path = []
+            while cell is not None:
+                path.append(cell)
+                cell = came_from[cell]
+            return path[::-1]
+        if f > cost[cell] + h(cell):
+            continue
+        for di, dj, step in _NEIGHBOURS:
+            n = (cell[0] + di, cell[1] + dj)
+            if n in blocked or not (0 <= n[0] < size and 0 <= n[1] < size):
+                continue
+            if di and dj and ((cell[0] + di, cell[1]) in blocked or
+                              (cell[0], cell[1] + dj) in blocked):
+                # Don't cut the corner of an obstacle
+                continue
+            c = cost[cell] + step
+            if c < cost.get(n, float('inf')):
+                cost[n] = c
+                came_from[n] = cell
+                heapq.heappush(heap, (c + h(n), n))
+    return None
+
+class PathPlanner(object):
+    """Plans collision free routes across the arena from the estimated pose
+    and turns their legs into MotionSequences. Other robots seen on
+    'markers' are added to the grid."""
+
+    def __init__(self, vision, pose):
+        self.log = logging.getLogger('Robot.Planner')
+        self.vision = vision
+        self.pose = pose
+        self.grid = OccupancyGrid()
+        EventBus.GLOBAL.register('markers', self.on_markers)
+
+    def on_markers(self, markers):
+        robots = markers.of_type('robot')
+        if robots.is_empty or not self.pose.reliable:
+            return
+        x, y, heading = self.pose.pose
+        facing = heading if self.vision.is_forward() else heading + 180
+        for marker in robots:
+            dist = VisionSystem.get_helper_for(marker).horizontal_dist
+            angle = math.radians(facing + marker.rot_y)
+            self.grid.add_robot(marker.info.code, x + dist * math.cos(angle),
+                                y + dist * math.sin(angle))
+
+    def plan(self, x, y):
+        """Waypoints from the estimated position to (x, y), the first being
+        where the robot is, or None if there is no way there."""
+        blocked = self.grid.blocked()
+        size = self.grid.size
+        here = self.pose.pose[:2]
+        start = _nearest_free(blocked, size, self.grid.cell(*here))
+        goal = _nearest_free(blocked, size, self.grid.cell(x, y))
+        if start is None or goal is None:
+            return None
+        cells = astar(blocked, size, start, goal)
+        if cells is None:
+            return None
+        points = [here] + [self.grid.center(c) for c in cells[1:-1]] + \
+                 [(x, y) if goal == self.grid.cell(x, y) else
+                  self.grid.center(goal)]
+        return self._shortcut(blocked, points)
+
+    def _shortcut(self, blocked, points):
+        # Skip every waypoint that can be seen past, leaving only the turns
+        route = [points[0]]
+        i = 0
+        while i < len(points) - 1:
+            j = len(points) - 1
+            while j > i + 1 and not self.grid.line_free(blocked, points[i],
+                                                        points[j]):
+                j -= 1
+            route.append(points[j])
+            i = j
+        return route
+
+    def next_leg(self, wheels, x, y, speed, reverse=False, stop_short=0.0):
+        """Plans the route to (x, y), ending stop_short meters before it,
+        and returns (sequence, legs) where sequence is a MotionSequence that
+        drives its first leg and legs is how many legs follow. The sequence
+        is None if the robot is already there. Returns None if there is no
+        route. With reverse the robot drives backwards, its back facing the
+        way."""
+        points = self.plan(x, y)
+        if points is None:
+            self.log.info("No route to (%.2f, %.2f)", x, y)
+            return None
+        points = _trim(points, stop_short)
+        legs = [(a, b) for a, b in zip(points, points[1:])
+                if math.hypot(b[0] - a[0], b[1] - a[1]) >= 0.05]
+        if not legs:
+            return None, 0
+        a, b = legs[0]
+        length = math.hypot(b[0] - a[0], b[1] - a[1])
+        target = arena.bearing(a[0], a[1], b[0], b[1])
+        if reverse:
+            target += 180
+        turn = arena.normalize(target - self.pose.pose[2])
+        sequence = wheels.sequence()
+        if abs(turn) > 1:
+            if turn < 0:
+                sequence.left(turn, speed)
+            else:
+                sequence.right(turn, speed)
+        if reverse:
+            sequence.backward(length, speed)
+        else:
+            sequence.forward(length, speed)
+        self.log.info("Leg of %.2fm towards (%.2f, %.2f), %d more", length,
+                      x, y, len(legs) - 1)
+        return sequence, len(legs) - 1
+
+def _trim(points, distance):
+    # Cuts distance meters off the end of the route
+    points = list(points)
+    while distance > 0 and len(points) > 1:
+        a, b = points[-2], points[-1]
+        length = math.hypot(b[0] - a[0], b[1] - a[1])
+        if length > distance:
+            t = (length - distance) / length
+            points[-1] = (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+            break
+        distance -= length
+        points.pop()
+    return points
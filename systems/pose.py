@@ -0,0 +1,108 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+import logging
+import math
+import threading
+
+import arena
+from event_bus import EventBus
+
+# How sure we are of where the robot is put down at the start, in meters
+# and degrees
+START_SIGMA = 0.1
+START_HEADING_SIGMA = 5.0
+
+# Growth of the position's standard deviation per meter driven, on top of
+# what the heading's uncertainty adds
+DRIVE_SIGMA = 0.05
+
+# Growth of the heading's standard deviation per degree turned and per meter
+# driven, wheels slip most when turning on the spot
+TURN_HEADING_SIGMA = 0.05
+DRIVE_HEADING_SIGMA = 1.0
+
+# The pose is worth steering by up to this position standard deviation
+RELIABLE_SIGMA = 0.75
+
+# The middle of the robot can't get closer than this to a wall, in meters
+WALL_MARGIN = 0.25
+
+# Growth of the position's standard deviation per meter driven forwards
+# while a bump switch is pressed: the robot may have gone anywhere from
+# nowhere, stalled against a wall, to all the way, pushing a flag
+BUMPED_SIGMA = 0.3
+
+class PoseEstimator(object):
+    """Dead reckons where the robot is in the arena (see arena.py for the
+    coordinates) from every move posted on the 'motion' channel, starting
+    from the start position of its zone. sigma and heading_sigma are the
+    standard deviations of the position in meters and heading in degrees,
+    they grow with every move until set_pose is given a fix.
+    While bumped() is true, a move forwards may not have got anywhere, so
+    sigma grows by BUMPED_SIGMA more. The position is always kept inside
+    the arena."""
+
+    def __init__(self, zone, bumped=lambda: False):
+        self.log = logging.getLogger('Robot.Pose')
+        self._lock = threading.Lock()
+        self.x, self.y, self.heading = arena.start_pose(zone)
+        self.sigma = START_SIGMA
+        self.heading_sigma = START_HEADING_SIGMA
+        self.odometer = 0.0
+        self.bumped = bumped
+        EventBus.GLOBAL.register('motion', self.on_motion)
+
+    def on_motion(self, motion):
+        distance, turn = motion.distance, motion.turn
+        with self._lock:
+            if distance > 0 and self.bumped():
+                self.sigma += BUMPED_SIGMA * distance
+            # Along the chord of the arc, at the heading half way round it
+            mid = math.radians(self.heading + turn / 2.0)
+            self.x = min(max(self.x + distance * math.cos(mid), WALL_MARGIN),
+                         arena.SIZE - WALL_MARGIN)
+            self.y = min(max(self.y + distance * math.sin(mid), WALL_MARGIN),
+                         arena.SIZE - WALL_MARGIN)
+            self.heading = arena.normalize(self.heading + turn)
+            self.heading_sigma += TURN_HEADING_SIGMA * abs(turn) + \
+                                  DRIVE_HEADING_SIGMA * abs(distance)
+            self.sigma += abs(distance) * (
+                DRIVE_SIGMA + math.radians(self.heading_sigma))
+            self.odometer += abs(distance)
+
+    def set_pose(self, x, y, heading, sigma, heading_sigma):
+        """Replaces the estimate with an outside fix."""
+        with self._lock:
+            self.x, self.y, self.heading = x, y, arena.normalize(heading)
+            self.sigma = sigma
+            self.heading_sigma = heading_sigma
+
+    @property
+    def pose(self):
+        """The estimated (x, y, heading)."""
+        with self._lock:
+            return self.x, self.y, self.heading
+
+    @property
+    def reliable(self):
+        return self.sigma <= RELIABLE_SIGMA
+
+    def distance_to(self, x, y):
+        with self._lock:
+            return math.hypot(x - self.x, y - self.y)
+
+    def turn_to(self, x, y, reverse=False):
+        """Degrees to turn right (negative for left) to face (x, y), or to
+        have the back face it if reverse is True."""
+        with self._lock:
+            heading = arena.bearing(self.x, self.y, x, y)
+            if reverse:
+                heading += 180
+            return arena.normalize(heading - self.heading)
+
+    def __str__(self):
+        return "Pose(%.2f, %.2f, %.1fdeg, sigma=%.2fm/%.1fdeg)" % (
+            self.x, self.y, self.heading, self.sigma, self.heading_sigma)
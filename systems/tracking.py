@@ -0,0 +1,172 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+import logging
+import math
+import threading
+
+import arena
+from clock import Clock
+from event_bus import EventBus
+from systems.vision import VisionSystem
+
+# Standard deviation in meters of a marker's position as the camera sees it,
+# at 0m and growing per meter away
+SEEN_SIGMA = 0.05
+SEEN_SIGMA_PER_M = 0.03
+
+# How much a prediction's standard deviation grows per meter driven, and per
+# degree turned per meter between the robot and the marker
+DRIVE_SIGMA = 0.08
+TURN_SIGMA = 0.004
+
+# A prediction is trusted in place of a scan up to this standard deviation
+TRUSTED_SIGMA = 0.15
+
+# Markers are forgotten once this unsure of their position
+FORGET_SIGMA = 1.0
+
+class TrackedMarker(object):
+    """The filtered position of one marker relative to the robot: x meters
+    ahead and y meters to the right, on the floor, with sigma the standard
+    deviation of that estimate. bearing is the angle to it from straight
+    ahead, clockwise (right) positive.
+    It can stand in for the marker it tracks: info, dist, rot_y and
+    orientation are those of the last sighting moved to the predicted
+    position, so MarkerHelper and goto code work on it unchanged. Like a
+    scanned marker's, rot_y is measured from where the camera faces, given
+    in degrees from straight ahead by camera_facing()."""
+
+    def __init__(self, marker, x, y, sigma, seen, camera_facing):
+        self.marker = marker
+        self.info = marker.info
+        self.orientation = marker.orientation
+        self.x = x
+        self.y = y
+        self.sigma = sigma
+        self.seen = seen
+        self.camera_facing = camera_facing
+        helper = VisionSystem.get_helper_for(marker)
+        self._height = helper.vertical_height
+
+    @property
+    def horizontal_dist(self):
+        return math.hypot(self.x, self.y)
+
+    @property
+    def dist(self):
+        return math.hypot(self.horizontal_dist, self._height)
+
+    @property
+    def bearing(self):
+        return math.degrees(math.atan2(self.y, self.x))
+
+    @property
+    def rot_y(self):
+        return arena.normalize(self.bearing - self.camera_facing())
+
+    @property
+    def confident(self):
+        return self.sigma <= TRUSTED_SIGMA
+
+    def observe(self, x, y, sigma, marker, seen):
+        # One step of a Kalman filter with the same variance for x and y
+        var, seen_var = self.sigma ** 2, sigma ** 2
+        gain = var / (var + seen_var)
+        self.x += gain * (x - self.x)
+        self.y += gain * (y - self.y)
+        self.sigma = math.sqrt(var * seen_var / (var + seen_var))
+        self.marker = marker
+        self.orientation = marker.orientation
+        self.seen = seen
+
+    def move(self, motion):
+        # Turn half, drive, turn the other half, an arc approximated by its
+        # chord
+        half = math.radians(motion.turn) / 2
+        reach = self.horizontal_dist
+        for i in range(2):
+            cos, sin = math.cos(-half), math.sin(-half)
+            self.x, self.y = (self.x * cos - self.y * sin,
+                              self.x * sin + self.y * cos)
+            if i == 0:
+                self.x -= motion.distance
+        self.sigma += DRIVE_SIGMA * abs(motion.distance) + \
+                      TURN_SIGMA * abs(motion.turn) * reach
+
+    def __repr__(self):
+        return "TrackedMarker(code=%d, dist=%.2f, rot_y=%.1f, sigma=%.2f)" % (
+            self.info.code, self.horizontal_dist, self.rot_y, self.sigma)
+
+class MarkerTracker(object):
+    """Keeps a TrackedMarker for every marker code seen, updated by each
+    scan posted on 'markers' and predicted forward through every move
+    posted on 'motion'. Lets navigation skip a scan while the prediction
+    is still good enough."""
+
+    def __init__(self, vision):
+        self.log = logging.getLogger('Robot.Tracking')
+        self.vision = vision
+        self.markers = {}
+        self.scans_saved = 0
+        self._lock = threading.Lock()
+        # The camera looking behind turns everything around
+        self.camera_facing = lambda: 0 if vision.is_forward() else 180
+        EventBus.GLOBAL.register('markers', self.on_markers)
+        EventBus.GLOBAL.register('motion', self.on_motion)
+
+    def on_markers(self, markers):
+        now = Clock.GLOBAL.time()
+        facing = self.camera_facing()
+        with self._lock:
+            for marker in markers:
+                dist = VisionSystem.get_helper_for(marker).horizontal_dist
+                bearing = math.radians(facing + marker.rot_y)
+                x, y = dist * math.cos(bearing), dist * math.sin(bearing)
+                sigma = SEEN_SIGMA + SEEN_SIGMA_PER_M * dist
+                tracked = self.markers.get(marker.info.code)
+                if tracked is None:
+                    self.markers[marker.info.code] = TrackedMarker(
+                        marker, x, y, sigma, now, self.camera_facing)
+                else:
+                    tracked.observe(x, y, sigma, marker, now)
+
+    def on_motion(self, motion):
+        with self._lock:
+            for code, tracked in self.markers.items():
+                tracked.move(motion)
+                if tracked.sigma > FORGET_SIGMA:
+                    del self.markers[code]
+
+    def get(self, code):
+        """The TrackedMarker for the code, or None if it isn't tracked."""
+        with self._lock:
+            return self.markers.get(code)
+
+    def locate(self, code, filter_func=None):
+        """Where the marker with the given code is now: its prediction if
+        that is confident and matches filter_func, otherwise the closest
+        match of filter_func (by default the same code) in a fresh scan.
+        None if it can't be seen."""
+        tracked = self.get(code)
+        if tracked is not None and tracked.confident and \
+                (filter_func is None or filter_func(tracked)):
+            self.scans_saved += 1
+            self.log.debug("Using %s instead of scanning", tracked)
+            return tracked
+        if tracked is None:
+            markers = self.vision.get_markers()
+        else:
+            # Only as far as it could be, so the scan can be quicker
+            markers = self.vision.get_markers(
+                distance=tracked.horizontal_dist + 2 * tracked.sigma,
+                size=tracked.info.size)
+        if filter_func is None:
+            return markers.get_by_code(code)
+        return markers.filter(filter_func).get_closest()
+
+    def clear(self):
+        with self._lock:
+            self.markers.clear()
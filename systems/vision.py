@@ -5,12 +5,21 @@
 
 import logging
 import math
-import time
+import sys
 import threading
 
-from controllers.vision import VisionController, MarkerHelper
+import arena
+from clock import Clock
+from controllers.vision import (VisionController,
+                                MarkerHelper,
+                                DEFAULT_RESOLUTION)
 from controllers.servo import ServoController
 from event_bus import EventBus
+from threads import ActuatorExecutor, Future
+from tracing import Tracer, traced
+
+# Longest get_markers waits for the capture thread before scanning itself
+FRAME_TIMEOUT = 5.0
 
 class MarkerCollection:
     EMPTY = None
@@ -18,6 +27,58 @@ class MarkerCollection:
     def __init__(self, markers):
         self._markers = markers
         self.is_empty = len(markers) == 0
+        # The collections of_type has made and the closest marker of each
+        # code, kept for the lifetime of the collection so every consumer of
+        # a frame shares them
+        self._types = {}
+        self._codes = None
+
+    def __iter__(self):
+        return iter(self._markers)
+
+    def _subset(self, markers):
+        if len(markers) == 0:
+            return MarkerCollection.EMPTY
+        if len(markers) == len(self._markers):
+            return self
+        return MarkerCollection(markers)
+
+    def of_type(self, marker_type):
+        """Gets the collection of markers of the given type."""
+        if self.is_empty:
+            return self
+        subset = self._types.get(marker_type)
+        if subset is None:
+            subset = self._types[marker_type] = self._subset(
+                [m for m in self._markers if m.info.marker_type == marker_type])
+        return subset
+
+    def get_by_code(self, code):
+        """Gets the marker with the given code, or None if it isn't in this
+        collection. If a code was seen more than once the closest is used."""
+        if self.is_empty:
+            return None
+        if self._codes is None:
+            self._codes = {}
+            # Closest last, so it is the one kept
+            for marker in reversed(sorted(self._markers,
+                                          key=lambda m: m.dist)):
+                self._codes[marker.info.code] = marker
+        return self._codes.get(code)
+
+    def with_codes(self, codes):
+        """Gets the collection of markers whose code is in codes, all of
+        them where a code was seen more than once."""
+        if self.is_empty:
+            return self
+        codes = set(codes)
+        return self._subset([m for m in self._markers if m.info.code in codes])
+
+    def within(self, dist):
+        """Gets the collection of markers closer than dist."""
+        if self.is_empty:
+            return self
+        return self._subset([m for m in self._markers if m.dist < dist])
 
     def get_closest(self):
         """Gets the closest marker in this collection by distance."""
@@ -76,6 +137,71 @@ class MarkerCollection:
 
 MarkerCollection.EMPTY = MarkerCollection([])
 
+class CaptureThread(threading.Thread):
+    """Continuously captures and scans frames in the background so the latest
+    scan is always ready. Each frame is stamped with the time its capture
+    started, which lets callers ask for the first frame taken after a given
+    moment (e.g. when the wheels stopped)."""
+
+    def __init__(self, controller):
+        super(CaptureThread, self).__init__(name='Capture')
+        self.log = logging.getLogger('Robot.Vision.Capture')
+        self.daemon = True
+        self.can_run = lambda: True
+        self._camera = controller
+        self._cond = threading.Condition()
+        self._frame = (0, None)
+        self._error = None
+        self._stopped = False
+        self.frame_count = 0
+
+    def run(self):
+        try:
+            while self.can_run():
+                stamp = Clock.GLOBAL.time()
+                try:
+                    with Tracer.GLOBAL.span('scan', 'vision'):
+                        markers = self._camera.find_markers()
+                except Exception as e:
+                    self.log.exception(e)
+                    with self._cond:
+                        self._error = (stamp, sys.exc_info())
+                        self._cond.notify_all()
+                    Clock.GLOBAL.sleep(0.1)
+                    continue
+                with self._cond:
+                    self._frame = (stamp, markers)
+                    self.frame_count += 1
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self._stopped = True
+                self._cond.notify_all()
+
+    def latest(self):
+        """Returns a (timestamp, markers) tuple of the most recent frame.
+        markers is None if no frame has been captured yet."""
+        with self._cond:
+            return self._frame
+
+    def wait_for_frame(self, after=0, timeout=None):
+        """Blocks until a frame whose capture started at or after the given
+        time is available and returns it as a (timestamp, markers) tuple.
+        Raises the exception of a scan started since that time that failed
+        first. Returns None if the thread stops or timeout seconds pass
+        before such a frame arrives."""
+        failed = lambda: self._error is not None and self._error[0] >= after
+        ready = lambda: self._stopped or failed() or (
+            self._frame[1] is not None and self._frame[0] >= after)
+        with self._cond:
+            Clock.GLOBAL.wait(self._cond, ready, timeout)
+            if self._frame[1] is not None and self._frame[0] >= after:
+                return self._frame
+            if failed():
+                exc_info = self._error[1]
+                raise exc_info[0], exc_info[1], exc_info[2]
+            return None
+
 class VisionSystem:
     def __init__(self, srBot):
         self.log = logging.getLogger('Robot.Vision')
@@ -86,14 +212,54 @@ class VisionSystem:
         except Exception as e:
             self.log.exception(e)
             raise e
+        self.capture = CaptureThread(self.camera)
+        # Set to False to always scan at DEFAULT_RESOLUTION
+        self.adaptive = True
         self._forward = False
         self.look_forward()
 
-    def get_markers(self, sleep=True):
-        """Gets a collection of markers that the robot can currently see."""
-        if sleep:
-            time.sleep(0.5)
-        markers = self.camera.find_markers()
+    @traced('vision')
+    def get_markers(self, sleep=True, distance=None,
+                    size=arena.WALL_MARKER_SIZE):
+        """Gets a collection of markers that the robot can currently see.
+        If the capture thread is running, this returns the first frame whose
+        capture started after this call, or the latest frame if sleep is
+        False. Otherwise it waits for the robot to settle if sleep is True
+        and scans a frame directly.
+        distance is how far away, at most, the markers looked for should be
+        and size how wide they are. When adaptive, the frame is scanned at
+        the quickest resolution that still sees them, see
+        VisionController#resolution_for, and the camera goes back to
+        DEFAULT_RESOLUTION after. Without a distance it is scanned at
+        DEFAULT_RESOLUTION. The latest frame returned when sleep is False
+        was already scanned, at whatever resolution it was taken."""
+        res = DEFAULT_RESOLUTION
+        if self.adaptive and distance is not None:
+            res = self.camera.resolution_for(distance, size)
+        if res != DEFAULT_RESOLUTION:
+            self.log.debug("Scanning at %dx%d for %s", res[0], res[1],
+                           distance)
+        markers = None
+        if self.capture.is_alive():
+            if sleep:
+                # Only the frames taken for this call are at res, the camera
+                # is shared with every other caller
+                self.camera.change_resolution(res)
+                try:
+                    frame = self.capture.wait_for_frame(Clock.GLOBAL.time(),
+                                                        FRAME_TIMEOUT)
+                finally:
+                    self.camera.change_resolution(DEFAULT_RESOLUTION)
+            else:
+                frame = self.capture.wait_for_frame(0, FRAME_TIMEOUT)
+            if frame is not None:
+                markers = frame[1]
+            else:
+                self.log.warning("No frame from the capture thread")
+        if markers is None:
+            if sleep:
+                Clock.GLOBAL.sleep(0.5)
+            markers = self.camera.find_markers(res)
         if len(markers) == 0:
             collection = MarkerCollection.EMPTY
         else:
@@ -107,7 +273,7 @@ class VisionSystem:
         self.log.debug("Look forward")
         if self._forward:
             self.log.debug("Already looking forwards")
-            return lambda: None
+            return Future.completed()
         return self._do(True, async)
 
     def look_behind(self, async=False):
@@ -115,22 +281,20 @@ class VisionSystem:
         self.log.debug("Look behind")
         if not self._forward:
             self.log.debug("Already looking behind")
-            return lambda: None
+            return Future.completed()
         return self._do(False, async)
 
     def _do(self, forward, async):
         angle = self.pivot.MAX if forward else self.pivot.MIN
+        @traced('vision', 'look forward' if forward else 'look behind')
         def run():
             self.pivot.set_angle(angle)
-            time.sleep(0.5) # TODO get minimum time
+            Clock.GLOBAL.sleep(0.5) # TODO get minimum time
             self._forward = forward
         if not async:
             run()
-            return lambda: None
-        thread = threading.Thread(target=run)
-        thread.daemon = True
-        thread.start()
-        return thread.join
+            return Future.completed()
+        return ActuatorExecutor.GLOBAL.submit(run)
 
     def is_forward(self):
         """Gets whether the camera is facing forwards."""
@@ -0,0 +1,75 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Checks the benchmarks run and measure what they claim to, run with the
+# others:
+#     python -m unittest discover -p 'test_*.py'
+
+import StringIO
+import sys
+import unittest
+
+import benchmarks
+from systems.vision import MarkerCollection
+
+class BenchmarksTest(unittest.TestCase):
+
+    def test_micro_benchmarks_run(self):
+        suites = [
+            benchmarks.bench_marker_collection(sizes=(1, 10), number=5),
+            benchmarks.bench_event_bus(handler_counts=(1,), posts=50),
+            benchmarks.bench_state_machine(state_counts=(2,), number=5),
+            benchmarks.bench_controllers(number=60)
+        ]
+        for rows in suites:
+            self.assertTrue(rows)
+            for row in rows:
+                for value in row.values():
+                    if isinstance(value, float):
+                        self.assertGreater(value, 0)
+
+    def test_filter_and_query_agree(self):
+        # Both ways of querying a frame are timed, they must find the same
+        walls = range(0, 4) + range(24, 28)
+        for seed in range(5):
+            markers = MarkerCollection(benchmarks.make_markers(60, seed))
+            pairs = [
+                (markers.of_type('flag'), markers.filter(
+                    lambda m: m.info.marker_type == 'flag')),
+                (markers.of_type('arena').with_codes(walls), markers.filter(
+                    lambda m: m.info.marker_type == 'arena' and
+                    m.info.code in walls)),
+                (markers.within(0.4), markers.filter(lambda m: m.dist < 0.4))
+            ]
+            for query, filtered in pairs:
+                self.assertEqual(sorted(query, key=id),
+                                 sorted(filtered, key=id))
+                self.assertIs(query.get_closest(), filtered.get_closest())
+
+    def compare(self, old, new):
+        output = StringIO.StringIO()
+        stdout, sys.stdout = sys.stdout, output
+        try:
+            benchmarks.compare(old, new)
+        finally:
+            sys.stdout = stdout
+        return output.getvalue().splitlines()
+
+    def test_compare_reports_changes_beyond_noise(self):
+        old = {'suite': [{'impl': 'a', 'time': 1.0, 'rate': 100.0}]}
+        new = {'suite': [{'impl': 'a', 'time': 1.05, 'rate': 150.0}]}
+        lines = self.compare(old, new)
+        self.assertEqual(len(lines), 1)
+        self.assertIn('impl=a', lines[0])
+        self.assertIn('rate', lines[0])
+        self.assertIn('+50%', lines[0])
+
+    def test_compare_skips_rows_only_in_one_run(self):
+        old = {'suite': [{'impl': 'a', 'time': 1.0}]}
+        new = {'suite': [{'impl': 'b', 'time': 9.0}]}
+        self.assertEqual(self.compare(old, new), [])
+
+if __name__ == '__main__':
+    unittest.main()
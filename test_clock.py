@@ -0,0 +1,105 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Tests of the clocks, run with the others:
+#     python -m unittest discover -p 'test_*.py'
+
+import Queue
+import threading
+import time
+import unittest
+
+from clock import RealClock, VirtualClock
+
+class VirtualClockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock(100.0)
+
+    def start(self, *targets):
+        # Every thread is registered before any starts, or time could move
+        # on before the later ones get to sleep
+        threads = [threading.Thread(target=target) for target in targets]
+        for thread in threads:
+            thread.daemon = True
+            self.clock.register(thread)
+        for thread in threads:
+            thread.start()
+
+    def test_sleep_jumps_to_the_deadline(self):
+        started = time.time()
+        self.assertEqual(self.clock.sleep_until(160.0), 160.0)
+        self.clock.sleep(3600)
+        self.assertEqual(self.clock.time(), 3760.0)
+        self.assertEqual(self.clock.monotonic(), 3760.0)
+        self.assertLess(time.time() - started, 1)
+
+    def test_sleeping_threads_wake_in_deadline_order(self):
+        woke = []
+        def sleeper(seconds):
+            def sleep():
+                self.clock.sleep(seconds)
+                woke.append((seconds, self.clock.time()))
+            return sleep
+        self.start(sleeper(3), sleeper(1), sleeper(2))
+        self.clock.sleep(10)
+        self.assertEqual(woke, [(1, 101.0), (2, 102.0), (3, 103.0)])
+
+    def test_time_stands_still_while_a_thread_runs(self):
+        seen = []
+        def busy():
+            # Not blocked on the clock, so it counts as running
+            time.sleep(0.05)
+            seen.append(self.clock.time())
+        self.start(busy)
+        self.clock.sleep(1)
+        self.assertEqual(seen, [100.0])
+
+    def test_wait_wakes_once_the_predicate_holds(self):
+        cond = threading.Condition()
+        flag = []
+        def setter():
+            self.clock.sleep(5)
+            with cond:
+                flag.append(True)
+                cond.notify_all()
+        self.start(setter)
+        with cond:
+            result = self.clock.wait(cond, lambda: flag, 60)
+        self.assertEqual(result, [True])
+        self.assertEqual(self.clock.time(), 105.0)
+
+    def test_wait_times_out(self):
+        cond = threading.Condition()
+        with cond:
+            result = self.clock.wait(cond, lambda: False, 2)
+        self.assertFalse(result)
+        self.assertEqual(self.clock.time(), 102.0)
+
+    def test_queue_get_blocks_until_an_item_is_put(self):
+        queue = Queue.Queue()
+        def producer():
+            self.clock.sleep(4)
+            queue.put('item')
+        self.start(producer)
+        self.assertEqual(self.clock.queue_get(queue), 'item')
+        self.assertEqual(self.clock.time(), 104.0)
+
+class RealClockTest(unittest.TestCase):
+
+    def test_sleep_until_doesnt_wake_early(self):
+        clock = RealClock()
+        deadline = clock.monotonic() + 0.02
+        self.assertGreaterEqual(clock.sleep_until(deadline), deadline)
+        self.assertGreaterEqual(clock.monotonic(), deadline)
+
+    def test_wait_times_out(self):
+        clock = RealClock()
+        cond = threading.Condition()
+        with cond:
+            self.assertFalse(clock.wait(cond, lambda: False, 0.01))
+
+if __name__ == '__main__':
+    unittest.main()
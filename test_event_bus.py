@@ -0,0 +1,119 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Tests of the EventBus registry, run with the others:
+#     python -m unittest discover -p 'test_*.py'
+
+import unittest
+
+from event_bus import EventBus
+
+class RegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = EventBus()
+        self.calls = []
+
+    def handler(self, name):
+        return lambda *payload: self.calls.append((name,) + payload)
+
+    def test_post_runs_handlers_in_order(self):
+        self.bus.register('bump', self.handler('a'))
+        self.bus.register('bump', self.handler('b'))
+        self.bus.post('bump', 1)
+        self.bus.post('other', 2)
+        self.assertEqual(self.calls, [('a', 1), ('b', 1)])
+
+    def test_no_payload_calls_without_arguments(self):
+        self.bus.register('tick', self.handler('a'))
+        self.bus.post('tick')
+        self.assertEqual(self.calls, [('a',)])
+
+    def test_unregister(self):
+        a = self.handler('a')
+        self.bus.register('bump', a)
+        self.bus.unregister('bump', a)
+        self.bus.unregister('bump', a)
+        self.bus.post('bump', 1)
+        self.assertEqual(self.calls, [])
+
+    def test_registered_during_post_runs_from_next_post(self):
+        late = self.handler('late')
+        def first(payload):
+            self.calls.append(('first', payload))
+            self.bus.register('bump', late)
+        self.bus.register('bump', first)
+        self.bus.post('bump', 1)
+        self.assertEqual(self.calls, [('first', 1)])
+        self.bus.post('bump', 2)
+        self.assertEqual(self.calls[1:], [('first', 2), ('late', 2)])
+
+    def test_unregistered_during_post_still_runs_in_it(self):
+        second = self.handler('second')
+        def first(payload):
+            self.calls.append(('first', payload))
+            self.bus.unregister('bump', second)
+        self.bus.register('bump', first)
+        self.bus.register('bump', second)
+        self.bus.post('bump', 1)
+        self.bus.post('bump', 2)
+        self.assertEqual(self.calls,
+                         [('first', 1), ('second', 1), ('first', 2)])
+
+    def test_once_runs_for_one_post(self):
+        self.bus.register('bump', self.handler('a'), once=True)
+        self.bus.post('bump', 1)
+        self.bus.post('bump', 2)
+        self.assertEqual(self.calls, [('a', 1)])
+
+    def test_once_unregistered_by_the_original_handler(self):
+        a = self.handler('a')
+        self.bus.register('bump', a, once=True)
+        self.bus.unregister('bump', a)
+        self.bus.post('bump', 1)
+        self.assertEqual(self.calls, [])
+
+    def test_wildcards(self):
+        self.bus.register('flag_*', self.handler('flag'))
+        self.bus.register('*', self.handler('all'))
+        self.bus.post('flag_plate_touch', 1)
+        self.bus.post('bump', 2)
+        self.assertEqual(self.calls, [('flag', 1), ('all', 1), ('all', 2)])
+
+    def test_wildcards_skip_internal_channels(self):
+        self.bus.register('*', self.handler('all'))
+        self.bus.register('__bus_error__', self.handler('error'))
+        self.bus.post('__bus_error__', 1)
+        self.assertEqual(self.calls, [('error', 1)])
+
+    def test_wildcard_registered_after_a_post(self):
+        # The handlers resolved for a channel mustn't outlive a registration
+        self.bus.post('bump', 1)
+        self.bus.register('bu*', self.handler('a'))
+        self.bus.post('bump', 2)
+        self.assertEqual(self.calls, [('a', 2)])
+
+    def test_unregister_wildcard(self):
+        a = self.handler('a')
+        self.bus.register('*', a)
+        self.bus.unregister('*', a)
+        self.bus.post('bump', 1)
+        self.assertEqual(self.calls, [])
+
+    def test_handler_error_is_posted(self):
+        def broken(payload):
+            raise ValueError(payload)
+        self.bus.register('bump', broken)
+        self.bus.register('bump', self.handler('after'))
+        self.bus.register('__bus_error__', self.handler('error'))
+        self.bus.post('bump', 1)
+        self.assertEqual([c[0] for c in self.calls], ['error', 'after'])
+        channel, handler, error = self.calls[0][1]
+        self.assertEqual(channel, 'bump')
+        self.assertIs(handler, broken)
+        self.assertIsInstance(error, ValueError)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Tests of localizing from the wall markers, run with the others:
+#     python -m unittest discover -p 'test_*.py'
+
+import math
+import os
+import sys
+import unittest
+
+# The controllers import sr.robot, use the stand-in when the kit isn't here
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'sim'))
+
+from sr.robot.vision import MarkerInfo, PolarCoord, Point, Orientation, Marker
+
+import arena
+from controllers.vision import MarkerHelper
+from event_bus import EventBus
+from systems import localization
+from systems.localization import Localizer, localize
+from systems.pose import PoseEstimator
+from systems.vision import MarkerCollection
+
+def seen_from(x, y, heading, code, marker_type='arena', farther=0.0):
+    """The marker as a camera at (x, y) facing heading sees it, placed as
+    the simulator places it but without the noise."""
+    mx, my, facing = arena.WALL_MARKERS[code]
+    ray = arena.bearing(x, y, mx, my)
+    info = MarkerInfo(code, marker_type, code, 0.25)
+    marker = Marker(info, 0, (800, 600),
+                    Point(PolarCoord(0, 0, arena.normalize(ray - heading))),
+                    Orientation(0, arena.normalize(facing + 180 - ray), 0))
+    flat = math.hypot(mx - x, my - y) + farther
+    height = MarkerHelper(marker).vertical_height
+    marker.centre.polar.length = math.hypot(flat, height)
+    return marker
+
+class FakeVision(object):
+    def __init__(self):
+        self.forward = True
+
+    def is_forward(self):
+        return self.forward
+
+class LocalizeTest(unittest.TestCase):
+
+    def assertFix(self, fix, x, y, heading):
+        self.assertAlmostEqual(fix.x, x, places=6)
+        self.assertAlmostEqual(fix.y, y, places=6)
+        self.assertAlmostEqual(fix.heading, heading, places=6)
+
+    def test_solves_the_pose_from_several_markers(self):
+        for x, y, heading, codes in [(4.0, 2.0, -90, [2, 3, 4]),
+                                     (6.5, 5.0, 30, [7, 8, 9, 10]),
+                                     (1.5, 6.0, 135, [14, 15, 16, 17])]:
+            markers = [seen_from(x, y, heading, code) for code in codes]
+            fix = localize(MarkerCollection(markers))
+            self.assertFix(fix, x, y, heading)
+            self.assertAlmostEqual(fix.residual, 0, places=6)
+            self.assertEqual(fix.count, len(codes))
+
+    def test_camera_looking_back(self):
+        markers = [seen_from(4.0, 2.0, -90, code) for code in [2, 3, 4]]
+        fix = localize(MarkerCollection(markers), camera_forward=False)
+        self.assertFix(fix, 4.0, 2.0, 90)
+
+    def test_single_marker_leans_on_its_orientation(self):
+        fix = localize(MarkerCollection([seen_from(3.0, 2.5, -60, 3)]))
+        self.assertFix(fix, 3.0, 2.5, -60)
+        self.assertEqual(fix.count, 1)
+        self.assertAlmostEqual(fix.reach, math.hypot(1.0, 2.5))
+        self.assertAlmostEqual(fix.sigma, localization.SEEN_SIGMA +
+            math.radians(localization.ORIENTATION_SIGMA) * fix.reach)
+
+    def test_more_markers_are_surer(self):
+        one = localize(MarkerCollection([seen_from(4.0, 2.0, -90, 3)]))
+        three = localize(MarkerCollection(
+            [seen_from(4.0, 2.0, -90, code) for code in [2, 3, 4]]))
+        self.assertLess(three.sigma, one.sigma)
+
+    def test_nothing_to_fit(self):
+        self.assertIsNone(localize(MarkerCollection([])))
+        flag = seen_from(4.0, 2.0, -90, 3, marker_type='flag')
+        flag.info.code = arena.FLAG_CODES[0]
+        self.assertIsNone(localize(MarkerCollection([flag])))
+
+    def test_worst_marker_is_dropped(self):
+        markers = [seen_from(4.0, 2.0, -90, code) for code in [2, 3, 4]]
+        markers.append(seen_from(4.0, 2.0, -90, 1, farther=1.5))
+        fix = localize(MarkerCollection(markers))
+        self.assertEqual(fix.count, 3)
+        self.assertFix(fix, 4.0, 2.0, -90)
+
+    def test_rejects_a_fit_it_cant_rescue(self):
+        markers = [seen_from(4.0, 2.0, -90, 3),
+                   seen_from(4.0, 2.0, -90, 2, farther=1.5)]
+        self.assertIsNone(localize(MarkerCollection(markers)))
+
+    def test_numpy_and_python_solve_alike(self):
+        if localization.numpy is None:
+            self.skipTest("numpy isn't installed")
+        markers = [seen_from(5.0, 3.0, -70, code, farther=0.1 * code)
+                   for code in [2, 3, 4, 5]]
+        rows = localization._observations(markers)
+        with_numpy = localization._solve(rows)
+        numpy, localization.numpy = localization.numpy, None
+        try:
+            without = localization._solve(rows)
+        finally:
+            localization.numpy = numpy
+        for a, b in zip(with_numpy[:4], without[:4]):
+            self.assertAlmostEqual(a, b, places=9)
+        for a, b in zip(with_numpy[4], without[4]):
+            self.assertAlmostEqual(a, b, places=9)
+
+class LocalizerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = EventBus.GLOBAL
+        EventBus.GLOBAL = EventBus()
+        self.pose = PoseEstimator(0)
+        self.localizer = Localizer(FakeVision(), self.pose)
+        self.frame = MarkerCollection(
+            [seen_from(4.0, 2.0, -90, code) for code in [2, 3, 4]])
+
+    def tearDown(self):
+        EventBus.GLOBAL = self.bus
+
+    def test_better_fix_moves_the_pose(self):
+        self.pose.set_pose(3.0, 3.0, 0, 1.0, 10.0)
+        EventBus.GLOBAL.post('markers', self.frame)
+        x, y, heading = self.pose.pose
+        self.assertAlmostEqual(x, 4.0, places=6)
+        self.assertAlmostEqual(y, 2.0, places=6)
+        self.assertAlmostEqual(heading, -90, places=6)
+        self.assertAlmostEqual(self.pose.sigma, self.localizer.last_fix.sigma)
+        self.assertEqual(self.localizer.fixes, 1)
+
+    def test_worse_fix_is_ignored(self):
+        self.pose.set_pose(3.0, 3.0, 0, 0.001, 1.0)
+        EventBus.GLOBAL.post('markers', self.frame)
+        self.assertEqual(self.pose.pose, (3.0, 3.0, 0))
+        self.assertEqual(self.localizer.fixes, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Tests of running navigation behaviours as steps, run with the others:
+#     python -m unittest discover -p 'test_*.py'
+
+import collections
+import logging
+import unittest
+
+from clock import Clock, VirtualClock
+from event_bus import EventBus
+from state_utils import Call, Return
+from systems.navigation import NavigationCancelled, NavigationEngine, Retry
+
+# What NavigationEngine reads of a systems.movement.Motion
+Move = collections.namedtuple('Move', 'distance turn')
+
+class NavigationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = EventBus.GLOBAL
+        EventBus.GLOBAL = EventBus()
+        logging.disable(logging.CRITICAL)
+        self.engine = NavigationEngine()
+        self.calls = []
+
+    def tearDown(self):
+        EventBus.GLOBAL = self.bus
+        logging.disable(logging.NOTSET)
+
+    def retry(self, *args):
+        self.calls.append(args)
+        return Retry(*args)
+
+    @property
+    def last(self):
+        return self.engine.history[-1]
+
+    def test_retries_with_the_new_arguments(self):
+        def count_up(n):
+            self.calls.append(n)
+            return n if n == 3 else Retry(n + 1)
+        self.assertEqual(self.engine.run('count', count_up, (0,)), 3)
+        self.assertEqual(self.calls, [0, 1, 2, 3])
+        self.assertEqual(self.last.reason, 'done')
+        self.assertEqual(len(self.last.attempts), 4)
+
+    def test_gives_up_after_its_attempts(self):
+        result = self.engine.run('stuck', self.retry, attempts=3,
+                                 default='gave up')
+        self.assertEqual(result, 'gave up')
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(self.last.reason, 'attempts')
+
+    def test_gives_up_after_its_seconds(self):
+        clock, Clock.GLOBAL = Clock.GLOBAL, VirtualClock(100.0)
+        try:
+            def slow():
+                Clock.GLOBAL.sleep(1)
+                return self.retry()
+            self.assertFalse(self.engine.run('slow', slow, attempts=None,
+                                             seconds=3))
+        finally:
+            Clock.GLOBAL = clock
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(self.last.reason, 'time')
+        self.assertEqual(self.last.time, 3.0)
+
+    def test_cancel_ends_the_run_after_the_step(self):
+        def cancelling():
+            self.engine.cancel()
+            return self.retry()
+        with self.assertRaises(NavigationCancelled):
+            self.engine.run('cancelled', cancelling)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.last.reason, 'cancelled')
+
+    def test_cancel_hook(self):
+        self.engine.cancel_hook = lambda: len(self.calls) == 2
+        with self.assertRaises(NavigationCancelled):
+            self.engine.run('hooked', self.retry)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_nested_cancel_ends_both(self):
+        def inner():
+            self.engine.cancel()
+            return self.retry()
+        def outer():
+            return self.engine.run('inner', inner)
+        with self.assertRaises(NavigationCancelled):
+            self.engine.run('outer', outer)
+        self.assertEqual([run.reason for run in self.engine.history],
+                         ['cancelled', 'cancelled'])
+
+    def test_error_in_a_step(self):
+        def broken():
+            raise ValueError()
+        with self.assertRaises(ValueError):
+            self.engine.run('broken', broken)
+        self.assertEqual(self.last.reason, 'error')
+
+    def test_scans_and_distance_count_against_the_attempt(self):
+        def inner():
+            EventBus.GLOBAL.post('markers', [])
+            EventBus.GLOBAL.post('motion', Move(-0.5, 0))
+            return True
+        def outer(first):
+            EventBus.GLOBAL.post('markers', [])
+            if first:
+                return Retry(False)
+            return self.engine.run('inner', inner)
+        self.engine.run('outer', outer, (True,))
+        inner_run, outer_run = self.engine.history
+        self.assertEqual((inner_run.scans, inner_run.distance), (1, 0.5))
+        self.assertEqual([(a.scans, a.distance) for a in outer_run.attempts],
+                         [(1, 0.0), (2, 0.5)])
+        self.assertEqual(self.engine.totals['outer']['scans'], 3)
+        self.assertIn("outer: 1 runs (1 done), 2 attempts, 3 scans, 0.5m",
+                      self.engine.summary()[1])
+
+    def test_preempt_hook_stops_a_blocking_run(self):
+        self.engine.preempt_hook = lambda: len(self.calls) == 1
+        with self.assertRaises(NavigationCancelled):
+            self.engine.run('preempted', self.retry)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.last.reason, 'preempted')
+
+    def test_steps_leave_preemption_to_the_state_machine(self):
+        self.engine.preempt_hook = lambda: True
+        steps = self.engine.steps('cooperative', self.retry, attempts=2,
+                                  default='out of attempts')
+        request = next(steps)
+        while isinstance(request, Call):
+            request = steps.send(request.fn(*request.args))
+        self.assertIsInstance(request, Return)
+        self.assertEqual(request.value, 'out of attempts')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_closing_steps_preempts_the_run(self):
+        steps = self.engine.steps('cooperative', self.retry)
+        self.assertIsInstance(next(steps), Call)
+        steps.close()
+        self.assertEqual(self.last.reason, 'preempted')
+        # Nothing left running to count scans against
+        EventBus.GLOBAL.post('markers', [])
+        self.assertEqual(self.last.scans, 0)
+
+if __name__ == '__main__':
+    unittest.main()
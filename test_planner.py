@@ -0,0 +1,200 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Tests of the path planner, run with the others:
+#     python -m unittest discover -p 'test_*.py'
+
+import logging
+import math
+import os
+import sys
+import unittest
+
+# The controllers import sr.robot, use the stand-in when the kit isn't here
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'sim'))
+
+from clock import Clock, VirtualClock
+from event_bus import EventBus
+from systems import planner
+from systems.planner import OccupancyGrid, PathPlanner, astar
+from systems.pose import PoseEstimator
+
+def path_cost(path):
+    return sum(math.hypot(b[0] - a[0], b[1] - a[1])
+               for a, b in zip(path, path[1:]))
+
+class AStarTest(unittest.TestCase):
+
+    def assertConnected(self, path, blocked):
+        for a, b in zip(path, path[1:]):
+            self.assertEqual(max(abs(b[0] - a[0]), abs(b[1] - a[1])), 1)
+        for cell in path:
+            self.assertNotIn(cell, blocked)
+
+    def test_shortest_on_an_empty_grid(self):
+        path = astar(set(), 5, (0, 0), (4, 2))
+        self.assertEqual(path[0], (0, 0))
+        self.assertEqual(path[-1], (4, 2))
+        self.assertConnected(path, set())
+        self.assertAlmostEqual(path_cost(path), 2 + 2 * math.sqrt(2))
+
+    def test_start_is_the_goal(self):
+        self.assertEqual(astar(set(), 5, (2, 2), (2, 2)), [(2, 2)])
+
+    def test_goes_around_a_wall(self):
+        blocked = set((2, j) for j in range(4))
+        path = astar(blocked, 5, (0, 0), (4, 0))
+        self.assertConnected(path, blocked)
+        self.assertIn((2, 4), path)
+        # Straight past the end of the wall, not diagonally round it
+        self.assertAlmostEqual(path_cost(path), 8 + 2 * math.sqrt(2))
+
+    def test_doesnt_cut_corners(self):
+        path = astar(set([(1, 0)]), 3, (0, 0), (1, 1))
+        self.assertEqual(path, [(0, 0), (0, 1), (1, 1)])
+
+    def test_none_when_walled_off(self):
+        blocked = set((2, j) for j in range(5))
+        self.assertIsNone(astar(blocked, 5, (0, 0), (4, 4)))
+
+    def test_nearest_free(self):
+        blocked = set((i, j) for i in range(3) for j in range(3))
+        self.assertEqual(planner._nearest_free(blocked, 5, (4, 4)), (4, 4))
+        self.assertEqual(planner._nearest_free(blocked, 5, (2, 1)), (3, 0))
+        self.assertIsNone(planner._nearest_free(blocked, 3, (1, 1)))
+
+class TrimTest(unittest.TestCase):
+
+    route = [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0)]
+
+    def test_nothing_to_trim(self):
+        self.assertEqual(planner._trim(self.route, 0), self.route)
+
+    def test_shortens_the_last_leg(self):
+        self.assertEqual(planner._trim(self.route, 0.25),
+                         [(0.0, 0.0), (1.0, 0.0), (1.0, 0.75)])
+
+    def test_drops_legs_shorter_than_the_cut(self):
+        self.assertEqual(planner._trim(self.route, 1.5),
+                         [(0.0, 0.0), (0.5, 0.0)])
+        self.assertEqual(planner._trim(self.route, 5), [(0.0, 0.0)])
+
+    def test_leaves_the_route_alone(self):
+        route = list(self.route)
+        planner._trim(route, 1.5)
+        self.assertEqual(route, self.route)
+
+class OccupancyGridTest(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = OccupancyGrid()
+
+    def is_blocked(self, x, y):
+        return self.grid.cell(x, y) in self.grid.blocked()
+
+    def test_walls_and_barrier(self):
+        self.assertTrue(self.is_blocked(0.1, 4.0))
+        self.assertTrue(self.is_blocked(4.0, 7.9))
+        self.assertTrue(self.is_blocked(4.0, 4.0))
+        self.assertTrue(self.is_blocked(3.5 - planner.CLEARANCE + 0.05, 4.0))
+        self.assertFalse(self.is_blocked(2.0, 2.0))
+        self.assertFalse(self.is_blocked(4.0, 2.5))
+
+    def test_robots_are_forgotten(self):
+        clock, Clock.GLOBAL = Clock.GLOBAL, VirtualClock(100.0)
+        try:
+            self.grid.add_robot(28, 2.0, 2.0)
+            self.assertTrue(self.is_blocked(2.0, 2.0))
+            self.assertTrue(self.is_blocked(2.0 + planner.ROBOT_RADIUS, 2.0))
+            self.assertFalse(self.is_blocked(3.0, 2.0))
+            Clock.GLOBAL.sleep(planner.ROBOT_MEMORY)
+            self.assertFalse(self.is_blocked(2.0, 2.0))
+        finally:
+            Clock.GLOBAL = clock
+
+    def test_line_free(self):
+        blocked = self.grid.blocked()
+        self.assertTrue(self.grid.line_free(blocked, (2.0, 2.0), (6.0, 2.0)))
+        self.assertFalse(self.grid.line_free(blocked, (2.0, 2.0),
+                                             (6.0, 6.0)))
+
+class FakeSequence(object):
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name,) + args)
+
+class FakeWheels(object):
+    def sequence(self):
+        return FakeSequence()
+
+class FakeVision(object):
+    def is_forward(self):
+        return True
+
+class PathPlannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = EventBus.GLOBAL
+        EventBus.GLOBAL = EventBus()
+        logging.disable(logging.CRITICAL)
+        self.pose = PoseEstimator(0)
+        self.pose.set_pose(2.0, 2.0, 0, 0.1, 1.0)
+        self.planner = PathPlanner(FakeVision(), self.pose)
+
+    def tearDown(self):
+        EventBus.GLOBAL = self.bus
+        logging.disable(logging.NOTSET)
+
+    def assertClear(self, route):
+        blocked = self.planner.grid.blocked()
+        for a, b in zip(route, route[1:]):
+            self.assertTrue(self.planner.grid.line_free(blocked, a, b))
+
+    def test_straight_when_nothing_is_in_the_way(self):
+        self.assertEqual(self.planner.plan(2.0, 6.0), [(2.0, 2.0), (2.0, 6.0)])
+
+    def test_around_the_barrier(self):
+        route = self.planner.plan(6.0, 6.0)
+        self.assertEqual(route[0], (2.0, 2.0))
+        self.assertEqual(route[-1], (6.0, 6.0))
+        self.assertGreater(len(route), 2)
+        self.assertClear(route)
+        # Shortcutting leaves only the turns, hardly longer than hugging a
+        # corner of the barrier's clearance
+        corner = (3.5 - planner.CLEARANCE, 4.5 + planner.CLEARANCE)
+        self.assertLess(len(route), 5)
+        self.assertLess(path_cost(route), path_cost(
+            [(2.0, 2.0), corner, (6.0, 6.0)]) + 2 * planner.RESOLUTION)
+
+    def test_around_a_robot(self):
+        self.planner.grid.add_robot(29, 2.0, 4.0)
+        route = self.planner.plan(2.0, 6.0)
+        self.assertGreater(len(route), 2)
+        self.assertClear(route)
+
+    def test_goal_inside_an_obstacle(self):
+        route = self.planner.plan(4.0, 4.0)
+        grid = self.planner.grid
+        self.assertNotIn(grid.cell(*route[-1]), grid.blocked())
+        self.assertClear(route)
+
+    def test_next_leg(self):
+        wheels = FakeWheels()
+        sequence, legs = self.planner.next_leg(wheels, 2.0, 6.0, 0.5)
+        self.assertEqual(legs, 0)
+        self.assertEqual(sequence.calls, [('right', 90.0, 0.5),
+                                          ('forward', 4.0, 0.5)])
+        sequence, legs = self.planner.next_leg(wheels, 2.0, 6.0, 0.5,
+                                               reverse=True, stop_short=1.0)
+        self.assertEqual(sequence.calls, [('left', -90.0, 0.5),
+                                          ('backward', 3.0, 0.5)])
+        self.assertEqual(self.planner.next_leg(wheels, 2.0, 2.02, 0.5),
+                         (None, 0))
+
+if __name__ == '__main__':
+    unittest.main()
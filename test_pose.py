@@ -0,0 +1,110 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Tests of dead reckoning the robot's pose, run with the others:
+#     python -m unittest discover -p 'test_*.py'
+
+import collections
+import math
+import unittest
+
+import arena
+from event_bus import EventBus
+from systems import pose
+from systems.pose import PoseEstimator
+
+# What PoseEstimator reads of a systems.movement.Motion
+Move = collections.namedtuple('Move', 'distance turn')
+
+class PoseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = EventBus.GLOBAL
+        EventBus.GLOBAL = EventBus()
+        self.bumped = False
+        self.pose = PoseEstimator(0, lambda: self.bumped)
+        self.pose.set_pose(2.0, 2.0, 0, 0.1, 1.0)
+
+    def tearDown(self):
+        EventBus.GLOBAL = self.bus
+
+    def move(self, distance, turn=0):
+        self.pose.on_motion(Move(distance, turn))
+
+    def assertPose(self, x, y, heading):
+        ex, ey, eheading = self.pose.pose
+        self.assertAlmostEqual(ex, x, places=6)
+        self.assertAlmostEqual(ey, y, places=6)
+        self.assertAlmostEqual(eheading, heading, places=6)
+
+    def test_starts_in_its_zone(self):
+        for zone in range(4):
+            x, y, heading = PoseEstimator(zone).pose
+            self.assertTrue(arena.in_zone(zone, x, y))
+            self.assertEqual((x, y, heading), arena.start_pose(zone))
+
+    def test_forward_and_back(self):
+        self.move(1.5)
+        self.assertPose(3.5, 2.0, 0)
+        self.move(-0.5)
+        self.assertPose(3.0, 2.0, 0)
+        self.assertAlmostEqual(self.pose.odometer, 2.0)
+
+    def test_turning_right_faces_plus_y(self):
+        self.move(0, 90)
+        self.move(1)
+        self.assertPose(2.0, 3.0, 90)
+
+    def test_arc_follows_its_chord(self):
+        self.move(1, 90)
+        half = math.radians(45)
+        self.assertPose(2 + math.cos(half), 2 + math.sin(half), 90)
+
+    def test_heading_wraps(self):
+        self.move(0, -170)
+        self.move(0, -20)
+        self.assertAlmostEqual(self.pose.heading, 170)
+
+    def test_kept_inside_the_arena(self):
+        self.move(10)
+        self.assertPose(arena.SIZE - pose.WALL_MARGIN, 2.0, 0)
+
+    def test_uncertainty_grows_with_every_move(self):
+        sigma, heading_sigma = self.pose.sigma, self.pose.heading_sigma
+        self.move(0, 90)
+        self.assertAlmostEqual(self.pose.sigma, sigma)
+        self.assertAlmostEqual(self.pose.heading_sigma, heading_sigma +
+                               pose.TURN_HEADING_SIGMA * 90)
+        self.move(1)
+        self.assertGreater(self.pose.sigma, sigma + pose.DRIVE_SIGMA)
+
+    def test_bumped_forwards_is_less_sure(self):
+        self.move(1)
+        free = self.pose.sigma
+        self.pose.set_pose(2.0, 2.0, 0, 0.1, 1.0)
+        self.bumped = True
+        self.move(1)
+        self.assertAlmostEqual(self.pose.sigma, free + pose.BUMPED_SIGMA)
+        # Backing away from whatever was hit isn't held up by it
+        self.pose.set_pose(2.0, 2.0, 0, 0.1, 1.0)
+        self.move(-1)
+        self.assertAlmostEqual(self.pose.sigma, free)
+
+    def test_reliable_until_too_unsure(self):
+        self.assertTrue(self.pose.reliable)
+        while self.pose.sigma <= pose.RELIABLE_SIGMA:
+            self.move(1, 180)
+        self.assertFalse(self.pose.reliable)
+        self.pose.set_pose(4.0, 1.0, 45, 0.2, 2.0)
+        self.assertTrue(self.pose.reliable)
+
+    def test_turn_to(self):
+        self.assertAlmostEqual(self.pose.turn_to(2.0, 5.0), 90)
+        self.assertAlmostEqual(self.pose.turn_to(2.0, 0.0), -90)
+        self.assertAlmostEqual(self.pose.turn_to(0.0, 2.0, reverse=True), 0)
+        self.assertAlmostEqual(self.pose.distance_to(5.0, 6.0), 5.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Plays short matches against the simulated arena, run with the others:
+#     python -m unittest discover -p 'test_*.py'
+
+import logging
+import math
+import unittest
+
+import simulate
+from clock import Clock
+from event_bus import EventBus
+
+class MatchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Matches share the virtual clock they install, put back what the
+        # other tests run on once they're done
+        cls.clock = Clock.GLOBAL
+        cls.bus = EventBus.GLOBAL
+
+    @classmethod
+    def tearDownClass(cls):
+        Clock.GLOBAL = cls.clock
+        EventBus.GLOBAL = cls.bus
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_same_seed_plays_the_same_match(self):
+        first = simulate.run_match(1, 20, seed=3)
+        second = simulate.run_match(1, 20, seed=3)
+        self.assertEqual(first, second)
+
+    def test_robot_leaves_its_zone(self):
+        summary = simulate.run_match(0, 20)
+        self.assertGreater(summary['odometer'], 2)
+
+    def test_estimated_pose_follows_the_robot(self):
+        summary = simulate.run_match(2, 30)
+        x, y, heading = summary['pose']
+        ex, ey, eheading = summary['estimated_pose']
+        self.assertLess(math.hypot(x - ex, y - ey), 0.5)
+
+    def test_doesnt_push_into_obstacles(self):
+        summary = simulate.run_match(0, 90)
+        self.assertLessEqual(summary['max_push'], simulate.MAX_PUSH)
+
+    def test_ends_early_when_asked(self):
+        summary = simulate.run_match(
+            3, 60, until=lambda world: world.odometer > 1)
+        self.assertLess(summary['match_time'], 30)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,289 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Tests of the state machines, run with the others:
+#     python -m unittest discover -p 'test_*.py'
+
+import StringIO
+import logging
+import sys
+import unittest
+
+from clock import Clock, VirtualClock
+from state_utils import (Call, Return, StateGraphError, StateMachine,
+                         TransitionTable, Wait)
+from threads import Future
+
+class CooperativeTest(unittest.TestCase):
+
+    def setUp(self):
+        # set_state prints when it replaces a state
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        self.log = []
+        self.runs = 0
+        self.events = []
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def machine(self, states):
+        self.sm = StateMachine(states, cooperative=True)
+        for event in ('interrupt', 'timeout', 'error', 'finish'):
+            self.sm.bind(event, self.recorder(event))
+        return self.sm
+
+    def recorder(self, event):
+        def record(payload):
+            if event == 'interrupt':
+                payload = payload[1].id
+            elif event == 'finish' or event == 'timeout':
+                payload = payload.name
+            self.events.append((event, payload))
+        return record
+
+    def run_states(self):
+        for state in self.sm.next_state(lambda: self.runs < 10):
+            self.runs += 1
+            self.sm.change_state(state)
+
+    def test_generator_is_served_a_yield_at_a_time(self):
+        def a():
+            self.log.append((yield Call(lambda x: x * 2, 21)))
+            self.log.append((yield [Call(lambda: 1), Future.completed(2),
+                                    Wait(0), None]))
+        self.machine({'A': a}).set_state('A')
+        self.run_states()
+        self.assertEqual(self.log, [42, [1, 2, None, None]])
+        self.assertIsNone(self.sm.active_state)
+        self.assertEqual(self.events, [('finish', 'A')])
+
+    def test_nested_generators_return_their_value(self):
+        def inner(x):
+            yield Call(self.log.append, 'inner')
+            yield Return(x + 1)
+            self.log.append('after return')
+        def ends():
+            yield None
+        def a():
+            self.log.append((yield inner(1)))
+            self.log.append((yield ends()))
+        self.machine({'A': a}).set_state('A')
+        self.run_states()
+        self.assertEqual(self.log, ['inner', 2, None])
+
+    def test_interrupt_preempts_and_reruns_the_state(self):
+        def a():
+            self.log.append('started')
+            try:
+                if self.runs == 1:
+                    yield Call(self.sm.interrupt, 'bump')
+                    self.log.append('not preempted')
+                yield None
+            finally:
+                self.log.append('closed')
+        self.machine({'A': a}).set_state('A')
+        self.run_states()
+        self.assertEqual(self.log, ['started', 'closed', 'started', 'closed'])
+        self.assertEqual(self.events, [('interrupt', 'bump'),
+                                       ('finish', 'A')])
+
+    def test_lower_priority_interrupt_is_ignored(self):
+        def a():
+            yield Call(self.sm.interrupt, 'bump', 1)
+            self.log.append('not preempted')
+        self.machine({'A': a}).set_state('A', priority=2)
+        self.run_states()
+        self.assertEqual(self.log, ['not preempted'])
+        self.assertEqual(self.runs, 1)
+
+    def test_higher_priority_request_preempts(self):
+        def a():
+            yield Call(self.sm.request_state, 'B')
+            self.log.append('A')
+        def b():
+            self.log.append('B')
+        self.machine({'A': a, 'B': b}).set_state('A')
+        self.run_states()
+        self.assertEqual(self.log, ['B'])
+        self.assertEqual(self.sm.active_priority, 1)
+        self.assertIn(('interrupt', 'preempt'), self.events)
+
+    def test_request_waits_for_the_state_to_end(self):
+        def a():
+            yield Call(self.sm.request_state, 'B', [], 1)
+            self.log.append('A')
+        def b():
+            self.log.append('B')
+        self.machine({'A': a, 'B': b}).set_state('A', priority=1)
+        self.run_states()
+        self.assertEqual(self.log, ['A', 'B'])
+
+    def test_only_the_highest_request_is_kept(self):
+        def a():
+            yield [Call(self.sm.request_state, 'B', [], 2),
+                   Call(self.sm.request_state, 'C', [], 1)]
+        states = {'A': a, 'B': lambda: self.log.append('B'),
+                  'C': lambda: self.log.append('C')}
+        self.machine(states).set_state('A', priority=5)
+        self.run_states()
+        self.assertEqual(self.log, ['B'])
+
+    def test_timeout_ends_the_state(self):
+        def a():
+            yield Wait(10)
+            self.log.append('waited')
+        clock, Clock.GLOBAL = Clock.GLOBAL, VirtualClock(100.0)
+        try:
+            self.machine({'A': a}).set_state('A', timeout=2)
+            self.run_states()
+            self.assertEqual(Clock.GLOBAL.time(), 102.0)
+        finally:
+            Clock.GLOBAL = clock
+        self.assertEqual(self.log, [])
+        # Posted as an interrupt too, like any other preemption
+        self.assertEqual(self.events, [('timeout', 'A'),
+                                       ('interrupt', 'timeout')])
+        self.assertIsNone(self.sm.active_state)
+
+    def test_a_call_can_give_up_once_preempted(self):
+        def blocking():
+            self.log.append(self.sm.preempted())
+            self.sm.interrupt()
+            self.log.append(self.sm.preempted())
+            raise ValueError()
+        def a():
+            if self.runs == 1:
+                yield Call(blocking)
+        self.machine({'A': a}).set_state('A')
+        self.run_states()
+        self.assertEqual(self.log, [False, True])
+        # What it raised is dropped for the preemption
+        self.assertEqual(self.events, [('interrupt', 'interrupt'),
+                                       ('finish', 'A')])
+
+    def test_preempting_cancels_the_futures_waited_on(self):
+        future = Future()
+        def a():
+            if self.runs == 1:
+                self.log.append((yield [future, Call(self.sm.interrupt)]))
+        self.machine({'A': a}).set_state('A')
+        self.run_states()
+        self.assertTrue(future.cancelled())
+        self.assertEqual(self.log, [])
+
+    def test_set_state_drops_a_stale_interrupt(self):
+        def a():
+            yield None
+            self.log.append('A')
+        self.machine({'A': a})
+        self.sm.interrupt()
+        self.assertTrue(self.sm.preempted())
+        self.sm.set_state('A')
+        self.assertFalse(self.sm.preempted())
+        self.run_states()
+        self.assertEqual(self.log, ['A'])
+        self.assertEqual(self.runs, 1)
+
+    def test_error_ends_the_state(self):
+        def a():
+            yield None
+            raise ValueError()
+        self.machine({'A': a}).set_state('A')
+        self.run_states()
+        self.assertEqual([event for event, payload in self.events], ['error'])
+        self.assertIsNone(self.sm.active_state)
+
+class Recorder(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class TransitionTableTest(unittest.TestCase):
+
+    transitions = {'MAIN': ['A'], 'A': ['A', 'B'], 'B': ['MAIN'],
+                   'SPARE': ['MAIN']}
+
+    def setUp(self):
+        self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        self.sm = StateMachine(dict((name, lambda: None)
+                                    for name in self.transitions))
+        self.recorder = Recorder()
+        self.logger = logging.getLogger('Robot.States')
+        self.logger.addHandler(self.recorder)
+        self.logger.propagate = False
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        self.logger.removeHandler(self.recorder)
+        self.logger.propagate = True
+
+    def table(self, transitions=None):
+        return TransitionTable(self.sm.get_register(),
+                               transitions or self.transitions)
+
+    def state_id(self, name):
+        return self.sm.get_register().get_state_id(name)
+
+    def test_allowed_transitions(self):
+        table = self.table()
+        main, a, b = [self.state_id(name) for name in ('MAIN', 'A', 'B')]
+        self.assertEqual(table.initial, main)
+        self.assertTrue(table.allowed(main, a))
+        self.assertTrue(table.allowed(a, a))
+        self.assertFalse(table.allowed(main, b))
+        self.assertFalse(table.allowed(b, a))
+        # Anything may be set while no state is active
+        self.assertTrue(table.allowed(None, b))
+
+    def test_unreachable_states(self):
+        self.assertEqual(self.table().unreachable, ['SPARE'])
+
+    def test_undefined_state(self):
+        transitions = dict(self.transitions, B=['MAIN', 'C'])
+        with self.assertRaises(StateGraphError) as raised:
+            self.table(transitions)
+        self.assertIn('C', str(raised.exception))
+
+    def test_undeclared_state(self):
+        transitions = dict(self.transitions)
+        del transitions['SPARE']
+        with self.assertRaises(StateGraphError) as raised:
+            self.table(transitions)
+        self.assertIn('SPARE', str(raised.exception))
+
+    def test_compiled_machine_counts_and_checks_transitions(self):
+        table = self.sm.compile(self.transitions)
+        self.assertEqual(self.recorder.messages, ['Unreachable states SPARE'])
+        for name in ['MAIN', 'A', 'A', 'B', 'A']:
+            self.sm.set_state(name)
+        # The undeclared transition is logged but still made
+        self.assertEqual(len(self.recorder.messages), 2)
+        self.assertIn('Undeclared transition', self.recorder.messages[1])
+        self.assertEqual(self.sm.active_state.name, 'A')
+        exported = table.export()
+        self.assertEqual(exported['initial'], 'MAIN')
+        self.assertEqual(exported['unreachable'], ['SPARE'])
+        self.assertEqual(exported['transitions'],
+                         {'MAIN': {'A': 1}, 'A': {'A': 1, 'B': 1},
+                          'B': {'MAIN': 0}, 'SPARE': {'MAIN': 0}})
+        self.assertEqual(
+            table.counts[self.state_id('B')][self.state_id('A')], 1)
+
+    def test_to_dot(self):
+        table = self.table()
+        table.taken(self.state_id('MAIN'), self.state_id('A'))
+        dot = table.to_dot().splitlines()
+        self.assertEqual(dot[0], 'digraph states {')
+        self.assertEqual(dot[-1], '}')
+        self.assertIn('    "MAIN" [shape=doublecircle];', dot)
+        self.assertIn('    "SPARE" [style=dashed];', dot)
+        self.assertIn('    "MAIN" -> "A" [label=1];', dot)
+        self.assertIn('    "A" -> "B" [label=0];', dot)
+
+if __name__ == '__main__':
+    unittest.main()
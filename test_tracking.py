@@ -0,0 +1,151 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Tests of the marker tracker's predictions, run with the others:
+#     python -m unittest discover -p 'test_*.py'
+
+import collections
+import math
+import os
+import sys
+import unittest
+
+# The controllers import sr.robot, use the stand-in when the kit isn't here
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'sim'))
+
+from sr.robot.vision import MarkerInfo, PolarCoord, Point, Orientation, Marker
+
+from controllers.vision import MarkerHelper
+from event_bus import EventBus
+from systems import tracking
+from systems.tracking import MarkerTracker
+from systems.vision import MarkerCollection
+
+# What MarkerTracker reads of a systems.movement.Motion
+Move = collections.namedtuple('Move', 'distance turn')
+
+def make_marker(code, horizontal_dist, rot_y, marker_type='arena'):
+    """A marker seen horizontal_dist meters away across the floor."""
+    info = MarkerInfo(code, marker_type, 0, 0.25)
+    marker = Marker(info, 0, (800, 600), Point(PolarCoord(0, 0, rot_y)),
+                    Orientation(0, 0, 0))
+    height = MarkerHelper(marker).vertical_height
+    marker.centre.polar.length = math.hypot(horizontal_dist, height)
+    return marker
+
+class FakeVision(object):
+    def __init__(self):
+        self.forward = True
+        self.frame = []
+        self.scans = []
+
+    def is_forward(self):
+        return self.forward
+
+    def get_markers(self, distance=None, size=None):
+        self.scans.append(distance)
+        return MarkerCollection(self.frame)
+
+class TrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = EventBus.GLOBAL
+        EventBus.GLOBAL = EventBus()
+        self.vision = FakeVision()
+        self.tracker = MarkerTracker(self.vision)
+
+    def tearDown(self):
+        EventBus.GLOBAL = self.bus
+
+    def see(self, *markers):
+        self.tracker.on_markers(MarkerCollection(list(markers)))
+
+    def assertAt(self, tracked, x, y):
+        self.assertAlmostEqual(tracked.x, x, places=6)
+        self.assertAlmostEqual(tracked.y, y, places=6)
+
+    def test_sighting_is_placed_relative_to_the_robot(self):
+        self.see(make_marker(1, 2.0, 30))
+        tracked = self.tracker.get(1)
+        self.assertAt(tracked, 2 * math.cos(math.radians(30)),
+                      2 * math.sin(math.radians(30)))
+        self.assertAlmostEqual(tracked.sigma, tracking.SEEN_SIGMA +
+                               tracking.SEEN_SIGMA_PER_M * 2)
+        self.assertAlmostEqual(tracked.rot_y, 30)
+        self.assertAlmostEqual(tracked.dist, tracked.marker.dist)
+
+    def test_seen_behind_when_the_camera_looks_back(self):
+        self.vision.forward = False
+        self.see(make_marker(1, 2.0, 0))
+        tracked = self.tracker.get(1)
+        self.assertAt(tracked, -2, 0)
+        # Still given from where the camera faces, as a scan would be
+        self.assertAlmostEqual(tracked.rot_y, 0)
+
+    def test_driving_forward_brings_it_closer(self):
+        self.see(make_marker(1, 2.0, 0))
+        sigma = self.tracker.get(1).sigma
+        self.tracker.on_motion(Move(0.5, 0))
+        tracked = self.tracker.get(1)
+        self.assertAt(tracked, 1.5, 0)
+        self.assertAlmostEqual(tracked.sigma,
+                               sigma + tracking.DRIVE_SIGMA * 0.5)
+
+    def test_turning_right_moves_it_left(self):
+        self.see(make_marker(1, 2.0, 0))
+        self.tracker.on_motion(Move(0, 90))
+        tracked = self.tracker.get(1)
+        self.assertAt(tracked, 0, -2)
+        self.assertAlmostEqual(tracked.rot_y, -90)
+
+    def test_sightings_are_fused(self):
+        self.see(make_marker(1, 2.0, 0))
+        self.see(make_marker(1, 2.0, 0))
+        tracked = self.tracker.get(1)
+        # Equally sure of both, so half the variance
+        self.assertAlmostEqual(tracked.sigma, (tracking.SEEN_SIGMA +
+            tracking.SEEN_SIGMA_PER_M * 2) / math.sqrt(2))
+        var = tracked.sigma ** 2
+        seen_var = (tracking.SEEN_SIGMA + tracking.SEEN_SIGMA_PER_M * 3) ** 2
+        self.see(make_marker(1, 3.0, 0))
+        # Weighted towards the surer estimate
+        self.assertAlmostEqual(tracked.x, 2 + var / (var + seen_var),
+                               places=6)
+        self.assertLess(tracked.x, 2.5)
+
+    def test_forgotten_once_too_unsure(self):
+        self.see(make_marker(1, 2.0, 0))
+        for i in range(20):
+            self.tracker.on_motion(Move(1.0, 0))
+        self.assertIsNone(self.tracker.get(1))
+
+    def test_locate_trusts_a_confident_prediction(self):
+        self.see(make_marker(1, 2.0, 0))
+        self.tracker.on_motion(Move(0.5, 0))
+        located = self.tracker.locate(1)
+        self.assertIs(located, self.tracker.get(1))
+        self.assertEqual(self.vision.scans, [])
+        self.assertEqual(self.tracker.scans_saved, 1)
+
+    def test_locate_scans_once_unsure(self):
+        self.see(make_marker(1, 2.0, 0))
+        self.tracker.on_motion(Move(1.0, 20))
+        tracked = self.tracker.get(1)
+        self.assertFalse(tracked.confident)
+        fresh = make_marker(1, 1.0, 5)
+        self.vision.frame = [fresh]
+        self.assertIs(self.tracker.locate(1), fresh)
+        # No farther than the prediction could be
+        self.assertEqual(self.vision.scans,
+                         [tracked.horizontal_dist + 2 * tracked.sigma])
+
+    def test_locate_applies_the_filter(self):
+        self.see(make_marker(1, 2.0, 0))
+        self.assertIsNone(self.tracker.locate(1, lambda m: m.dist < 1))
+        self.assertEqual(len(self.vision.scans), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Tests of choosing the camera's resolution, run with the others:
+#     python -m unittest discover -p 'test_*.py'
+
+import logging
+import os
+import sys
+import time
+import unittest
+
+# The controllers import sr.robot, use the stand-in when the kit isn't here
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'sim'))
+
+from clock import Clock, RealClock, VirtualClock
+from controllers import vision
+from controllers.vision import (DEFAULT_RESOLUTION, RESOLUTIONS,
+                                VisionController)
+from event_bus import EventBus
+from systems.vision import VisionSystem
+
+class FakeRobot(object):
+    """Answers see() with no markers and timings of seconds per pixel,
+    remembering the resolution of every scan."""
+
+    def __init__(self):
+        self.per_pixel = {}
+        self.servos = [{}]
+        self.scans = []
+        self.delay = 0
+
+    def see(self, res, stats=False):
+        time.sleep(self.delay)
+        self.scans.append(res)
+        seconds = self.per_pixel.get(res, 1e-7) * res[0] * res[1]
+        return [], {'cam': seconds, 'yuyv': seconds, 'find_markers': seconds}
+
+class VisionControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.robot = FakeRobot()
+        self.camera = VisionController(self.robot)
+
+    def test_marker_pixels(self):
+        near = vision.marker_pixels((640, 480), 0.25, 1.0)
+        self.assertAlmostEqual(vision.marker_pixels((640, 480), 0.25, 2.0),
+                               near / 2)
+        self.assertAlmostEqual(vision.marker_pixels((320, 240), 0.25, 1.0),
+                               near / 2)
+        self.assertAlmostEqual(vision.marker_pixels((640, 480), 0.5, 1.0),
+                               near * 2)
+
+    def test_smallest_resolution_that_sees_far_enough(self):
+        self.assertEqual(self.camera.resolution_for(1.0, 0.25), (320, 240))
+        self.assertEqual(self.camera.resolution_for(2.0, 0.25), (640, 480))
+        self.assertEqual(self.camera.resolution_for(2.0, 0.5), (320, 240))
+        need = vision.MIN_MARKER_PIXELS * vision.PIXEL_MARGIN
+        for distance in (0.5, 1.5, 2.5, 3.5):
+            res = self.camera.resolution_for(distance, 0.25)
+            self.assertGreaterEqual(vision.marker_pixels(res, 0.25, distance),
+                                    need)
+
+    def test_largest_when_none_sees_far_enough(self):
+        self.assertEqual(self.camera.resolution_for(10.0, 0.25),
+                         RESOLUTIONS[-1])
+
+    def test_quickest_resolution_as_timed(self):
+        # A resolution the camera is slow at is passed over
+        self.robot.per_pixel[(640, 480)] = 1e-5
+        for res in RESOLUTIONS:
+            self.camera.find_markers(res)
+        self.assertEqual(self.camera.resolution_for(2.0, 0.25), (800, 600))
+
+    def test_scan_time_of_untimed_resolutions_is_estimated(self):
+        self.camera.find_markers((320, 240))
+        timed = self.camera.scan_time((320, 240))
+        self.assertAlmostEqual(timed, 3 * 1e-7 * 320 * 240)
+        self.assertAlmostEqual(self.camera.scan_time((640, 480)), 4 * timed)
+        # Fitted as a fixed cost plus a cost per pixel
+        self.robot.per_pixel[(960, 720)] = 2e-7
+        self.camera.find_markers((960, 720))
+        slope = (2e-7 * 960 * 720 - 1e-7 * 320 * 240) / \
+            (960 * 720 - 320 * 240)
+        fixed = 1e-7 * 320 * 240 - slope * 320 * 240
+        self.assertAlmostEqual(self.camera.scan_time((640, 480)),
+                               3 * (fixed + slope * 640 * 480))
+
+    def test_scans_are_timed_by_resolution(self):
+        self.camera.find_markers()
+        self.camera.find_markers((320, 240))
+        self.assertEqual(self.camera.get_resolutions(),
+                         [(320, 240), vision.DEFAULT_RESOLUTION])
+        self.assertEqual(self.camera.get_stat('capture').count, 2)
+        self.assertIsNone(self.camera.get_stat('capture', (640, 480)))
+
+    def test_change_resolution(self):
+        self.assertTrue(self.camera.change_resolution((640, 480)))
+        self.assertEqual(self.camera.res, (640, 480))
+        self.assertFalse(self.camera.change_resolution((640.0, 480)))
+        self.assertFalse(self.camera.change_resolution([320, 240]))
+        self.assertEqual(self.camera.res, (640, 480))
+
+class VisionSystemTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bus = EventBus.GLOBAL
+        EventBus.GLOBAL = EventBus()
+        logging.disable(logging.CRITICAL)
+        self.robot = FakeRobot()
+        self.clock = Clock.GLOBAL
+        # Turning the camera to look forwards waits for the servo
+        Clock.GLOBAL = VirtualClock(100.0)
+        self.vision = VisionSystem(self.robot)
+        # The capture thread never sleeps, virtual time would stand still
+        Clock.GLOBAL = RealClock()
+        self.frames = []
+        EventBus.GLOBAL.register('markers', self.frames.append)
+
+    def tearDown(self):
+        self.vision.capture.can_run = lambda: False
+        if self.vision.capture.is_alive():
+            self.vision.capture.join()
+        Clock.GLOBAL = self.clock
+        EventBus.GLOBAL = self.bus
+        logging.disable(logging.NOTSET)
+
+    def test_scans_directly_at_the_chosen_resolution(self):
+        self.vision.get_markers(False, distance=1.0)
+        self.vision.get_markers(False)
+        self.assertEqual(self.robot.scans, [(320, 240), DEFAULT_RESOLUTION])
+        self.assertEqual(len(self.frames), 2)
+        self.assertEqual(self.vision.camera.res, DEFAULT_RESOLUTION)
+
+    def test_not_adaptive(self):
+        self.vision.adaptive = False
+        self.vision.get_markers(False, distance=1.0)
+        self.assertEqual(self.robot.scans, [DEFAULT_RESOLUTION])
+
+    def test_frame_from_the_capture_thread(self):
+        self.robot.delay = 0.001
+        self.vision.capture.start()
+        self.vision.get_markers(distance=1.0)
+        # Scanned at the resolution asked for, then the camera goes back
+        self.assertIn((320, 240), self.robot.scans)
+        self.assertEqual(self.vision.camera.res, DEFAULT_RESOLUTION)
+        # The latest frame, already scanned
+        self.vision.get_markers(False, distance=1.0)
+        self.assertEqual(len(self.frames), 2)
+        self.assertEqual(self.vision.camera.res, DEFAULT_RESOLUTION)
+
+if __name__ == '__main__':
+    unittest.main()
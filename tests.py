@@ -4,7 +4,8 @@
 """
 
 import logging
-import time
+
+from clock import Clock
 
 class Tests:
     def __init__(self, robot):
@@ -22,9 +23,9 @@ class Tests:
     def cameraRotation(self):
         while True:
             self.bot.camera.look_forward()
-            time.sleep(3)
+            Clock.GLOBAL.sleep(3)
             self.bot.camera.look_behind()
-            time.sleep(3)
+            Clock.GLOBAL.sleep(3)
 
     def driveSShape(self):
         self.bot.wheels.forward(1, 60)
@@ -42,10 +43,10 @@ class Tests:
         while True:
             self.log.info("Down")
             self.bot.arm.down()
-            time.sleep(1)
+            Clock.GLOBAL.sleep(1)
             self.log.info("Up")
             self.bot.arm.up()
-            time.sleep(1)
+            Clock.GLOBAL.sleep(1)
 
     def someTest(self):
         success = False
@@ -69,8 +70,7 @@ class Tests:
 
     def captureFlag(self):
         while True:
-            flags = self.bot.camera.get_markers() \
-                    .filter(lambda m: m.info.marker_type == 'flag')
+            flags = self.bot.camera.get_markers().of_type('flag')
             if not flags.is_empty:
                 break
         f = flags.get_closest()
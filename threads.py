@@ -3,15 +3,22 @@
     MIT License. A copy of the MIT License can be found in LICENSE.txt
 """
 
+import functools
+import logging
+import Queue
+import sys
 import threading
-import time
+from clock import Clock
 from event_bus import EventBus
+from stats import StreamingStat
 
 class RobotThreads:
     def __init__(self, robot):
         self.threads = []
         self.bot = robot
-        self.add_thread(BumpThread(robot))
+        self.sensors = SensorThread(robot)
+        self.add_thread(self.sensors)
+        self.add_thread(robot.camera.capture)
 
     def add_thread(self, thread):
         thread.daemon = False # Doesn't seem to work when True
@@ -20,29 +27,327 @@ class RobotThreads:
 
     def run(self):
         for thread in self.threads:
+            Clock.GLOBAL.register(thread)
             thread.start()
 
-class BumpThread(threading.Thread):
-    def __init__(self, bot):
-        super(BumpThread, self).__init__()
-        self.sensors = bot.bump['__all__']
-        self.sensors.insert(0, bot.flag_sens)
+class CancelledError(Exception):
+    pass
+
+class TimeoutError(Exception):
+    pass
+
+class Future(object):
+    """The outcome of work done in the background.
+    Calling a future waits for its result, so it can be used where the
+    async=True calls used to return a thread's join function."""
+
+    PENDING, RUNNING, CANCELLED, FINISHED = range(4)
+
+    # Whether the work checks abort_requested and can be cancelled while it
+    # is running, not only while it waits to start.
+    abortable = False
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._state = Future.PENDING
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self.abort_requested = False
+
+    @classmethod
+    def completed(cls, result=None):
+        """Gets an already finished future holding result."""
+        future = cls()
+        future._state = Future.FINISHED
+        future._result = result
+        return future
+
+    def cancel(self):
+        """Cancels the work if it hasn't started yet, or asks abortable work
+        to stop if it's running. Returns True if it is or will be cancelled."""
+        with self._cond:
+            if self._state == Future.RUNNING and self.abortable:
+                self.abort_requested = True
+                return True
+            if self._state != Future.PENDING:
+                return self._state == Future.CANCELLED
+            self._state = Future.CANCELLED
+            self._cond.notify_all()
+        self._run_callbacks()
+        return True
+
+    def cancelled(self):
+        return self._state == Future.CANCELLED
+
+    def running(self):
+        return self._state == Future.RUNNING
+
+    def done(self):
+        return self._state in (Future.CANCELLED, Future.FINISHED)
+
+    def _wait(self, timeout):
+        with self._cond:
+            if not Clock.GLOBAL.wait(self._cond, self.done, timeout):
+                raise TimeoutError()
+
+    def result(self, timeout=None):
+        """Waits up to timeout seconds (forever if None) for the work to
+        finish and returns its result. Raises the exception of the work if it
+        failed, CancelledError if it was cancelled and TimeoutError if it's
+        still going."""
+        self._wait(timeout)
+        if self._state == Future.CANCELLED:
+            raise CancelledError()
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """Like Future#result but returns the exception instead of raising
+        it, or None if the work succeeded."""
+        self._wait(timeout)
+        if self._state == Future.CANCELLED:
+            raise CancelledError()
+        return self._exc_info[1] if self._exc_info is not None else None
+
+    __call__ = result
+
+    def add_done_callback(self, fn):
+        """Calls fn with this future once it's done, straight away if it
+        already is."""
+        with self._cond:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def set_running_or_notify_cancel(self):
+        """Marks the future running, returns False if it was cancelled and
+        the work must not be started."""
+        with self._cond:
+            if self._state == Future.CANCELLED:
+                return False
+            self._state = Future.RUNNING
+            return True
+
+    def set_result(self, result):
+        self._finish(Future.FINISHED, result, None)
+
+    def set_exception(self, exc_info=None):
+        """Stores the exception currently being handled, or the given
+        (type, value, traceback) tuple."""
+        self._finish(Future.FINISHED, None, exc_info or sys.exc_info())
+
+    def set_cancelled(self):
+        self._finish(Future.CANCELLED, None, None)
+
+    def _finish(self, state, result, exc_info):
+        with self._cond:
+            self._state = state
+            self._result = result
+            self._exc_info = exc_info
+            self._cond.notify_all()
+        self._run_callbacks()
+
+    def _run_callbacks(self):
+        callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception as e:
+                logging.getLogger('Robot.Threads').exception(e)
+
+class ActuatorExecutor(object):
+    """A small shared pool of worker threads for actuator work, such as
+    moving the arm or pivoting the camera. Workers are only started when
+    every existing one is busy, up to max_workers, and are reused for the
+    rest of the match. Submitting blocks once max_pending jobs are waiting."""
+
+    GLOBAL = None
+
+    def __init__(self, max_workers=4, max_pending=32):
+        self.log = logging.getLogger('Robot.Threads.Executor')
+        self.max_workers = max_workers
+        self._queue = Queue.Queue(max_pending)
+        self._workers = []
+        self._idle = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Runs fn(*args) on a worker, returns a Future of its result."""
+        future = Future()
+        self._queue.put((future, fn, args))
+        with self._lock:
+            if self._idle == 0 and len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work,
+                    name='Actuator-%d' % len(self._workers))
+                worker.daemon = True
+                self._workers.append(worker)
+                self._idle += 1
+                Clock.GLOBAL.register(worker)
+                worker.start()
+        return future
+
+    def _work(self):
+        while True:
+            future, fn, args = Clock.GLOBAL.queue_get(self._queue)
+            with self._lock:
+                self._idle -= 1
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except Exception:
+                    self.log.exception("Actuator job failed")
+                    future.set_exception()
+            with self._lock:
+                self._idle += 1
+
+ActuatorExecutor.GLOBAL = ActuatorExecutor()
+
+class DebouncedPin(object):
+    """Debounced view of a single input sensor. A new level is only accepted
+    once it has been read on `samples` consecutive polls."""
+
+    def __init__(self, name, sensor, samples=2):
+        self.name = name
+        self.sensor = sensor
+        self.samples = samples
+        self.state = False
+        self.changed_at = None
+        self._count = 0
+        self._first_seen = None
+
+    def update(self, value, now, interval):
+        """Feeds a raw reading taken at time now, interval seconds after the
+        previous one. Returns True if the debounced state flipped."""
+        if value == self.state:
+            self._count = 0
+            return False
+        if self._count == 0:
+            # The pin changed somewhere between the previous poll and this
+            # one, take the middle as the best estimate.
+            self._first_seen = now - interval / 2.0
+        self._count += 1
+        if self._count < self.samples:
+            return False
+        self.state = value
+        self.changed_at = self._first_seen
+        self._count = 0
+        return True
+
+    @property
+    def pending(self):
+        return self._count > 0
+
+class SensorThread(threading.Thread):
+    """Polls the bump switches and the flag plate, debounces them and posts
+    edge events to the global bus:
+        'bump'               - list of bump sensors that were just pressed
+        'bump_release'       - list of bump sensors that were just released
+        'flag_plate_touch'   - the flag plate was just pressed
+        'flag_plate_release' - the flag plate was just released
+    The poll interval drops to active_interval while anything is pressed,
+    a change is being debounced or an edge happened in the last
+    active_hold seconds, otherwise idle_interval is used."""
+
+    def __init__(self, bot, idle_interval=0.05, active_interval=0.01,
+                 active_hold=1.0, samples=2):
+        super(SensorThread, self).__init__(name='Sensors')
+        self.log = logging.getLogger('Robot.Sensors')
         self.bot = bot
+        self.can_run = lambda: True
+        self.idle_interval = idle_interval
+        self.active_interval = active_interval
+        self.active_hold = active_hold
+        self.flag = DebouncedPin('flag_plate', bot.flag_sens, samples)
+        self.bumps = [DebouncedPin(name, bot.bump['front'][name], samples)
+                      for name in ('left', 'right', 'middle')]
+        self.pins = [self.flag] + self.bumps
+        self.latency = {
+            'bump': StreamingStat(),
+            'bump_release': StreamingStat(),
+            'flag_plate_touch': StreamingStat(),
+            'flag_plate_release': StreamingStat()
+        }
+        self._last_edge = 0
+        # Bump pins pressed without a 'bump', whose release isn't posted
+        self._suppressed = set()
+        # Earliest pin change per channel whose post isn't handled yet
+        self._changed = {}
+        self._changed_lock = threading.Lock()
+        # Unregistered once the thread stops
+        self._handlers = [(channel, functools.partial(self._handled, channel))
+                          for channel in self.latency]
+        for channel, handler in self._handlers:
+            EventBus.GLOBAL.register(channel, handler)
+
+    def is_bumped(self):
+        """Whether a bump switch is pressed, by its debounced state. Like
+        for 'bump', the middle one doesn't count while carrying a flag."""
+        left, right, middle = self.bumps
+        return left.state or right.state or \
+            (middle.state and not self.flag.state)
+
+    def get_interval(self, now):
+        if now - self._last_edge < self.active_hold:
+            return self.active_interval
+        for pin in self.pins:
+            if pin.state or pin.pending:
+                return self.active_interval
+        return self.idle_interval
+
+    def poll(self, now, interval):
+        pressed, released = [], []
+        for pin in self.pins:
+            if pin.update(pin.sensor.read(), now, interval):
+                (pressed if pin.state else released).append(pin)
+        if not pressed and not released:
+            return
+        self._last_edge = now
+        if self.flag in pressed:
+            self._post('flag_plate_touch', None, [self.flag])
+        elif self.flag in released:
+            self._post('flag_plate_release', None, [self.flag])
+        bumped = [p for p in pressed if p is not self.flag]
+        if self.flag.state and self.bumps[2] in bumped:
+            # The flag pushes on the middle switch when we are carrying it
+            bumped.remove(self.bumps[2])
+            self._suppressed.add(self.bumps[2])
+        if bumped:
+            self._post('bump', [p.sensor for p in bumped], bumped)
+        unbumped = [p for p in released if p is not self.flag and
+                    p not in self._suppressed]
+        self._suppressed.difference_update(released)
+        if unbumped:
+            self._post('bump_release', [p.sensor for p in unbumped], unbumped)
+
+    def _post(self, channel, payload, pins):
+        changed = min(p.changed_at for p in pins)
+        with self._changed_lock:
+            # Posts an async channel coalesces count from the first change
+            self._changed.setdefault(channel, changed)
+        EventBus.GLOBAL.post(channel, payload)
+
+    def _handled(self, channel, *payload):
+        # Registered before the game's handlers, so this runs as handling
+        # starts, on whichever thread dispatches the channel
+        with self._changed_lock:
+            changed = self._changed.pop(channel, None)
+        if changed is not None:
+            self.latency[channel].add(Clock.GLOBAL.time() - changed)
 
     def run(self):
-        while True:
-            got_flag = False
-            bumped_sensors = []
-            for sensor in self.sensors:
-                if sensor.read():
-                    if sensor == self.bot.flag_sens:
-                        got_flag = True
-                        EventBus.GLOBAL.post('flag_plate_touch')
-                    else:
-                        if sensor == self.bot.bump['front']['middle'] and got_flag:
-                            continue
-                        else:
-                            bumped_sensors.append(sensor)
-            if len(bumped_sensors) != 0:
-                EventBus.GLOBAL.post('bump', bumped_sensors)
-            time.sleep(0.2)
+        clock = Clock.GLOBAL
+        last = clock.time()
+        try:
+            while self.can_run():
+                now = clock.time()
+                self.poll(now, now - last)
+                last = now
+                clock.sleep(self.get_interval(now) - (clock.time() - now))
+        finally:
+            for channel, handler in self._handlers:
+                EventBus.GLOBAL.unregister(channel, handler)
+        for channel, stat in sorted(self.latency.items()):
+            self.log.info("Reaction latency for %s: %s", channel, stat)
@@ -0,0 +1,138 @@
+"""
+    This file is part of Team BRK '404 (Robot Not Found)', licensed under the
+    MIT License. A copy of the MIT License can be found in LICENSE.txt
+"""
+
+# Records what every thread was doing and when, as spans with a begin and
+# an end, and writes them out in the Chrome trace event format. Open the file
+# in chrome://tracing or https://ui.perfetto.dev to see a match's timeline.
+
+import collections
+import functools
+import json
+import os
+import threading
+
+from clock import Clock
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span(object):
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = Clock.GLOBAL.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args['exception'] = exc_type.__name__
+        self.tracer.add(self.name, self.category, self.start,
+                        Clock.GLOBAL.monotonic(), self.args)
+        return False
+
+class Tracer(object):
+    """Collects spans while enabled, the oldest are dropped once max_events
+    have been kept. Disabled, span() costs a single attribute check."""
+
+    GLOBAL = None
+
+    def __init__(self, max_events=200000):
+        self.enabled = False
+        self.path = None
+        self.origin = None
+        self._events = collections.deque(maxlen=max_events)
+        self._threads = {}
+
+    def enable(self, path=None):
+        """Starts recording. If path is given, flush() writes the trace
+        there."""
+        self.path = path
+        if self.origin is None:
+            self.origin = Clock.GLOBAL.monotonic()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self._events.clear()
+        self._threads.clear()
+        self.origin = Clock.GLOBAL.monotonic()
+
+    def span(self, name, category, **args):
+        """A context manager timing its body as one span on the current
+        thread."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category, args)
+
+    def instant(self, name, category, **args):
+        """Marks a moment, like an interrupt, on the current thread."""
+        if self.enabled:
+            now = Clock.GLOBAL.monotonic()
+            self.add(name, category, now, None, args)
+
+    def add(self, name, category, start, end, args=None):
+        thread = threading.current_thread()
+        self._threads[thread.ident] = thread.name
+        self._events.append((name, category, thread.ident, start, end,
+                             args or {}))
+
+    def events(self):
+        """The trace as a list of Chrome trace event dicts."""
+        origin = self.origin or 0
+        pid = os.getpid()
+        events = [{
+            'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+            'args': {'name': name}
+        } for tid, name in self._threads.items()]
+        for name, category, tid, start, end, args in list(self._events):
+            event = {
+                'name': name, 'cat': category, 'pid': pid, 'tid': tid,
+                'ts': (start - origin) * 1e6, 'args': args
+            }
+            if end is None:
+                event.update(ph='i', s='t')
+            else:
+                event.update(ph='X', dur=(end - start) * 1e6)
+            events.append(event)
+        return events
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.events(),
+                       'displayTimeUnit': 'ms'}, f)
+
+    def flush(self):
+        """Writes the trace to the path given to enable, if any."""
+        if self.path is not None:
+            self.dump(self.path)
+
+def traced(category, name=None):
+    """Decorates a function so every call is a span, named after the
+    function unless name is given."""
+    def decorator(func):
+        span_name = name or func.__name__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = Tracer.GLOBAL
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+Tracer.GLOBAL = Tracer()